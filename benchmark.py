@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+性能基准测试 - 测量章节处理各环节的单线程CPU开销
+
+多线程下载时这部分CPU时间受GIL限制，直接决定了吞吐上限。
+
+用法:
+    python benchmark.py parse                        # 使用合成的阅读页
+    python benchmark.py parse --pages saved_pages/   # 使用保存的真实阅读页(*.html)
+    python benchmark.py extract                      # 正文提取: 正文容器定向提取 对比 整页XPath
+    python benchmark.py decode                       # 字体解码: 映射表translate 对比 逐字符拼接
+    python benchmark.py compress --bookstore src/bookstore  # 章节存储压缩: zlib / zstd / zstd+训练字典
+"""
+
+import sys
+import os
+import glob
+import json
+import time
+import random
+import argparse
+import requests as req
+from lxml import etree
+sys.path.append('src')
+
+from importlib import import_module
+main_module = import_module('main')
+NovelDownloader = main_module.NovelDownloader
+Config = main_module.Config
+
+# 字体映射使用的私有区字符范围 (与NovelDownloader.CODE一致)
+PUA_START, PUA_END = 58344, 58715
+
+
+def make_reader_page(paragraphs: int = 60, paragraph_length: int = 80, padding_kb: int = 40,
+                     seed: int = 0) -> bytes:
+    """生成与真实阅读页结构相同的合成页面
+
+    正文段落混合私有区字符、常用汉字和标点；页面头部带有与真实页面体积相近的内联脚本，
+    响应不声明charset，和番茄返回的页面一样需要解析方自行确定编码。
+    """
+    rng = random.Random(seed)
+    common = '的一是了我不人在他有这个上们来到时大地为子中你说生国年着就那和要她出也得里后自以会'
+    punctuation = '，。！？：“”'
+
+    def paragraph() -> str:
+        chars = []
+        for _ in range(paragraph_length):
+            roll = rng.random()
+            if roll < 0.45:
+                chars.append(chr(rng.randint(PUA_START, PUA_END)))
+            elif roll < 0.9:
+                chars.append(rng.choice(common))
+            else:
+                chars.append(rng.choice(punctuation))
+        return ''.join(chars)
+
+    body = ''.join(f'<p>{paragraph()}</p>' for _ in range(paragraphs))
+    state = 'window.__INITIAL_STATE__=' + '{"k":"' + 'x' * (padding_kb * 1024) + '"};'
+    html = (
+        '<!DOCTYPE html><html><head><meta charset="utf-8"><title>第1章</title>'
+        f'<script>{state}</script></head><body>'
+        '<div class="muye-header"><a href="/">番茄小说</a></div>'
+        '<div class="muye-reader"><h1 class="muye-reader-title">第1章 标题</h1>'
+        f'<div class="muye-reader-content noselect"><div>{body}</div></div></div>'
+        '<div class="muye-footer"><a href="/next">下一章</a></div></body></html>'
+    )
+    return html.encode('utf-8')
+
+
+def load_pages(pages_dir: str = None, count: int = 20) -> list:
+    """读取保存的阅读页(*.html, 原始字节)，未指定目录时生成合成页面"""
+    if pages_dir:
+        paths = sorted(glob.glob(os.path.join(pages_dir, '*.html')))
+        if not paths:
+            raise SystemExit(f'❌ 目录中没有 .html 文件: {pages_dir}')
+        pages = []
+        for path in paths:
+            with open(path, 'rb') as f:
+                pages.append(f.read())
+        return pages
+    return [make_reader_page(seed=i) for i in range(count)]
+
+
+def make_response(body: bytes, content_type: str = 'text/html') -> req.Response:
+    """构造与网络请求返回值相同的requests.Response"""
+    response = req.models.Response()
+    response._content = body
+    response.status_code = 200
+    response.headers['Content-Type'] = content_type
+    response.encoding = req.utils.get_encoding_from_headers(response.headers)
+    return response
+
+
+def create_downloader() -> NovelDownloader:
+    # 默认配置下调试日志关闭，只测量解析本身
+    return NovelDownloader(Config(), log_callback=lambda *args: None)
+
+
+def measure(func, pages: list, rounds: int) -> float:
+    """返回每页平均耗时(微秒)"""
+    for page in pages[:3]:
+        func(page)  # 预热
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for page in pages:
+            func(page)
+    return (time.perf_counter() - start) / (rounds * len(pages)) * 1e6
+
+
+def bench_parse(args):
+    """阅读页解析: response.text(编码探测) + str解析  对比  原始字节 + UTF-8解析器"""
+    pages = load_pages(args.pages, args.count)
+    downloader = create_downloader()
+    xpath = main_module.READER_CONTENT_XPATH
+    average_kb = sum(len(page) for page in pages) / len(pages) / 1024
+    print(f"📄 页面: {len(pages)} 个，平均 {average_kb:.1f} KB，每个重复 {args.rounds} 轮")
+
+    def text_sniffed(page):
+        # 响应头没有给出编码时，requests用apparent_encoding探测整个响应体
+        response = make_response(page)
+        response.encoding = None
+        return '\n'.join(etree.HTML(response.text).xpath(xpath))
+
+    def text_declared(page):
+        response = make_response(page, 'text/html; charset=utf-8')
+        return '\n'.join(etree.HTML(response.text).xpath(xpath))
+
+    def raw_bytes(page):
+        return downloader._extract_reader_content(make_response(page).content)
+
+    assert raw_bytes(pages[0]) == text_declared(pages[0]), '解析结果不一致'
+    sniffed = make_response(pages[0]).apparent_encoding
+    mismatched = sum(1 for page in pages if text_sniffed(page) != raw_bytes(page))
+    if mismatched:
+        print(f"⚠️ 编码探测结果为 {sniffed}，{mismatched}/{len(pages)} 个页面的正文被错误解码")
+
+    results = [
+        ('response.text (编码探测)', measure(text_sniffed, pages, args.rounds)),
+        ('response.text (声明utf-8)', measure(text_declared, pages, args.rounds)),
+        ('response.content + UTF-8解析器', measure(raw_bytes, pages, args.rounds)),
+    ]
+    print('-' * 60)
+    for name, micros in results:
+        print(f"{name:<32} {micros:>10.1f} µs/章")
+    print('-' * 60)
+    saved = results[0][1] - results[-1][1]
+    print(f"✅ 每章节省 {saved:.1f} µs CPU ({saved / results[0][1]:.0%})，"
+          f"单核解析上限约 {1e6 / results[-1][1]:.0f} 章/秒")
+
+
+def bench_extract(args):
+    """正文提取: 整页建树 + XPath  对比  只解析正文容器的定向提取"""
+    pages = load_pages(args.pages, args.count)
+    xpath = main_module.READER_CONTENT_XPATH
+    print(f"📄 页面: {len(pages)} 个，每个重复 {args.rounds} 轮")
+
+    def full_xpath(page):
+        return '\n'.join(etree.HTML(page, parser=main_module.utf8_html_parser()).xpath(xpath))
+
+    def targeted(page):
+        return '\n'.join(main_module.extract_reader_paragraphs(page))
+
+    for index, page in enumerate(pages):
+        try:
+            assert targeted(page) == full_xpath(page), f'第{index + 1}个页面的提取结果不一致'
+        except ValueError:
+            raise SystemExit(f'❌ 第{index + 1}个页面找不到正文容器，运行时会回退到XPath')
+
+    results = [
+        ('整页解析 + XPath', measure(full_xpath, pages, args.rounds)),
+        ('正文容器定向提取', measure(targeted, pages, args.rounds)),
+    ]
+    print('-' * 60)
+    for name, micros in results:
+        print(f"{name:<32} {micros:>10.1f} µs/章")
+    print('-' * 60)
+    saved = results[0][1] - results[1][1]
+    print(f"✅ {len(pages)} 个页面提取结果一致，每章节省 {saved:.1f} µs CPU ({saved / results[0][1]:.0%})")
+
+
+def legacy_decode(charset: list, code: list, content: str, mode: int) -> str:
+    """改用映射表之前的逐字符解码实现，作为结果一致性的参照"""
+    result = ''
+    for char in content:
+        uni = ord(char)
+        if code[mode][0] <= uni <= code[mode][1]:
+            bias = uni - code[mode][0]
+            if 0 <= bias < len(charset[mode]) and charset[mode][bias] != '?':
+                result += charset[mode][bias]
+            else:
+                result += char
+        else:
+            result += char
+    return result
+
+
+def make_chapter_text(seed: int, length: int = 3000) -> str:
+    """生成网文风格的合成章节：人名、套话和标点反复出现，与真实书库的冗余程度相近"""
+    rng = random.Random(seed)
+    names = ['林凡', '苏婉儿', '叶辰', '王长老', '赵天', '萧炎', '老者']
+    phrases = ['深吸一口气', '冷笑一声', '脸色大变', '缓缓开口', '眼中闪过一丝寒芒', '体内灵气运转',
+               '修为突破到了', '筑基境', '金丹期', '宗门大比', '就在这时', '只见一道身影', '众人顿时哗然',
+               '心中暗道', '不由得一愣', '嘴角微微上扬', '一股恐怖的气息', '从远处传来', '所有人都看向了']
+    parts = []
+    while sum(len(part) for part in parts) < length:
+        roll = rng.random()
+        if roll < 0.3:
+            parts.append(f'“{rng.choice(phrases)}，{rng.choice(names)}！”{rng.choice(names)}说道。')
+        elif roll < 0.9:
+            parts.append(f'{rng.choice(names)}{rng.choice(phrases)}，{rng.choice(phrases)}。')
+        else:
+            parts.append('\n')
+    return ''.join(parts)
+
+
+def load_chapters(bookstore: str = None, count: int = 300) -> list:
+    """读取书库中的章节正文（章节存储和导出的JSON），未指定目录时生成合成章节"""
+    if not bookstore:
+        return [make_chapter_text(i) for i in range(count)]
+    codec = main_module.ChapterCodec(dictionary_dir=os.path.join(bookstore, 'dictionaries'))
+    chapters = []
+    for log_path in sorted(glob.glob(os.path.join(bookstore, '*', main_module.ChapterStore.LOG_NAME))):
+        chapters.extend(main_module.ChapterStore(os.path.dirname(log_path), codec).chapters().values())
+    if not chapters:
+        for path in sorted(glob.glob(os.path.join(bookstore, '**', '*.json'), recursive=True)):
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            chapters.extend(content for title, content in data.items()
+                            if title != '_metadata' and isinstance(content, str))
+    chapters = [chapter for chapter in chapters if chapter]
+    if len(chapters) < 20:
+        raise SystemExit(f'❌ 书库中只有 {len(chapters)} 个章节，至少需要20个才能训练和评估字典')
+    return chapters
+
+
+def bench_compress(args):
+    """章节存储压缩: zlib 对比 zstd 对比 zstd+本地训练的字典，报告压缩率、压缩吞吐和单章解压延迟"""
+    chapters = load_chapters(args.bookstore, args.count)
+    # 每5章留出1章评估，字典不会见过评估用的章节
+    evaluate = chapters[::5]
+    train = [chapter for index, chapter in enumerate(chapters) if index % 5]
+    raw_bytes = sum(len(chapter.encode('utf-8')) for chapter in evaluate)
+    source = args.bookstore or '合成章节'
+    print(f"📚 语料: {source}，{len(chapters)} 章 (训练 {len(train)} / 评估 {len(evaluate)})，"
+          f"评估集平均 {raw_bytes / len(evaluate) / 1024:.1f} KB/章，重复 {args.rounds} 轮")
+
+    codecs = [(f'zlib -{level}', main_module.ChapterCodec('zlib', level)) for level in (1, 6, 9)]
+    if main_module.zstandard is None:
+        print('⚠️ 未安装zstandard，只测量zlib (pip install zstandard)')
+    else:
+        levels = [int(level) for level in args.levels.split(',')]
+        trainer = main_module.ChapterCodec('zstd', auto_train=False)
+        start = time.perf_counter()
+        if trainer.train([chapter.encode('utf-8') for chapter in train]) is None:
+            raise SystemExit('❌ 训练字典失败，训练章节太少')
+        print(f"🗜️ 字典训练: {len(trainer.dictionary.as_bytes()) / 1024:.0f} KB，"
+              f"耗时 {time.perf_counter() - start:.2f} 秒")
+        for level in levels:
+            codecs.append((f'zstd -{level}', main_module.ChapterCodec('zstd', level, auto_train=False)))
+        for level in levels:
+            codec = main_module.ChapterCodec('zstd', level, auto_train=False)
+            codec.use_dictionary(trainer.dictionary)
+            codecs.append((f'zstd -{level} +字典', codec))
+
+    print('-' * 72)
+    print(f"{'编码':<20} {'压缩率':>8} {'压缩 MB/s':>12} {'解压 µs/章':>12} {'平均 KB/章':>12}")
+    for name, codec in codecs:
+        encoded = [codec.encode(chapter) for chapter in evaluate]
+        for chapter, (encoding, dict_id, payload) in zip(evaluate, encoded):
+            assert codec.decode(encoding, dict_id, payload) == chapter, f'{name} 解压结果不一致'
+        stored = sum(len(payload) for _, _, payload in encoded)
+        compress_micros = measure(codec.encode, evaluate, args.rounds)
+        decompress_micros = measure(lambda record: codec.decode(*record), encoded, args.rounds)
+        throughput = raw_bytes / len(evaluate) / compress_micros
+        print(f"{name:<20} {raw_bytes / stored:>8.2f}x {throughput:>12.1f} {decompress_micros:>12.1f} "
+              f"{stored / len(evaluate) / 1024:>12.2f}")
+    print('-' * 72)
+    print(f"✅ 所有编码的 {len(evaluate)} 个评估章节往返一致；"
+          f"在 config.yaml 的 file_management.chapter_compression / compression_level 中选择")
+
+
+def bench_decode(args):
+    """字体解码: 逐字符拼接  对比  预编译映射表 + str.translate(含模式检测)"""
+    downloader = create_downloader()
+    charset, code = downloader.charset, downloader.CODE
+    contents = ['\n'.join(main_module.extract_reader_paragraphs(page)) for page in load_pages(args.pages, args.count)]
+    average_chars = sum(len(content) for content in contents) / len(contents)
+    print(f"📄 正文: {len(contents)} 章，平均 {average_chars:.0f} 字符，每章重复 {args.rounds} 轮")
+
+    for index, content in enumerate(contents):
+        for mode in (0, 1):
+            assert downloader._decode_content(content, mode) == legacy_decode(charset, code, content, mode), \
+                f'第{index + 1}章模式{mode}的解码结果不一致'
+        detected = downloader.decoder.detect_mode(content)
+        assert downloader._decode_content(content) == legacy_decode(charset, code, content, detected)
+
+    results = [
+        ('逐字符拼接', measure(lambda content: legacy_decode(charset, code, content, 0), contents, args.rounds)),
+        ('映射表translate + 模式检测', measure(downloader._decode_content, contents, args.rounds)),
+    ]
+    print('-' * 60)
+    for name, micros in results:
+        print(f"{name:<32} {micros:>10.1f} µs/章")
+    print('-' * 60)
+    print(f"✅ {len(contents)} 章两种模式的解码结果逐字一致，解码提速 {results[0][1] / results[1][1]:.1f} 倍")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='番茄小说下载器性能基准测试')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    parse_parser = subparsers.add_parser('parse', help='阅读页解析开销')
+    parse_parser.add_argument('--pages', help='保存的阅读页目录(*.html)，默认使用合成页面')
+    parse_parser.add_argument('--count', type=int, default=20, help='合成页面数量')
+    parse_parser.add_argument('--rounds', type=int, default=20, help='重复轮数')
+    parse_parser.set_defaults(func=bench_parse)
+
+    extract_parser = subparsers.add_parser('extract', help='正文提取开销')
+    extract_parser.add_argument('--pages', help='保存的阅读页目录(*.html)，默认使用合成页面')
+    extract_parser.add_argument('--count', type=int, default=20, help='合成页面数量')
+    extract_parser.add_argument('--rounds', type=int, default=20, help='重复轮数')
+    extract_parser.set_defaults(func=bench_extract)
+
+    decode_parser = subparsers.add_parser('decode', help='字体解码开销')
+    decode_parser.add_argument('--pages', help='保存的阅读页目录(*.html)，默认使用合成页面')
+    decode_parser.add_argument('--count', type=int, default=20, help='合成页面数量')
+    decode_parser.add_argument('--rounds', type=int, default=20, help='重复轮数')
+    decode_parser.set_defaults(func=bench_decode)
+
+    compress_parser = subparsers.add_parser('compress', help='章节存储压缩率和速度')
+    compress_parser.add_argument('--bookstore', help='书库目录(章节存储或JSON)，默认使用合成章节')
+    compress_parser.add_argument('--count', type=int, default=300, help='合成章节数量')
+    compress_parser.add_argument('--levels', default='1,3,9,19', help='要比较的zstd级别，逗号分隔')
+    compress_parser.add_argument('--rounds', type=int, default=5, help='重复轮数')
+    compress_parser.set_defaults(func=bench_compress)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地模拟服务器 - 离线复现番茄小说的目录页、阅读页和备用API
+
+页面结构与真实站点一致：正文混有字体映射使用的私有区字符，下载时会完整经过解析、解码和导出，
+但不访问网络，同一参数下每次生成的内容相同，适合稳定地对比性能。
+
+用法:
+    python mock_server.py                              # 监听 127.0.0.1:8000，每本书200章
+    python mock_server.py --chapters 1000 --latency 20 # 1000章，每个请求延迟20ms
+
+然后在配置文件中设置:
+    network:
+      base_url: "http://127.0.0.1:8000"
+
+任意小说ID都可以下载，例如:
+    python src/main.py --config mock.yaml --id 1 --profile-threads
+"""
+
+import json
+import random
+import struct
+import time
+import zlib
+import argparse
+import functools
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+# 字体映射使用的私有区字符范围 (与NovelDownloader.CODE一致)
+PUA_START, PUA_END = 58344, 58715
+COMMON = '的一是了我不人在他有这个上们来到时大地为子中你说生国年着就那和要她出也得里后自以会'
+PUNCTUATION = '，。！？：“”'
+
+
+def make_png() -> bytes:
+    """1x1像素的PNG，作为封面"""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', 1, 1, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(b'\x00\xff\xff\xff')) + chunk(b'IEND', b''))
+
+
+class MockSite:
+    """按小说ID和章节ID确定性地生成页面"""
+
+    def __init__(self, chapters: int, paragraphs: int, paragraph_length: int, seed: int):
+        self.chapters = chapters
+        self.paragraphs = paragraphs
+        self.paragraph_length = paragraph_length
+        self.seed = seed
+
+    def chapter_ids(self, novel_id: str) -> list:
+        base = zlib.crc32(f'{self.seed}-{novel_id}'.encode()) * 10 ** 6
+        return [str(base + i) for i in range(self.chapters)]
+
+    def book_page(self, novel_id: str, origin: str) -> bytes:
+        links = ''.join(f'<a href="/reader/{chapter_id}">第{i + 1}章 模拟章节{i + 1}</a>'
+                        for i, chapter_id in enumerate(self.chapter_ids(novel_id)))
+        ld_json = json.dumps({'author': [{'name': '模拟作者'}], 'image': [f'{origin}/cover.png']},
+                             ensure_ascii=False)
+        html = (
+            f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>模拟小说{novel_id}</title>'
+            f'<script type="application/ld+json">{ld_json}</script></head><body>'
+            f'<div class="page-header-info"><h1>模拟小说{novel_id}</h1>'
+            '<span class="info-label-yellow">连载中</span></div>'
+            f'<div class="chapter"><div>{links}</div></div></body></html>'
+        )
+        return html.encode('utf-8')
+
+    @functools.lru_cache(maxsize=4096)
+    def paragraphs_of(self, chapter_id: str) -> tuple:
+        rng = random.Random(f'{self.seed}-{chapter_id}')
+
+        def paragraph() -> str:
+            chars = []
+            for _ in range(self.paragraph_length):
+                roll = rng.random()
+                if roll < 0.45:
+                    chars.append(chr(rng.randint(PUA_START, PUA_END)))
+                elif roll < 0.9:
+                    chars.append(rng.choice(COMMON))
+                else:
+                    chars.append(rng.choice(PUNCTUATION))
+            return ''.join(chars)
+
+        return tuple(paragraph() for _ in range(self.paragraphs))
+
+    def reader_page(self, chapter_id: str) -> bytes:
+        body = ''.join(f'<p>{text}</p>' for text in self.paragraphs_of(chapter_id))
+        # 头部带有与真实页面体积相近的内联脚本
+        state = 'window.__INITIAL_STATE__=' + '{"k":"' + 'x' * 40 * 1024 + '"};'
+        html = (
+            '<!DOCTYPE html><html><head><meta charset="utf-8"><title>模拟章节</title>'
+            f'<script>{state}</script></head><body>'
+            '<div class="muye-reader"><h1 class="muye-reader-title">模拟章节</h1>'
+            f'<div class="muye-reader-content noselect"><div>{body}</div></div></div></body></html>'
+        )
+        return html.encode('utf-8')
+
+    def full_api(self, chapter_id: str) -> bytes:
+        content = ''.join(f'<p>{text}</p>' for text in self.paragraphs_of(chapter_id))
+        return json.dumps({'code': 0, 'data': {'chapterData': {'content': content}}},
+                          ensure_ascii=False).encode('utf-8')
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive，和真实站点一样复用连接
+    site: MockSite = None
+    latency = 0.0
+    cover = make_png()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = url.path.strip('/').split('/')
+        if self.latency:
+            time.sleep(self.latency)
+
+        if len(parts) == 2 and parts[0] == 'page':
+            origin = f'http://{self.server.server_address[0]}:{self.server.server_address[1]}'
+            self._send(self.site.book_page(parts[1], origin), 'text/html; charset=utf-8')
+        elif len(parts) == 2 and parts[0] == 'reader':
+            # 和真实阅读页一样不声明charset
+            self._send(self.site.reader_page(parts[1]), 'text/html')
+        elif url.path == '/api/reader/full':
+            item_id = parse_qs(url.query).get('itemId', [''])[0]
+            self._send(self.site.full_api(item_id), 'application/json')
+        elif url.path == '/cover.png':
+            self._send(self.cover, 'image/png')
+        else:
+            self._send(b'', 'text/plain', status=404)
+
+    def _send(self, body: bytes, content_type: str, status: int = 200):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='番茄小说本地模拟服务器')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--chapters', type=int, default=200, help='每本书的章节数')
+    parser.add_argument('--paragraphs', type=int, default=60, help='每章段落数')
+    parser.add_argument('--paragraph-length', type=int, default=80, help='每段字数')
+    parser.add_argument('--latency', type=float, default=0, help='每个请求的延迟(毫秒)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    MockHandler.site = MockSite(args.chapters, args.paragraphs, args.paragraph_length, args.seed)
+    MockHandler.latency = args.latency / 1000
+    server = ThreadingHTTPServer((args.host, args.port), MockHandler)
+    server.daemon_threads = True
+    print(f'🧪 模拟服务器: http://{args.host}:{args.port}  ({args.chapters} 章/本)')
+    print(f'   配置 network.base_url: "http://{args.host}:{args.port}" 后即可离线下载任意小说ID')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
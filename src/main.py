@@ -8,20 +8,48 @@ import requests as req
 from lxml import etree
 from ebooklib import epub
 from tqdm import tqdm
-from bs4 import BeautifulSoup
 import json
 import yaml  # 添加YAML支持
 import time
 import random
 import re  # 添加正则表达式模块
 import os
+import sys
 import platform
 import shutil
+import sqlite3
+import threading
+import queue
+import asyncio
+import heapq
+import itertools
+import collections
 import concurrent.futures
+import cProfile
+import pstats
 import argparse  # 添加命令行参数解析
+import atexit
+import weakref
+import contextlib
+import functools
+import gzip
+import zlib
+import logging.handlers
 from typing import Callable, Optional, Dict, List, Union
+from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
 from enum import Enum
+from urllib.parse import urlparse
+
+try:
+    import aiohttp  # 可选依赖：仅异步下载引擎需要
+except ImportError:
+    aiohttp = None
+
+try:
+    import zstandard  # 可选依赖：章节存储的zstd压缩需要
+except ImportError:
+    zstandard = None
 
 
 class SaveMode(Enum):
@@ -49,9 +77,22 @@ class Config:
     thread_count: int = 8
     delay_mode: str = "normal"
     custom_delay: List[int] = field(default_factory=lambda: [150, 300])
+    min_thread_count: int = 1           # 自适应并发的下限
+    max_thread_count: int = 0           # 自适应并发的上限，0表示等于thread_count
+    rate_limit: float = 0               # 全局请求速率(次/秒)，0表示根据delay_mode自动计算
+    rate_burst: int = 0                 # 允许的突发请求数，0表示等于线程数
+    rate_jitter: float = 0.5            # 请求间隔的随机抖动幅度(0-1)，模拟真实阅读节奏
+    download_engine: str = "thread"     # "thread": 线程池  "async": asyncio引擎(需要aiohttp)
+    async_concurrency: int = 200        # 异步引擎的最大在途请求数
     
     # 文件管理
     delete_chapters_after_merge: bool = False
+    incremental_update: bool = True     # 已下载过的小说只请求新增章节和失败占位章节
+    chapter_compression: str = "none"   # 章节存储的压缩编码: "none" | "zlib" | "zstd"(需要zstandard)
+    compression_level: int = 0          # 压缩级别，0表示编码的默认级别(zlib 6, zstd 3)
+    export_json: Union[bool, str] = "auto"  # 书库中的明文JSON: "auto"(不压缩时导出) | true | false
+    chapter_cache_file: str = "data/chapter_cache.db"  # 跨任务共用的章节缓存(SQLite)
+    chapter_cache_mb: int = 512         # 章节缓存的大小上限(MB)，超出时淘汰最久未用的章节，0表示不缓存
     conflict_resolution: str = "rename"
     encoding: str = "UTF-8"
     preserve_original_order: bool = False
@@ -61,6 +102,7 @@ class Config:
     manual_cookie: str = ""
     cookie_file: str = "data/cookie.json"
     validate_cookie: bool = False
+    cookie_pool_size: int = 4           # Cookie池中保持的可用Cookie数量
     
     # 内容处理
     paragraph_spacing: int = 0
@@ -69,15 +111,26 @@ class Config:
     filter_special_chars: bool = False
     
     # 网络配置
-    timeout: int = 30
+    timeout: int = 30                   # 读取超时(秒)
+    connect_timeout: int = 10           # 连接超时(秒)
+    book_page_ttl: int = 600            # 小说详情页缓存时间(秒)
+    hedge_ratio: float = 0.1            # 对冲请求占主请求的最大比例，0表示关闭
+    hedge_delay: float = 0              # 发出对冲请求前的等待(秒)，0表示使用学习到的p90延迟
     retry_count: int = 3
     retry_delays: List[int] = field(default_factory=lambda: [1, 2, 4])  # 重试间隔(秒)
     rotate_user_agent: bool = True
+    base_url: str = "https://fanqienovel.com"  # 站点地址，指向本地模拟服务器(mock_server.py)可离线测试和性能分析
     
     # 日志配置
     log_level: str = "normal"
     save_log_to_file: bool = False
     log_file: str = "logs/download.log"
+    trace_file: str = ""                                  # 阶段追踪span的JSONL文件，为空时不追踪
+    failure_log_file: str = "logs/failed_responses.log"  # 失败章节的原始响应，为空时不写入
+    failure_log_max_mb: float = 5                         # 失败日志超过此大小时轮转并gzip压缩
+    failure_log_backups: int = 3                          # 保留的压缩日志数量
+    failure_log_sample_rate: float = 0.2                  # 写入失败日志的失败章节比例
+    response_capture_size: int = 64                       # 内存中保留最近多少个章节的失败响应
     
     # 高级选项
     enable_experimental: bool = False
@@ -141,11 +194,24 @@ class Config:
                 config.thread_count = perf.get('thread_count', 8)
                 config.delay_mode = perf.get('delay_mode', "normal")
                 config.custom_delay = perf.get('custom_delay', [150, 300])
+                config.min_thread_count = perf.get('min_thread_count', 1)
+                config.max_thread_count = perf.get('max_thread_count', 0)
+                config.rate_limit = perf.get('rate_limit', 0)
+                config.rate_burst = perf.get('rate_burst', 0)
+                config.rate_jitter = perf.get('rate_jitter', 0.5)
+                config.download_engine = perf.get('engine', "thread")
+                config.async_concurrency = perf.get('async_concurrency', 200)
             
             # 文件管理配置
             if 'file_management' in data:
                 fm = data['file_management']
                 config.delete_chapters_after_merge = fm.get('delete_chapters_after_merge', False)
+                config.incremental_update = fm.get('incremental_update', True)
+                config.chapter_compression = fm.get('chapter_compression', "none")
+                config.compression_level = fm.get('compression_level', 0)
+                config.export_json = fm.get('export_json', "auto")
+                config.chapter_cache_file = fm.get('chapter_cache_file', "data/chapter_cache.db")
+                config.chapter_cache_mb = fm.get('chapter_cache_mb', 512)
                 config.conflict_resolution = fm.get('conflict_resolution', "rename")
                 config.encoding = fm.get('encoding', "UTF-8")
                 config.preserve_original_order = fm.get('preserve_original_order', False)
@@ -157,6 +223,7 @@ class Config:
                 config.manual_cookie = auth.get('manual_cookie', "")
                 config.cookie_file = auth.get('cookie_file', "data/cookie.json")
                 config.validate_cookie = auth.get('validate_cookie', False)
+                config.cookie_pool_size = auth.get('cookie_pool_size', 4)
             
             # 内容处理配置
             if 'content' in data:
@@ -170,9 +237,14 @@ class Config:
             if 'network' in data:
                 net = data['network']
                 config.timeout = net.get('timeout', 30)
+                config.connect_timeout = net.get('connect_timeout', 10)
+                config.book_page_ttl = net.get('book_page_ttl', 600)
+                config.hedge_ratio = net.get('hedge_ratio', 0.1)
+                config.hedge_delay = net.get('hedge_delay', 0)
                 config.retry_count = net.get('retry_count', 3)
                 config.retry_delays = net.get('retry_delays', [1, 2, 4])
                 config.rotate_user_agent = net.get('rotate_user_agent', True)
+                config.base_url = net.get('base_url', "https://fanqienovel.com").rstrip('/')
             
             # 日志配置
             if 'logging' in data:
@@ -180,6 +252,12 @@ class Config:
                 config.log_level = log.get('level', "normal")
                 config.save_log_to_file = log.get('save_to_file', False)
                 config.log_file = log.get('log_file', "logs/download.log")
+                config.trace_file = log.get('trace_file', "")
+                config.failure_log_file = log.get('failure_log_file', "logs/failed_responses.log")
+                config.failure_log_max_mb = log.get('failure_log_max_mb', 5)
+                config.failure_log_backups = log.get('failure_log_backups', 3)
+                config.failure_log_sample_rate = log.get('failure_log_sample_rate', 0.2)
+                config.response_capture_size = log.get('response_capture_size', 64)
             
             # 高级配置
             if 'advanced' in data:
@@ -200,6 +278,2367 @@ class Config:
         return self.delay
 
 
+_parser_local = threading.local()
+
+
+def utf8_html_parser() -> etree.HTMLParser:
+    """当前线程的UTF-8 HTML解析器
+
+    番茄的页面都是UTF-8编码，直接把响应字节交给指定编码的解析器，
+    省去requests按内容猜测编码(apparent_encoding)和先解码成str的开销。
+    lxml解析器不能被多个线程同时使用，因此每个线程各持有一个。
+    """
+    parser = getattr(_parser_local, 'parser', None)
+    if parser is None:
+        parser = _parser_local.parser = etree.HTMLParser(encoding='utf-8')
+    return parser
+
+
+READER_CONTENT_XPATH = '//div[@class="muye-reader-content noselect"]//p/text()'
+_READER_CONTENT_MARKER = b'class="muye-reader-content noselect"'
+_DIV_TAG_PATTERN = re.compile(rb'<(/?)div\b', re.IGNORECASE)
+
+
+def _reader_content_fragment(body: bytes) -> Optional[bytes]:
+    """从阅读页字节中切出唯一的正文容器 <div class="muye-reader-content noselect">...</div>
+
+    找不到容器、容器未闭合或出现多个容器时返回None，由调用方回退到完整解析。
+    切分点都在ASCII的 '<' / '>' 上，不会截断UTF-8多字节字符。
+    """
+    marker = body.find(_READER_CONTENT_MARKER)
+    if marker < 0:
+        return None
+    start = body.rfind(b'<', 0, marker)
+    if start < 0 or body[start:start + 4].lower() != b'<div' or b'>' in body[start:marker]:
+        return None
+    depth = 0
+    for match in _DIV_TAG_PATTERN.finditer(body, start):
+        depth += -1 if match.group(1) else 1
+        if depth == 0:
+            end = body.find(b'>', match.end())
+            if end < 0 or body.find(_READER_CONTENT_MARKER, end) >= 0:
+                return None
+            return body[start:end + 1]
+    return None  # 页面被截断，容器没有闭合
+
+
+def extract_reader_paragraphs(body: bytes) -> List[str]:
+    """提取阅读页正文 <p> 的直接文本节点，结果与 READER_CONTENT_XPATH 一致
+
+    先按字节定位并切出正文容器，只把容器交给当前线程的UTF-8解析器，
+    不为整页（内联脚本、页头页脚）建树；再用预编译、不生成smart string的XPath取文本。
+    找不到可用的正文容器时抛出ValueError。
+    """
+    fragment = _reader_content_fragment(body)
+    if fragment is None:
+        raise ValueError('reader content container not found')
+    paragraphs = getattr(_parser_local, 'paragraph_xpath', None)
+    if paragraphs is None:
+        paragraphs = _parser_local.paragraph_xpath = etree.XPath('//p/text()', smart_strings=False)
+    return paragraphs(etree.HTML(fragment, parser=utf8_html_parser()))
+
+
+class StrippedText(str):
+    """由后备HTML处理得到的正文，与str用法完全相同，只用来标记内容来源，便于校验和统计"""
+    __slots__ = ()
+
+
+_MARKUP_TOKEN_PATTERN = re.compile(r'[<>]|[^<>]+')
+_NEWLINE_RUN_PATTERN = re.compile(r'\n{2,}')
+_HTML_TAG_PATTERN = re.compile(r'<\s*/?\s*[A-Za-z][^<>]*>')
+_PRIVATE_USE_PATTERN = re.compile('[\ue000-\uf8ff]')
+MAX_UNMAPPED_RATIO = 0.05   # 解码后仍是私有区字符的比例超过此值，说明字体映射不匹配
+
+
+def reader_content_problem(text: str) -> Optional[str]:
+    """检查解码后的阅读页正文，残留HTML标签或未映射的私有区字符过多时返回原因，正常时返回None"""
+    if _HTML_TAG_PATTERN.search(text):
+        return '残留HTML标签'
+    visible = len(text) - text.count('\n') - text.count(' ')
+    unmapped = len(_PRIVATE_USE_PATTERN.findall(text))
+    if visible and unmapped / visible > MAX_UNMAPPED_RATIO:
+        return f'未映射的私有区字符占 {unmapped / visible:.0%}'
+    return None
+
+
+def strip_reader_markup(content: str, start: int = 6) -> StrippedText:
+    """后备HTML处理：去掉标签并按 <p> 分段，线性时间
+
+    规则与原先的逐字符实现一致：跳过开头start个字符（默认6个，从第一个标签内部开始），
+    按'<'/'>'计数嵌套深度，深度0的文本是正文，深度1的标签中出现'p'（<p>、</p>）时换段，
+    换段处的连续换行合并为一个。start为0时从标签外开始。
+    按'<'、'>'和连续文本切分后整段处理，段落先收集到列表，最后只join一次。
+    """
+    paragraphs = []
+    pending = []
+    depth = 1 if start else 0
+    for match in _MARKUP_TOKEN_PATTERN.finditer(content, start):
+        token = match.group()
+        if token == '<':
+            depth += 1
+        elif token == '>':
+            depth -= 1
+        elif depth == 0:
+            pending.append(token)
+        elif depth == 1 and 'p' in token:
+            paragraphs.append(''.join(pending))
+            pending = []
+    if not paragraphs:
+        return StrippedText(''.join(pending))
+    # 最后一个换段之后的文本原样保留，之前的部分合并连续换行
+    body = _NEWLINE_RUN_PATTERN.sub('\n', '\n'.join(paragraphs) + '\n')
+    return StrippedText(body + ''.join(pending))
+
+
+@dataclass
+class BookPage:
+    """小说详情页 (/page/{novel_id}) 的解析结果
+    
+    详情页只请求、解析一次，章节列表、作者、封面等信息都从这里读取，
+    下载流程、EPUB导出和Web路由共用同一份数据。
+    """
+    novel_id: str
+    title: Optional[str]
+    status: List[str]
+    author: Optional[str]
+    cover_url: Optional[str]
+    ld_json: Dict
+    chapters: Dict[str, str]            # 章节标题 -> 章节ID，保持目录顺序
+    fetched_at: float = field(default_factory=time.time)
+
+    def is_valid(self) -> bool:
+        """标题、状态和章节列表齐全才算有效（无效页面不缓存）"""
+        return bool(self.title and self.status and self.chapters)
+
+
+BOOK_PAGE_CACHE_SIZE = 64  # 最多缓存的详情页数，超过时淘汰最久未使用的
+
+
+class GlyphDecoder:
+    """字体混淆正文的解码器
+
+    正文中的常用字被替换成私有区码位，charset.json为两种模式各提供一张映射表
+    （'?'表示该位置没有已知字符，保持原样）。构造时把两张表编译成覆盖整个BMP、
+    按码位下标查找的str.translate表，解码只需一次C层的translate，不再逐字符拼接字符串。
+    """
+
+    TABLE_SIZE = 0x10000  # 用序列覆盖BMP，避免未映射字符在dict中查找失败的异常开销；BMP以外的字符原样保留
+
+    def __init__(self, charset: List[List[str]], code_ranges: List[List[int]]):
+        # 构建后只读：映射表和字符集都是元组，可在所有下载器实例和线程间共享
+        self.charset = tuple(tuple(glyphs) for glyphs in charset)
+        self.code_ranges = tuple(tuple(code_range) for code_range in code_ranges)
+        identity = range(self.TABLE_SIZE)
+        tables = []
+        for glyphs, (start, end) in zip(self.charset, self.code_ranges):
+            table = list(identity)
+            for bias, glyph in enumerate(glyphs[:end - start + 1]):
+                if glyph != '?':
+                    table[start + bias] = ord(glyph) if len(glyph) == 1 else glyph
+            tables.append(tuple(table))
+        self.tables = tuple(tables)
+        # 模式检测按“解码后仍未映射的字符数”打分：两种模式区间内的码位中，在某模式下落在区间外、
+        # 超出映射表长度或映射为'?'的，都记为该模式的未映射码位
+        all_points = set()
+        for start, end in self.code_ranges:
+            all_points.update(range(start, end + 1))
+        unmapped = (''.join(chr(point) for point in sorted(all_points) if table[point] == point) for table in self.tables)
+        self._unmapped_patterns = tuple(re.compile('[%s]' % chars if chars else '(?!)') for chars in unmapped)
+
+    def detect_mode(self, content: str) -> int:
+        """按各模式解码后剩下的未映射字符数打分，取较少的模式（持平时沿用模式0）"""
+        mode0, mode1 = (len(pattern.findall(content)) for pattern in self._unmapped_patterns)
+        return 1 if mode1 < mode0 else 0
+
+    def decode(self, content: str, mode: int = 0) -> str:
+        return content.translate(self.tables[mode])
+
+
+CHARSET_CODE_RANGES = ((58344, 58715), (58345, 58716))
+
+_glyph_decoder_lock = threading.Lock()
+_glyph_decoders: Dict[str, tuple] = {}  # charset.json绝对路径 -> (mtime_ns, GlyphDecoder)
+
+
+def load_glyph_decoder(charset_path: str) -> GlyphDecoder:
+    """进程内共享的解码器：首次使用时构建，之后只在charset.json的mtime变化时重新加载"""
+    path = os.path.abspath(charset_path)
+    mtime = os.stat(path).st_mtime_ns
+    cached = _glyph_decoders.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with _glyph_decoder_lock:
+        cached = _glyph_decoders.get(path)
+        if cached is None or cached[0] != mtime:
+            with open(path, 'r', encoding='UTF-8') as f:
+                charset = json.load(f)
+            cached = _glyph_decoders[path] = (mtime, GlyphDecoder(charset, CHARSET_CODE_RANGES))
+        return cached[1]
+
+
+def _format_metric_value(value: float) -> str:
+    value = float(value)
+    if value == float('inf'):
+        return '+Inf'
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def _escape_label_value(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metric(ABC):
+    """指标基类：按标签值分别保存样本，标签名在创建时固定"""
+    kind = 'untyped'
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> tuple:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def _labels(self, key: tuple, extra: tuple = ()) -> str:
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape_label_value(value)}"' for name, value in pairs) + '}'
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        """Prometheus文本格式的样本行（不含HELP/TYPE）"""
+
+    def render(self) -> List[str]:
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}'] + self.samples()
+
+
+class CounterMetric(Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f'{self.name}{self._labels(key)} {_format_metric_value(value)}' for key, value in values]
+
+
+class GaugeMetric(Metric):
+    """可设置数值，也可以记录开始时间（导出时为已经过的秒数）或注册一个取值函数"""
+    kind = 'gauge'
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        super().__init__(name, help_text, labelnames)
+        self._since = {}
+        self._function = None
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def start_timer(self, **labels):
+        with self._lock:
+            self._since[self._key(labels)] = time.monotonic()
+
+    def remove(self, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values.pop(key, None)
+            self._since.pop(key, None)
+
+    def set_function(self, function: Callable[[], float]):
+        """导出时调用function取值（只用于无标签的指标）"""
+        self._function = function
+
+    def samples(self) -> List[str]:
+        now = time.monotonic()
+        with self._lock:
+            values = dict(self._values)
+            values.update((key, now - since) for key, since in self._since.items())
+        if self._function is not None:
+            try:
+                values[()] = self._function()
+            except Exception:
+                pass
+        return [f'{self.name}{self._labels(key)} {_format_metric_value(value)}' for key, value in values.items()]
+
+
+class HistogramMetric(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = ()):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][index] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = [(key, list(state[0]), state[1], state[2]) for key, state in self._values.items()]
+        lines = []
+        for key, counts, total, count in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{self._labels(key, (("le", _format_metric_value(bound)),))} {cumulative}')
+            lines.append(f'{self.name}_bucket{self._labels(key, (("le", "+Inf"),))} {count}')
+            lines.append(f'{self.name}_sum{self._labels(key)} {_format_metric_value(total)}')
+            lines.append(f'{self.name}_count{self._labels(key)} {count}')
+        return lines
+
+
+class MetricsRegistry:
+    """进程内的下载指标，以Prometheus文本格式导出（server.py的/metrics），不依赖外部服务
+
+    counter/gauge/histogram按名称创建，重复调用返回同一个指标。
+    """
+    LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, help_text: str, labelnames: tuple, **kwargs) -> Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, tuple(labelnames), **kwargs)
+            return metric
+
+    def counter(self, name: str, help_text: str, labelnames: tuple = ()) -> CounterMetric:
+        return self._get(CounterMetric, name, help_text, labelnames)
+
+    def gauge(self, name: str, help_text: str, labelnames: tuple = ()) -> GaugeMetric:
+        return self._get(GaugeMetric, name, help_text, labelnames)
+
+    def histogram(self, name: str, help_text: str, labelnames: tuple = (),
+                  buckets: tuple = LATENCY_BUCKETS) -> HistogramMetric:
+        return self._get(HistogramMetric, name, help_text, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = MetricsRegistry()
+CHAPTERS_DOWNLOADED = METRICS.counter('fanqie_chapters_downloaded_total', 'Chapters downloaded successfully', ('engine',))
+CHAPTERS_FAILED = METRICS.counter('fanqie_chapters_failed_total', 'Chapters that failed after all retries', ('engine',))
+CHAPTER_ATTEMPTS = METRICS.counter('fanqie_chapter_attempts_total', 'Chapter download attempts', ('engine',))
+CHAPTER_EMPTY = METRICS.counter('fanqie_chapter_empty_total', 'Attempts that returned empty or unusable content', ('engine',))
+CHAPTERS_FALLBACK = METRICS.counter('fanqie_chapters_fallback_total', 'Chapters whose text came from fallback HTML processing', ('engine',))
+CHAPTERS_REUSED = METRICS.counter('fanqie_chapters_reused_total', 'Chapters reused from the bookstore by incremental updates')
+CHAPTER_CACHE_HITS = METRICS.counter('fanqie_chapter_cache_hits_total', 'Chapters served from the chapter cache without a request')
+CHAPTER_CACHE_EVICTIONS = METRICS.counter('fanqie_chapter_cache_evictions_total', 'Chapters evicted from the chapter cache')
+CHAPTER_RETRIES = METRICS.counter('fanqie_chapter_retries_total', 'Chapter attempts scheduled for retry', ('engine',))
+SOURCE_REQUESTS = METRICS.counter('fanqie_source_requests_total', 'Content source requests by outcome', ('source', 'outcome'))
+SOURCE_REQUEST_SECONDS = METRICS.histogram('fanqie_source_request_seconds', 'Content source HTTP request latency', ('source',))
+DECODE_SECONDS = METRICS.histogram('fanqie_decode_seconds', 'Time spent extracting and decoding chapter content', ('source',),
+                                   buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25))
+RESPONSE_BYTES = METRICS.counter('fanqie_response_bytes_total', 'Response bytes received from content sources', ('source',))
+COOKIE_ROTATIONS = METRICS.counter('fanqie_cookie_rotations_total', 'Cookie rotations by reason', ('reason',))
+JOB_ELAPSED = METRICS.gauge('fanqie_job_elapsed_seconds', 'Elapsed time of running download jobs', ('novel_id',))
+JOB_DURATION = METRICS.histogram('fanqie_job_duration_seconds', 'Duration of finished download jobs', (),
+                                 buckets=(5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200))
+
+
+def observe_source_request(source: str, outcome: str, request_seconds: float,
+                           decode_seconds: Optional[float] = None, size: int = 0):
+    """记录一次来源请求：结果、请求耗时、解析解码耗时和响应字节数"""
+    SOURCE_REQUESTS.inc(source=source, outcome=outcome)
+    SOURCE_REQUEST_SECONDS.observe(request_seconds, source=source)
+    if decode_seconds is not None:
+        DECODE_SECONDS.observe(decode_seconds, source=source)
+    if size:
+        RESPONSE_BYTES.inc(size, source=source)
+
+
+class RateLimiter:
+    """全局令牌桶限速器（线程安全，所有下载线程/协程共享一个实例）
+    
+    采用虚拟调度方式：reserve()只预约下一个令牌的发放时间并立即返回，
+    由调度方（主线程或事件循环）等待，下载线程不会在占用线程池名额时睡眠。
+    每个令牌的间隔带有随机抖动，保留"真实用户阅读"式的不均匀节奏。
+    """
+
+    # 原先每个线程在每章之后平均暂停2.5秒(0-5秒均匀分布)模拟阅读
+    READING_PAUSE_MEAN = 2.5
+
+    def __init__(self, rate: float, burst: int = 1, jitter: float = 0.5):
+        self.rate = max(0.01, float(rate))
+        self.burst = max(1, int(burst))
+        self.jitter = min(max(float(jitter), 0.0), 0.95)
+        self.multiplier = 1.0             # 自适应倍数，>1时放慢请求节奏
+
+        self._lock = threading.Lock()
+        self._tat = time.monotonic()      # 理论上的下一个令牌到达时间
+        self._granted = 0
+        self._first_grant = None
+
+    @classmethod
+    def from_config(cls, config: Config) -> 'RateLimiter':
+        """delay_mode预设 -> 限速参数
+        
+        默认保持原有的总体请求速率：每个线程"阅读暂停 + 请求间隔"发出一个请求，
+        即 rate = 线程数 / (平均阅读暂停 + 平均延时)。
+        """
+        if config.rate_limit and config.rate_limit > 0:
+            rate = config.rate_limit
+        else:
+            mean_delay = (config.delay[0] + config.delay[1]) / 2 / 1000
+            rate = max(1, config.xc) / (cls.READING_PAUSE_MEAN + mean_delay)
+        burst = config.rate_burst if config.rate_burst and config.rate_burst > 0 else config.xc
+        return cls(rate, burst, config.rate_jitter)
+
+    def reserve(self) -> float:
+        """预约一个令牌，返回允许发出请求的时间点(time.monotonic)，不阻塞"""
+        with self._lock:
+            now = time.monotonic()
+            base_interval = 1.0 / self.rate
+            interval = base_interval * self.multiplier * random.uniform(1 - self.jitter, 1 + self.jitter)
+            tat = max(self._tat, now)
+            start = max(now, tat - (self.burst - 1) * base_interval)
+            self._tat = tat + interval
+
+            self._granted += 1
+            if self._first_grant is None:
+                self._first_grant = start
+            return start
+
+    def acquire(self):
+        """阻塞直到获得令牌（供不经过调度器的单章节调用使用）"""
+        wait = self.reserve() - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+
+    def set_multiplier(self, multiplier: float):
+        with self._lock:
+            self.multiplier = max(0.1, multiplier)
+
+    def adjust_multiplier(self, delta: float, minimum: float = 1.0, maximum: float = 5.0) -> float:
+        """原子地增减自适应倍数并限制在[minimum, maximum]内，返回调整后的值"""
+        with self._lock:
+            self.multiplier = min(maximum, max(minimum, self.multiplier + delta))
+            return self.multiplier
+
+    def target_rate(self) -> float:
+        return self.rate / self.multiplier
+
+    def stats(self) -> Dict[str, float]:
+        """已发放的令牌数与实际达到的请求速率"""
+        with self._lock:
+            granted = self._granted
+            first_grant = self._first_grant
+        elapsed = time.monotonic() - first_grant if first_grant is not None else 0
+        return {
+            'granted': granted,
+            'target_rate': self.target_rate(),
+            'achieved_rate': granted / elapsed if elapsed > 0 else 0.0,
+        }
+
+
+class AtomicCounter:
+    """线程安全的整数计数器
+    
+    CPython没有无锁的原子整数，这里用一把只覆盖"读-改-写"的短锁；
+    increment()/reset()直接返回结果，调用方不必再读一次，避免检查与修改之间的竞争。
+    """
+
+    __slots__ = ('_value', '_lock')
+
+    def __init__(self, value: int = 0):
+        self._value = value
+        self._lock = threading.Lock()
+
+    def increment(self, delta: int = 1) -> int:
+        """加delta并返回新值"""
+        with self._lock:
+            self._value += delta
+            return self._value
+
+    def reset(self, value: int = 0) -> int:
+        """设为value并返回旧值"""
+        with self._lock:
+            previous, self._value = self._value, value
+            return previous
+
+    @property
+    def value(self) -> int:
+        return self._value
+
+    def __int__(self) -> int:
+        return self._value
+
+    def __repr__(self) -> str:
+        return f'AtomicCounter({self._value})'
+
+
+# 最终失败章节在JSON和章节文件中的占位内容，增量更新时会重新请求
+EMPTY_CHAPTER_PLACEHOLDER = "抓取内容为空"
+
+
+class ChapterCodec:
+    """章节存储的正文编码：raw / zlib / zstd
+
+    单个章节只有几KB，通用压缩器来不及学到网文反复出现的用词和句式，
+    zstd使用在本地书库上训练的字典后单章压缩率明显提高。写入前先攒够TRAIN_SAMPLES个章节训练字典，
+    字典训练后不再修改，按ID保存为 dictionaries/zstd-<ID>.dict，旧记录总能用写入时的字典解压。
+    未安装zstandard时退回zlib。每条记录带有编码标记，解码与当前配置无关，不同编码的记录可以混存。
+    """
+
+    DEFAULT_LEVELS = {'zlib': 6, 'zstd': 3}
+    TRAIN_SAMPLES = 200             # 攒够这么多章节后训练字典
+    DICT_SIZE = 112 * 1024
+
+    def __init__(self, encoding: str = 'raw', level: int = 0, dictionary_dir: Optional[str] = None,
+                 log_callback: Optional[Callable] = None, auto_train: bool = True):
+        if encoding == 'zstd' and zstandard is None:
+            if log_callback:
+                log_callback('⚠️ 未安装zstandard，章节存储改用zlib压缩 (pip install zstandard)')
+            encoding = 'zlib'
+        if encoding not in ('raw', 'zlib', 'zstd'):
+            raise ValueError(f'未知的章节压缩编码: {encoding}')
+        self.encoding = encoding
+        self.level = level or self.DEFAULT_LEVELS.get(encoding, 0)
+        self.dictionary_dir = dictionary_dir
+        self.log_callback = log_callback
+        self.auto_train = auto_train     # 没有字典时用写入的章节训练
+        self._lock = threading.Lock()
+        self._local = threading.local()  # zstd的压缩/解压对象不能跨线程共用
+        self._dictionaries = {}          # 字典ID -> ZstdCompressionDict
+        self.dictionary = None           # 写入时使用的字典
+        self._samples = []
+        self._load_dictionaries()
+
+    @classmethod
+    def from_config(cls, config: Config, bookstore_dir: str, log_callback: Optional[Callable] = None) -> 'ChapterCodec':
+        encoding = {'none': 'raw', '': 'raw'}.get(config.chapter_compression, config.chapter_compression)
+        if encoding not in ('raw', 'zlib', 'zstd'):
+            if log_callback:
+                log_callback(f'⚠️ 未知的chapter_compression: {config.chapter_compression}，章节存储不压缩')
+            encoding = 'raw'
+        return cls(encoding, config.compression_level, os.path.join(bookstore_dir, 'dictionaries'), log_callback)
+
+    def _load_dictionaries(self):
+        if zstandard is None or not self.dictionary_dir or not os.path.isdir(self.dictionary_dir):
+            return
+        newest = None
+        for name in os.listdir(self.dictionary_dir):
+            match = re.fullmatch(r'zstd-(\d+)\.dict', name)
+            if not match:
+                continue
+            path = os.path.join(self.dictionary_dir, name)
+            with open(path, 'rb') as f:
+                self._dictionaries[int(match.group(1))] = zstandard.ZstdCompressionDict(f.read())
+            if newest is None or os.path.getmtime(path) > newest[0]:
+                newest = (os.path.getmtime(path), int(match.group(1)))
+        if newest:
+            self.dictionary = self._dictionaries[newest[1]]
+
+    def train(self, samples: List[bytes]) -> Optional[int]:
+        """用样本章节训练zstd字典并设为写入字典，返回字典ID；样本不足以训练时返回None"""
+        try:
+            dictionary = zstandard.train_dictionary(self.DICT_SIZE, samples, level=self.level)
+        except zstandard.ZstdError:
+            return None
+        dict_id = dictionary.dict_id()
+        if self.dictionary_dir:
+            os.makedirs(self.dictionary_dir, exist_ok=True)
+            path = os.path.join(self.dictionary_dir, f'zstd-{dict_id}.dict')
+            with open(f'{path}.tmp', 'wb') as f:
+                f.write(dictionary.as_bytes())
+            os.replace(f'{path}.tmp', path)
+        self.use_dictionary(dictionary)
+        if self.log_callback:
+            self.log_callback(f'🗜️ 已用{len(samples)}个章节训练zstd压缩字典 (ID {dict_id})')
+        return dict_id
+
+    def use_dictionary(self, dictionary):
+        """把已有的字典设为写入字典"""
+        self._dictionaries[dictionary.dict_id()] = dictionary
+        self.dictionary = dictionary
+
+    def _collect_sample(self, data: bytes):
+        with self._lock:
+            if self.dictionary is not None:
+                return
+            self._samples.append(data)
+            if len(self._samples) < self.TRAIN_SAMPLES:
+                return
+            samples, self._samples = self._samples, []
+            self.train(samples)
+
+    @property
+    def target(self) -> tuple:
+        """当前写入使用的 (编码, 字典ID)"""
+        if self.encoding == 'zstd' and self.dictionary is not None:
+            return 'zstd', self.dictionary.dict_id()
+        return self.encoding, None
+
+    def _compressor(self, dictionary):
+        cache = self._local.__dict__.setdefault('compressors', {})
+        key = dictionary.dict_id() if dictionary else None
+        if key not in cache:
+            cache[key] = zstandard.ZstdCompressor(level=self.level, dict_data=dictionary)
+        return cache[key]
+
+    def _decompressor(self, dict_id: Optional[int]):
+        cache = self._local.__dict__.setdefault('decompressors', {})
+        if dict_id not in cache:
+            if zstandard is None:
+                raise RuntimeError('章节以zstd压缩保存，读取需要安装zstandard (pip install zstandard)')
+            dictionary = None
+            if dict_id:
+                dictionary = self._dictionaries.get(dict_id)
+                if dictionary is None:
+                    raise RuntimeError(f'找不到章节使用的zstd字典: zstd-{dict_id}.dict')
+            cache[dict_id] = zstandard.ZstdDecompressor(dict_data=dictionary)
+        return cache[dict_id]
+
+    def encode(self, text: str) -> tuple:
+        """返回 (编码, 字典ID或None, 字节)"""
+        data = text.encode('utf-8')
+        if self.encoding == 'zlib':
+            return 'zlib', None, zlib.compress(data, self.level)
+        if self.encoding == 'zstd':
+            if self.dictionary is None and self.auto_train:
+                self._collect_sample(data)
+            dictionary = self.dictionary
+            return 'zstd', dictionary.dict_id() if dictionary else None, self._compressor(dictionary).compress(data)
+        return 'raw', None, data
+
+    def decode(self, encoding: str, dict_id: Optional[int], payload: bytes) -> str:
+        if encoding == 'zlib':
+            payload = zlib.decompress(payload)
+        elif encoding == 'zstd':
+            payload = self._decompressor(dict_id).decompress(payload)
+        elif encoding != 'raw':
+            raise ValueError(f'未知的章节编码: {encoding}')
+        return payload.decode('utf-8')
+
+
+class ChapterStore:
+    """单本小说的章节存储：追加写的日志 + 索引文件
+
+    每个章节追加为chapters.log中的一条记录：一行JSON头 {id, pos, title, enc, dict, size, fallback}
+    后跟size字节的正文（按ChapterCodec编码）和换行，同时在chapters.idx追加一行索引
+    [章节ID, 目录位置, 偏移, 长度, 标题]，保存一个章节的开销与全书大小无关（原来每5章重写整本JSON）。
+    读取时按记录自带的编码解码，早期正文直接写在JSON行content字段里的记录仍可读取。
+    同一章节再次保存时旧记录成为垃圾，compact()按目录位置重写日志只保留最新记录；
+    export_json()生成与原来相同的"标题: 内容"JSON，供导出器和旧工具使用。
+
+    索引落后于日志（写索引前中断、索引丢失）时打开存储会扫描日志补齐，末尾写了一半的记录会被截掉。
+    每次追加时才打开文件、不持有句柄，Windows上compact替换文件时不会被占用。
+    """
+
+    LOG_NAME = 'chapters.log'
+    INDEX_NAME = 'chapters.idx'
+
+    def __init__(self, directory: str, codec: Optional[ChapterCodec] = None):
+        self.directory = directory
+        self.codec = codec or ChapterCodec()
+        self.log_path = os.path.join(directory, self.LOG_NAME)
+        self.index_path = os.path.join(directory, self.INDEX_NAME)
+        self._lock = threading.Lock()
+        self._index = {}        # chapter_id -> (position, offset, length, title)
+        self.log_bytes = 0      # 日志文件大小
+        self.live_bytes = 0     # 最新记录占用的字节数
+        self._load()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._index)
+
+    def __contains__(self, chapter_id) -> bool:
+        with self._lock:
+            return str(chapter_id) in self._index
+
+    def _load(self):
+        if not os.path.exists(self.log_path):
+            return
+        self.log_bytes = os.path.getsize(self.log_path)
+        indexed_end = 0
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        chapter_id, position, offset, length, title = json.loads(line)
+                    except ValueError:
+                        break  # 写了一半的最后一行
+                    if offset + length > self.log_bytes:
+                        break
+                    self._index[chapter_id] = (position, offset, length, title)
+                    indexed_end = max(indexed_end, offset + length)
+        if indexed_end < self.log_bytes:
+            self._recover(indexed_end)
+        self.live_bytes = sum(entry[2] for entry in self._index.values())
+
+    def _recover(self, start: int):
+        """从start开始扫描日志补齐索引，并重写索引文件"""
+        offset = start
+        with open(self.log_path, 'rb') as f:
+            f.seek(start)
+            while True:
+                line = f.readline()
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    header = json.loads(line)
+                except ValueError:
+                    break
+                length = len(line)
+                if 'content' not in header:
+                    payload = f.read(header['size'] + 1)
+                    if len(payload) != header['size'] + 1 or not payload.endswith(b'\n'):
+                        break
+                    length += len(payload)
+                self._index[header['id']] = (header['pos'], offset, length, header['title'])
+                offset += length
+        if offset < self.log_bytes:
+            with open(self.log_path, 'r+b') as f:
+                f.truncate(offset)
+            self.log_bytes = offset
+        self._write_index(self.index_path)
+
+    def _write_index(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            for chapter_id, (position, offset, length, title) in self._index.items():
+                f.write(json.dumps([chapter_id, position, offset, length, title], ensure_ascii=False) + '\n')
+
+    def _encode_record(self, chapter_id: str, position: int, title: str, content: str) -> bytes:
+        encoding, dict_id, payload = self.codec.encode(content)
+        header = {'id': chapter_id, 'pos': position, 'title': title, 'enc': encoding, 'size': len(payload)}
+        if dict_id:
+            header['dict'] = dict_id
+        if isinstance(content, StrippedText):
+            header['fallback'] = True
+        return json.dumps(header, ensure_ascii=False).encode('utf-8') + b'\n' + payload + b'\n'
+
+    def _decode_record(self, record: bytes) -> tuple:
+        """返回 (记录头, 正文)"""
+        newline = record.index(b'\n')
+        header = json.loads(record[:newline])
+        if 'content' in header:
+            return header, header['content']
+        payload = record[newline + 1:newline + 1 + header['size']]
+        content = self.codec.decode(header['enc'], header.get('dict'), payload)
+        return header, StrippedText(content) if header.get('fallback') else content
+
+    def put(self, chapter_id, title: str, content: str, position: int) -> tuple:
+        """追加保存一个章节（线程安全），返回记录在日志中的 (偏移, 长度)"""
+        chapter_id = str(chapter_id)
+        record = self._encode_record(chapter_id, position, title, content)
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            offset = self.log_bytes
+            with open(self.log_path, 'ab') as f:
+                f.write(record)
+            with open(self.index_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps([chapter_id, position, offset, len(record), title], ensure_ascii=False) + '\n')
+            previous = self._index.get(chapter_id)
+            if previous:
+                self.live_bytes -= previous[2]
+            self._index[chapter_id] = (position, offset, len(record), title)
+            self.log_bytes = offset + len(record)
+            self.live_bytes += len(record)
+            return offset, len(record)
+
+    def read_at(self, chapter_id, offset: int, length: int) -> Optional[str]:
+        """按恢复日志记录的偏移和长度直接读取一条记录，记录不属于该章节（日志已整理）时返回None"""
+        with self._lock:
+            if offset < 0 or offset + length > self.log_bytes:
+                return None
+            with open(self.log_path, 'rb') as f:
+                f.seek(offset)
+                record = f.read(length)
+        try:
+            header, content = self._decode_record(record)
+        except ValueError:
+            return None
+        return content if header.get('id') == str(chapter_id) else None
+
+    def get(self, chapter_id) -> Optional[str]:
+        """读取章节内容，不存在时返回None"""
+        with self._lock:
+            entry = self._index.get(str(chapter_id))
+            if entry is None:
+                return None
+            with open(self.log_path, 'rb') as f:
+                f.seek(entry[1])
+                return self._decode_record(f.read(entry[2]))[1]
+
+    def entries(self) -> List[tuple]:
+        """按目录位置返回 [(章节ID, 标题)]，不读取正文"""
+        with self._lock:
+            return [(chapter_id, title) for chapter_id, (_, _, _, title)
+                    in sorted(self._index.items(), key=lambda item: item[1][0])]
+
+    def chapters(self, order: Optional[List[str]] = None) -> Dict[str, str]:
+        """按order（章节ID列表）或保存时的目录位置返回 {标题: 内容}"""
+        with self._lock:
+            if order is None:
+                entries = sorted(self._index.values())
+            else:
+                entries = [self._index[str(chapter_id)] for chapter_id in order if str(chapter_id) in self._index]
+            if not entries:
+                return {}
+            result = {}
+            with open(self.log_path, 'rb') as f:
+                for _, offset, length, title in entries:
+                    f.seek(offset)
+                    result[title] = self._decode_record(f.read(length))[1]
+            return result
+
+    def export_json(self, json_path: str, metadata: Optional[Dict] = None,
+                    order: Optional[List[str]] = None) -> int:
+        """导出与原来格式相同的JSON（_metadata + 标题: 内容），返回章节数"""
+        content = self.chapters(order)
+        fallback = [title for title, text in content.items() if isinstance(text, StrippedText)]
+        if metadata and fallback:
+            metadata = {**metadata, 'fallback_chapters': fallback}  # 正文来自后备HTML处理的章节
+        data = {'_metadata': metadata, **content} if metadata else content
+        tmp_path = f'{json_path}.tmp'
+        with open(tmp_path, 'w', encoding='UTF-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, json_path)
+        return len(content)
+
+    def needs_compaction(self, min_bytes: int = 1 << 20) -> bool:
+        """旧记录超过一半且日志达到min_bytes时需要整理"""
+        return self.log_bytes >= min_bytes and self.log_bytes - self.live_bytes > self.live_bytes
+
+    def compact(self) -> int:
+        """按目录位置重写日志，只保留每个章节的最新记录，返回回收的字节数
+
+        编码与当前codec不同的记录（压缩配置改变、训练出字典之前写入的章节）会顺便重新编码。
+        """
+        with self._lock:
+            if not self._index:
+                return 0
+            entries = sorted(self._index.items(), key=lambda item: item[1][0])
+            tmp_log = f'{self.log_path}.tmp'
+            tmp_index = f'{self.index_path}.tmp'
+            compacted = {}
+            offset = 0
+            with open(self.log_path, 'rb') as src, open(tmp_log, 'wb') as dst:
+                for chapter_id, (position, old_offset, length, title) in entries:
+                    src.seek(old_offset)
+                    record = src.read(length)
+                    header, content = self._decode_record(record)
+                    if (header.get('enc'), header.get('dict')) != self.codec.target:
+                        record = self._encode_record(chapter_id, position, title, content)
+                        length = len(record)
+                    dst.write(record)
+                    compacted[chapter_id] = (position, offset, length, title)
+                    offset += length
+            reclaimed = self.log_bytes - offset
+            self._index = compacted
+            self._write_index(tmp_index)
+            # 先删除旧索引：中途中断时打开存储会重新扫描日志，不会用旧偏移读取新日志
+            if os.path.exists(self.index_path):
+                os.remove(self.index_path)
+            os.replace(tmp_log, self.log_path)
+            os.replace(tmp_index, self.index_path)
+            self.log_bytes = self.live_bytes = offset
+            return reclaimed
+
+
+class LibraryCatalog:
+    """已下载小说的目录（SQLite），列出书库时不再逐个读取整本JSON
+
+    每本书下载完成时在一个事务中写入一行：ID、书名、状态、章节数、失败章节数、文件字节数、
+    更新时间和各格式文件路径。目录丢失或与磁盘不一致时可由NovelDownloader.rebuild_catalog()重新生成。
+
+    目录是否已从磁盘生成过记录在catalog_meta表的built标记中，而不是看文件是否存在：
+    升级后第一次下载完成时record()会创建数据库文件，此前已下载的书不能因此从列表中消失。
+    未生成过时，record()和list()先调用scan()扫描书库整体生成一次。
+    """
+
+    FILE_NAME = 'catalog.db'
+    FORMATS = ('json', 'txt', 'epub', 'html', 'latex', 'pdf')
+
+    def __init__(self, path: str, scan: Optional[Callable[[], List[tuple]]] = None):
+        self.path = path
+        self.scan = scan    # 返回make_entry()记录列表，用于首次生成目录
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """打开连接（每次操作单独连接，可在任意线程使用），with块结束时提交或回滚"""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                conn.execute('''CREATE TABLE IF NOT EXISTS novels (
+                    novel_id TEXT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    status TEXT,
+                    chapter_count INTEGER NOT NULL DEFAULT 0,
+                    failed_count INTEGER NOT NULL DEFAULT 0,
+                    bytes INTEGER NOT NULL DEFAULT 0,
+                    last_updated TEXT,
+                    paths TEXT NOT NULL DEFAULT '{}'
+                )''')
+                conn.execute('CREATE TABLE IF NOT EXISTS catalog_meta (key TEXT PRIMARY KEY, value TEXT)')
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _path_size(path: str) -> int:
+        if os.path.isdir(path):
+            return sum(os.path.getsize(os.path.join(root, name))
+                       for root, _, names in os.walk(path) for name in names)
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    @classmethod
+    def make_entry(cls, novel_id, name: str, status: Optional[str], chapter_count: int,
+                   paths: Dict[str, str], failed_count: int = 0, last_updated: Optional[str] = None) -> tuple:
+        """生成一行目录记录，只保留磁盘上存在的文件路径"""
+        paths = {fmt: path for fmt, path in paths.items() if path and os.path.exists(path)}
+        return (str(novel_id), name, status, chapter_count, failed_count,
+                sum(cls._path_size(path) for path in paths.values()),
+                last_updated or time.strftime('%Y-%m-%d %H:%M:%S'),
+                json.dumps(paths, ensure_ascii=False))
+
+    def is_built(self) -> bool:
+        with self._connect() as conn:
+            return conn.execute("SELECT 1 FROM catalog_meta WHERE key = 'built'").fetchone() is not None
+
+    def ensure_built(self):
+        """目录还没从磁盘生成过时扫描书库生成"""
+        if self.scan is not None and not self.is_built():
+            self.rebuild(self.scan())
+
+    def record(self, novel_id, name: str, status: Optional[str], chapter_count: int,
+               paths: Dict[str, str], failed_count: int = 0):
+        """下载完成后写入（或替换）一本书的记录"""
+        self.ensure_built()
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO novels VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                         self.make_entry(novel_id, name, status, chapter_count, paths, failed_count))
+
+    def rebuild(self, entries: List[tuple]):
+        """用make_entry()生成的记录整体替换目录"""
+        with self._connect() as conn:
+            conn.execute('DELETE FROM novels')
+            conn.executemany('INSERT OR REPLACE INTO novels VALUES (?, ?, ?, ?, ?, ?, ?, ?)', entries)
+            conn.execute("INSERT OR REPLACE INTO catalog_meta VALUES ('built', ?)", (time.strftime('%Y-%m-%d %H:%M:%S'),))
+
+    def remove(self, novel_id):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM novels WHERE novel_id = ?', (str(novel_id),))
+
+    def list(self) -> List[Dict]:
+        """按更新时间倒序列出所有小说，各格式路径展开为<格式>_path（不存在时为None）"""
+        self.ensure_built()
+        with self._connect() as conn:
+            rows = conn.execute('SELECT * FROM novels ORDER BY last_updated DESC, name').fetchall()
+        novels = []
+        for row in rows:
+            novel = {key: row[key] for key in row.keys() if key != 'paths'}
+            paths = json.loads(row['paths'])
+            for fmt in self.FORMATS:
+                novel[f'{fmt}_path'] = paths.get(fmt)
+            novels.append(novel)
+        return novels
+
+
+class ChapterCache:
+    """按章节ID缓存解码后的正文（SQLite），跨下载任务、跨小说、跨进程共用
+
+    批量下载和_download_chapter在请求之前先查缓存，章节解码成功后写入：下载中途中断后重新下载，
+    或同一本书同时被Web下载和下载队列请求时，已经拿到的章节不再请求。
+    正文按ChapterCodec编码保存；总大小超过max_bytes时按最近访问时间淘汰到上限的90%。
+    每个章节都要读写，所以持有一个连接（加锁共用）而不是每次操作单独连接；
+    数据库出错时停用缓存，不影响下载。
+    """
+
+    SCHEMA = '''CREATE TABLE IF NOT EXISTS chapters (
+        chapter_id TEXT PRIMARY KEY,
+        enc TEXT NOT NULL,
+        dict INTEGER,
+        payload BLOB NOT NULL,
+        size INTEGER NOT NULL,
+        accessed REAL NOT NULL
+    )'''
+
+    def __init__(self, path: Optional[str], max_bytes: int, codec: Optional[ChapterCodec] = None,
+                 log_callback: Optional[Callable] = None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.enabled = bool(path) and max_bytes > 0
+        self.codec = codec or ChapterCodec()
+        self.log_callback = log_callback
+        self._lock = threading.Lock()
+        self._conn = None
+        self.total_bytes = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(self.SCHEMA)
+            conn.execute('CREATE INDEX IF NOT EXISTS chapters_accessed ON chapters (accessed)')
+            self.total_bytes = conn.execute('SELECT COALESCE(SUM(size), 0) FROM chapters').fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    def _disable(self, error: Exception):
+        self.enabled = False
+        if self.log_callback:
+            self.log_callback(f'⚠️ 章节缓存不可用，已停用: {error}')
+
+    def get_many(self, chapter_ids: List) -> Dict[str, str]:
+        """返回缓存中存在的 {章节ID: 正文}，并刷新它们的访问时间"""
+        if not self.enabled or not chapter_ids:
+            return {}
+        found = {}
+        ids = [str(chapter_id) for chapter_id in chapter_ids]
+        with self._lock:
+            try:
+                conn = self._connection()
+                for start in range(0, len(ids), 500):
+                    chunk = ids[start:start + 500]
+                    marks = ','.join('?' * len(chunk))
+                    rows = conn.execute(f'SELECT chapter_id, enc, dict, payload FROM chapters '
+                                        f'WHERE chapter_id IN ({marks})', chunk).fetchall()
+                    for chapter_id, encoding, dict_id, payload in rows:
+                        try:
+                            found[chapter_id] = self.codec.decode(encoding, dict_id, payload)
+                        except Exception:
+                            # 其他进程用当前环境无法解码的方式写入，当作未命中
+                            continue
+                    if rows:
+                        conn.execute(f'UPDATE chapters SET accessed = ? WHERE chapter_id IN ({marks})',
+                                     [time.time()] + chunk)
+            except (sqlite3.Error, OSError) as e:
+                self._disable(e)
+                return {}
+        if found:
+            CHAPTER_CACHE_HITS.inc(len(found))
+        return found
+
+    def get(self, chapter_id) -> Optional[str]:
+        return self.get_many([chapter_id]).get(str(chapter_id))
+
+    def put(self, chapter_id, content: str):
+        """写入解码成功的章节，超出大小上限时淘汰最久未用的章节"""
+        if not self.enabled or not content:
+            return
+        encoding, dict_id, payload = self.codec.encode(content)
+        with self._lock:
+            try:
+                conn = self._connection()
+                previous = conn.execute('SELECT size FROM chapters WHERE chapter_id = ?',
+                                        (str(chapter_id),)).fetchone()
+                conn.execute('INSERT OR REPLACE INTO chapters VALUES (?, ?, ?, ?, ?, ?)',
+                             (str(chapter_id), encoding, dict_id, payload, len(payload), time.time()))
+                self.total_bytes += len(payload) - (previous[0] if previous else 0)
+                if self.total_bytes > self.max_bytes:
+                    self._evict(conn)
+            except (sqlite3.Error, OSError) as e:
+                self._disable(e)
+
+    def _evict(self, conn: sqlite3.Connection):
+        # 其他进程也会写入，淘汰前重新统计
+        self.total_bytes = conn.execute('SELECT COALESCE(SUM(size), 0) FROM chapters').fetchone()[0]
+        excess = self.total_bytes - int(self.max_bytes * 0.9)
+        if excess <= 0:
+            return
+        victims = []
+        for chapter_id, size in conn.execute('SELECT chapter_id, size FROM chapters ORDER BY accessed'):
+            victims.append(chapter_id)
+            excess -= size
+            self.total_bytes -= size
+            if excess <= 0:
+                break
+        for start in range(0, len(victims), 500):
+            chunk = victims[start:start + 500]
+            conn.execute(f'DELETE FROM chapters WHERE chapter_id IN ({",".join("?" * len(chunk))})', chunk)
+        CHAPTER_CACHE_EVICTIONS.inc(len(victims))
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class DownloadJournal:
+    """进行中下载任务的恢复日志：journals/<小说ID>.journal（JSONL）
+
+    任务开始时追加目录记录 {type: toc, name, chapters: [[标题, 章节ID], ...]}，每个章节写入ChapterStore后
+    追加 {type: chapter, id, title, offset, length}，记录它在chapters.log中的偏移和长度。每条记录用一次
+    O_APPEND写入，进程中途退出最多在末尾留下写了一半的一行，打开日志时截掉。下载完成后删除日志，仍然存在的
+    日志就是未完成的任务：重新下载同一本书时按记录的偏移读回已完成的章节，其余章节（包括中断时正在
+    下载的）重新排队。
+    """
+
+    SUFFIX = '.journal'
+
+    def __init__(self, directory: str, novel_id):
+        self.directory = directory
+        self.novel_id = str(novel_id)
+        self.path = os.path.join(directory, f'{self.novel_id}{self.SUFFIX}')
+        self._lock = threading.Lock()
+        self.name = None
+        self.toc = []           # [(标题, 章节ID)]
+        self.completed = {}     # 章节ID -> 记录
+        self._load()
+
+    @classmethod
+    def pending(cls, directory: str) -> List[str]:
+        """未完成任务的小说ID，按开始时间排列"""
+        if not os.path.isdir(directory):
+            return []
+        paths = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(cls.SUFFIX)]
+        return [os.path.basename(path)[:-len(cls.SUFFIX)] for path in sorted(paths, key=os.path.getmtime)]
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def _load(self):
+        if not self.exists():
+            return
+        valid_end = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError
+                    record = json.loads(line)
+                except ValueError:
+                    break  # 写了一半的最后一行
+                valid_end += len(line)
+                if record.get('type') == 'toc':
+                    self.name = record.get('name')
+                    self.toc = [tuple(item) for item in record.get('chapters', [])]
+                elif record.get('type') == 'chapter':
+                    self.completed[record['id']] = record
+        if valid_end < os.path.getsize(self.path):
+            # 截掉半行，否则恢复后追加的记录会接在半行后面，下次读取时一起丢失
+            with open(self.path, 'r+b') as f:
+                f.truncate(valid_end)
+
+    def _append(self, record: Dict, sync: bool = False):
+        data = (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o644)
+            try:
+                os.write(fd, data)
+                if sync:
+                    os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def start(self, name: str, toc: List[tuple]):
+        """记录本次下载的目录（恢复时追加新的目录记录，已完成的章节保留）"""
+        self.name = name
+        self.toc = [(title, str(chapter_id)) for title, chapter_id in toc]
+        self._append({'type': 'toc', 'novel_id': self.novel_id, 'name': name,
+                      'chapters': [list(item) for item in self.toc], 'ts': time.time()}, sync=True)
+
+    def record_chapter(self, chapter_id, title: str, offset: int, length: int):
+        """记录一个已写入章节存储的章节及其记录的偏移和长度"""
+        record = {'type': 'chapter', 'id': str(chapter_id), 'title': title, 'offset': offset, 'length': length}
+        self._append(record)
+        self.completed[record['id']] = record
+
+    def completed_content(self, store: ChapterStore) -> Dict[str, tuple]:
+        """已完成的章节 {章节ID: (标题, 正文)}，按记录的偏移和长度从章节存储读取
+
+        偏移处的记录对不上（日志已被整理）时按章节ID查索引，都读不到的章节重新下载。
+        """
+        result = {}
+        for chapter_id, record in self.completed.items():
+            content = None
+            if 'offset' in record:
+                content = store.read_at(chapter_id, record['offset'], record['length'])
+            if content is None:
+                content = store.get(chapter_id)
+            if content:
+                result[chapter_id] = (record['title'], content)
+        return result
+
+    def finish(self):
+        """下载完成，删除日志"""
+        with self._lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+        self.completed = {}
+
+
+@dataclass
+class DownloadJob:
+    """单本小说一次下载的运行状态
+    
+    原先挂在NovelDownloader实例上的zj/cs/tcs/failed_chapters等字段移到这里，
+    每个下载任务持有自己的DownloadJob，同一进程同时下载多本书时进度文件和失败列表互不干扰。
+    """
+    novel_id: str = ''
+    chapters: Dict[str, str] = field(default_factory=dict)    # 已下载章节 (原zj)
+    failed_chapters: List[Dict] = field(default_factory=list) # [{'title', 'chapter_id', 'reason'}]
+    failure_counter: AtomicCounter = field(default_factory=AtomicCounter)       # 触发Cookie刷新 (原tcs)
+    empty_streak: AtomicCounter = field(default_factory=AtomicCounter)          # 连续空内容计数
+    total_empty: AtomicCounter = field(default_factory=AtomicCounter)           # 总计空内容计数
+    successful_downloads: AtomicCounter = field(default_factory=AtomicCounter)  # 成功下载计数
+    fallback_chapters: AtomicCounter = field(default_factory=AtomicCounter)     # 正文来自后备HTML处理的章节数
+    metadata: Optional[Dict] = None                           # 导出JSON的_metadata（含章节ID，用于增量更新）
+    last_successful_time: float = field(default_factory=time.time)
+    save_lock: threading.Lock = field(default_factory=threading.Lock, repr=False)  # 进度文件写锁
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add_chapter(self, title: str, content: str):
+        with self._lock:
+            self.chapters[title] = content
+
+    def add_failed_chapter(self, title: str, chapter_id: str, reason: str):
+        with self._lock:
+            self.failed_chapters.append({'title': title, 'chapter_id': chapter_id, 'reason': reason})
+
+    def failed_snapshot(self) -> List[Dict]:
+        with self._lock:
+            return list(self.failed_chapters)
+
+    def record_success(self) -> int:
+        """记录一次成功下载，返回累计成功数"""
+        self.empty_streak.reset()
+        self.last_successful_time = time.time()
+        return self.successful_downloads.increment()
+
+    def record_empty(self) -> int:
+        """记录一次空内容，返回连续空内容次数"""
+        self.total_empty.increment()
+        return self.empty_streak.increment()
+
+
+class ConcurrencyController:
+    """AIMD自适应并发控制器（线程安全）
+    
+    成功率和延迟保持正常时，并发窗口每完成约一个窗口的请求加1（加性增）；
+    出现空内容或HTTP错误时窗口减半（乘性减），同一轮在途请求的连续失败只减一次。
+    窗口始终限制在[min_window, max_window]之间，snapshot()可随时查看当前施压程度。
+    """
+
+    def __init__(self, min_window: int, max_window: int, initial: Optional[int] = None,
+                 engine: str = 'thread', latency_tolerance: float = 2.0, success_threshold: float = 0.9):
+        self.engine = engine
+        self.min_window = max(1, int(min_window))
+        self.max_window = max(self.min_window, int(max_window))
+        start = initial if initial is not None else self.max_window
+        self.window = float(min(max(start, self.min_window), self.max_window))
+        self.latency_tolerance = latency_tolerance
+        self.success_threshold = success_threshold
+
+        self._lock = threading.Lock()
+        self._outcomes = collections.deque(maxlen=50)   # 最近的成功/失败记录
+        self._latency = None                             # 最近延迟（快速EWMA）
+        self._baseline = None                            # 基准延迟（慢速EWMA）
+        self._last_decrease = 0.0
+        self.increases = 0
+        self.decreases = 0
+
+    @classmethod
+    def from_config(cls, config: Config, engine: str = 'thread') -> 'ConcurrencyController':
+        if engine == 'async':
+            max_window = max(1, config.async_concurrency)
+            initial = min(max_window, max(config.xc, config.min_thread_count))
+        else:
+            max_window = config.max_thread_count if config.max_thread_count > 0 else config.xc
+            initial = config.xc
+        return cls(config.min_thread_count, max_window, initial=initial, engine=engine)
+
+    def limit(self) -> int:
+        """当前允许的在途请求数"""
+        with self._lock:
+            return int(self.window)
+
+    def on_success(self, latency: float):
+        with self._lock:
+            self._outcomes.append(True)
+            self._latency = latency if self._latency is None else 0.7 * self._latency + 0.3 * latency
+            self._baseline = latency if self._baseline is None else 0.95 * self._baseline + 0.05 * latency
+
+            success_rate = sum(self._outcomes) / len(self._outcomes)
+            latency_ok = self._latency <= self._baseline * self.latency_tolerance
+            if success_rate >= self.success_threshold and latency_ok and self.window < self.max_window:
+                self.window = min(self.max_window, self.window + 1.0 / self.window)
+                self.increases += 1
+
+    def on_failure(self):
+        with self._lock:
+            self._outcomes.append(False)
+            now = time.monotonic()
+            # 同一轮在途请求（约一个延迟周期内）的失败只减一次窗口
+            cooldown = max(1.0, self._latency or 0.0)
+            if now - self._last_decrease >= cooldown and self.window > self.min_window:
+                self.window = max(float(self.min_window), self.window / 2)
+                self._last_decrease = now
+                self.decreases += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            outcomes = list(self._outcomes)
+            return {
+                'engine': self.engine,
+                'window': int(self.window),
+                'window_exact': round(self.window, 2),
+                'min_window': self.min_window,
+                'max_window': self.max_window,
+                'success_rate': round(sum(outcomes) / len(outcomes), 3) if outcomes else None,
+                'latency_ms': round(self._latency * 1000, 1) if self._latency is not None else None,
+                'baseline_latency_ms': round(self._baseline * 1000, 1) if self._baseline is not None else None,
+                'increases': self.increases,
+                'decreases': self.decreases,
+            }
+
+
+class CookiePool:
+    """Cookie池：按成功/失败记录给每个Cookie评分，取用和轮换都不阻塞
+
+    新Cookie在后台线程中并行验证后才加入池；失败过多的Cookie被淘汰，
+    请求方立即换用评分最高的下一个。池内容持久化到cookie_path，下次启动直接复用。
+    """
+
+    EVICT_AFTER_FAILURES = 3    # 连续失败次数达到后淘汰
+    MIN_SCORE = 0.3             # 使用次数足够后评分低于此值淘汰
+
+    def __init__(self, size: int, validator: Callable[[str, int], bool], path: Optional[str] = None,
+                 log_callback: Optional[Callable] = None):
+        self.size = max(1, int(size))
+        self.validator = validator          # (cookie, chapter_id) -> 是否有效
+        self.path = path
+        self.log_callback = log_callback or (lambda message: None)
+
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict] = {}    # cookie -> {'success', 'failure', 'streak', 'last_used', 'validated'}
+        self._probe_chapter_id = None          # 后台验证使用的章节ID
+        self._refilling = False
+
+    @staticmethod
+    def generate() -> str:
+        return f'novel_web_id={int(time.time() * 1000) + random.randint(1000, 999999)}'
+
+    @staticmethod
+    def _score(entry: Dict) -> float:
+        # 拉普拉斯平滑的成功率，新Cookie为0.5
+        return (entry['success'] + 1) / (entry['success'] + entry['failure'] + 2)
+
+    @staticmethod
+    def _new_entry(validated: bool = False, success: int = 0, failure: int = 0) -> Dict:
+        return {'success': success, 'failure': failure, 'streak': 0, 'last_used': 0.0, 'validated': validated}
+
+    def add(self, cookie: str, validated: bool = False, success: int = 0, failure: int = 0):
+        with self._lock:
+            self._entries.setdefault(cookie, self._new_entry(validated, success, failure))
+
+    def get(self) -> str:
+        """取评分最高的Cookie（同分取最久未用的），从不阻塞"""
+        with self._lock:
+            if not self._entries:
+                # 池被清空时先用未验证的新Cookie顶上，后台再补充
+                self._entries[self.generate()] = self._new_entry()
+            cookie, entry = max(self._entries.items(),
+                                key=lambda item: (self._score(item[1]), item[1]['validated'], -item[1]['last_used']))
+            entry['last_used'] = time.monotonic()
+            return cookie
+
+    def peek(self) -> Optional[str]:
+        """当前评分最高的Cookie，只读快照（不更新last_used、不补充池，用于日志）"""
+        with self._lock:
+            if not self._entries:
+                return None
+            return max(self._entries.items(),
+                       key=lambda item: (self._score(item[1]), item[1]['validated'], -item[1]['last_used']))[0]
+
+    def record(self, cookie: str, success: bool):
+        """记录一次请求结果，失败过多时淘汰该Cookie并在后台补充"""
+        with self._lock:
+            entry = self._entries.get(cookie)
+            if entry is None:
+                return
+            if success:
+                entry['success'] += 1
+                entry['streak'] = 0
+                return
+            entry['failure'] += 1
+            entry['streak'] += 1
+            uses = entry['success'] + entry['failure']
+            if entry['streak'] < self.EVICT_AFTER_FAILURES and (uses < 5 or self._score(entry) >= self.MIN_SCORE):
+                return
+            del self._entries[cookie]
+        COOKIE_ROTATIONS.inc(reason='evicted')
+        self.log_callback(f"🍪 Cookie失败过多已淘汰: {cookie}")
+        self.refill_async()
+
+    def rotate(self, cookie: Optional[str] = None) -> str:
+        """标记cookie失败并立即返回下一个可用Cookie，同时在后台补充新Cookie"""
+        if cookie is not None:
+            self.record(cookie, False)
+        COOKIE_ROTATIONS.inc(reason='rotate')
+        self.refill_async()
+        return self.get()
+
+    def refill_async(self, chapter_id: Optional[int] = None, extra: int = 0):
+        """后台验证新Cookie补满池子；extra>0时额外换入新Cookie（主动刷新）"""
+        if self._begin_refill(chapter_id):
+            threading.Thread(target=self._refill, args=(extra,), daemon=True).start()
+
+    def refill(self, chapter_id: Optional[int] = None, extra: int = 0) -> int:
+        """同步补充Cookie，返回新加入的数量"""
+        if self._begin_refill(chapter_id):
+            return self._refill(extra)
+        return 0
+
+    def _begin_refill(self, chapter_id: Optional[int]) -> bool:
+        with self._lock:
+            if chapter_id:
+                self._probe_chapter_id = int(chapter_id)
+            # 同一时刻只有一个补充任务；还不知道可用于验证的章节时无法补充
+            if self._refilling or self._probe_chapter_id is None:
+                return False
+            self._refilling = True
+            return True
+
+    def _refill(self, extra: int = 0) -> int:
+        try:
+            with self._lock:
+                validated = sum(1 for entry in self._entries.values() if entry['validated'])
+                chapter_id = self._probe_chapter_id
+            needed = max(0, self.size - validated) + extra
+            if needed == 0:
+                return 0
+
+            # 并行验证，整批耗时约等于一次请求
+            candidates = [self.generate() for _ in range(needed)]
+            with concurrent.futures.ThreadPoolExecutor(max_workers=needed) as executor:
+                results = list(executor.map(lambda cookie: self._validate(cookie, chapter_id), candidates))
+
+            added = [cookie for cookie, ok in zip(candidates, results) if ok]
+            with self._lock:
+                for cookie in added:
+                    self._entries[cookie] = self._new_entry(validated=True, success=1)
+                self._trim()
+            if added:
+                self.log_callback(f"🍪 Cookie池补充 {len(added)}/{needed} 个，当前 {len(self)} 个")
+                self.save()
+            return len(added)
+        finally:
+            with self._lock:
+                self._refilling = False
+
+    def _validate(self, cookie: str, chapter_id: int) -> bool:
+        try:
+            return bool(self.validator(cookie, chapter_id))
+        except Exception:
+            return False
+
+    def _trim(self):
+        """超出容量时丢弃评分最低、最久未用的Cookie（调用方持有锁）"""
+        while len(self._entries) > self.size:
+            worst = min(self._entries.items(),
+                        key=lambda item: (self._score(item[1]), item[1]['validated'], item[1]['last_used']))
+            del self._entries[worst[0]]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def snapshot(self) -> List[Dict]:
+        with self._lock:
+            return [{'cookie': cookie, 'success': entry['success'], 'failure': entry['failure'],
+                     'validated': entry['validated'], 'score': round(self._score(entry), 3)}
+                    for cookie, entry in self._entries.items()]
+
+    def load(self) -> int:
+        """从cookie_path恢复（兼容旧格式：单个字符串），返回恢复的数量"""
+        if not self.path or not os.path.exists(self.path):
+            return 0
+        try:
+            with open(self.path, 'r', encoding='UTF-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return 0
+
+        if isinstance(data, str):
+            data = [data]
+        if not isinstance(data, list):
+            return 0
+        for item in data:
+            if isinstance(item, str) and item:
+                self.add(item)
+            elif isinstance(item, dict) and item.get('cookie'):
+                self.add(item['cookie'], validated=bool(item.get('validated')),
+                         success=int(item.get('success', 0)), failure=int(item.get('failure', 0)))
+        with self._lock:
+            self._trim()
+        return len(self)
+
+    def save(self):
+        if not self.path:
+            return
+        try:
+            data = [{key: item[key] for key in ('cookie', 'success', 'failure', 'validated')}
+                    for item in self.snapshot()]
+            tmp_path = f'{self.path}.tmp'
+            with open(tmp_path, 'w', encoding='UTF-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass  # 忽略保存失败，继续使用内存中的Cookie
+
+
+class HedgePolicy:
+    """对冲请求策略（线程安全）
+
+    记录首选来源的响应延迟并学习其p90；首选请求超过该时间仍未返回时才向次选来源
+    发出对冲请求，先返回有效内容的一方胜出。最近window次主请求中对冲次数不超过ratio比例，
+    保证对冲不会让请求量翻倍。
+    """
+
+    def __init__(self, ratio: float = 0.1, delay: float = 0, window: int = 200,
+                 min_samples: int = 20, default_delay: float = 1.0, min_delay: float = 0.05):
+        self.ratio = max(0.0, float(ratio))
+        self.fixed_delay = max(0.0, float(delay))
+        self.min_samples = min_samples
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+
+        self._lock = threading.Lock()
+        self._latencies = collections.deque(maxlen=window)   # 首选请求成功时的延迟(秒)
+        self._events = collections.deque(maxlen=window)      # 最近的请求: True表示发出了对冲
+        self._hedged_in_window = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    @classmethod
+    def from_config(cls, config: Config) -> 'HedgePolicy':
+        return cls(config.hedge_ratio, config.hedge_delay)
+
+    @property
+    def enabled(self) -> bool:
+        return self.ratio > 0
+
+    def _push_event(self, hedged: bool):
+        """调用方持有锁"""
+        if len(self._events) == self._events.maxlen and self._events[0]:
+            self._hedged_in_window -= 1
+        self._events.append(hedged)
+        if hedged:
+            self._hedged_in_window += 1
+
+    def on_request(self):
+        """每发出一次主请求调用一次"""
+        with self._lock:
+            self._push_event(False)
+
+    def record_latency(self, seconds: float):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def hedge_delay(self) -> float:
+        """主请求等待多久未返回才发出对冲请求"""
+        if self.fixed_delay > 0:
+            return self.fixed_delay
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < self.min_samples:
+            return self.default_delay
+        return max(self.min_delay, samples[int(len(samples) * 0.9) - 1])
+
+    def try_hedge(self) -> bool:
+        """预算允许时登记一次对冲并返回True"""
+        with self._lock:
+            primaries = len(self._events) - self._hedged_in_window
+            if self._hedged_in_window + 1 > self.ratio * max(primaries, 1) + 1:
+                return False
+            self._push_event(True)
+            self.hedges += 1
+            return True
+
+    def record_hedge_win(self):
+        with self._lock:
+            self.hedge_wins += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'hedges': self.hedges, 'hedge_wins': self.hedge_wins,
+                    'samples': len(self._latencies)}
+
+
+@dataclass
+class FetchResult:
+    """一次章节正文抓取的结果"""
+    content: str                # 解码后的正文（test_mode时为未解码内容）
+    source: str                 # 内容来源名称
+    latency: float = 0.0        # 请求+解析耗时(秒)
+    hedged: bool = False        # 是否由对冲请求取得
+    fallback: bool = False      # 正文是否来自后备HTML处理（StrippedText）
+
+
+class ContentSource(ABC):
+    """章节正文来源：构造URL、从响应中提取正文、解码
+
+    新增接口时继承此类实现url/extract/decode，并在NovelDownloader中注册到SourceRouter。
+    """
+
+    name = ''
+    label = ''
+
+    def __init__(self, downloader: 'NovelDownloader'):
+        self.downloader = downloader
+
+    @abstractmethod
+    def url(self, chapter_id: Union[str, int]) -> str:
+        """章节正文的请求URL"""
+
+    @abstractmethod
+    def extract(self, body: bytes) -> str:
+        """从响应的原始字节中提取未解码的正文"""
+
+    @abstractmethod
+    def decode(self, content: str) -> str:
+        """解码正文，失败时抛出异常"""
+
+
+class ReaderHtmlSource(ContentSource):
+    """阅读页HTML: /reader/{chapter_id}"""
+
+    name = 'reader_html'
+    label = '阅读页'
+
+    def url(self, chapter_id: Union[str, int]) -> str:
+        return f'{self.downloader.config.base_url}/reader/{chapter_id}'
+
+    def extract(self, body: bytes) -> str:
+        return self.downloader._extract_reader_content(body)
+
+    def decode(self, content: str) -> str:
+        return self.downloader._decode_reader_content(content)
+
+
+class ReaderFullApiSource(ContentSource):
+    """阅读器JSON接口: /api/reader/full?itemId={chapter_id}"""
+
+    name = 'reader_full_api'
+    label = '备用API'
+
+    def url(self, chapter_id: Union[str, int]) -> str:
+        return f'{self.downloader.config.base_url}/api/reader/full?itemId={chapter_id}'
+
+    def extract(self, body: bytes) -> str:
+        return self.downloader._extract_full_api_content(body)
+
+    def decode(self, content: str) -> str:
+        return self.downloader._decode_full_api_content(content)
+
+
+class SourceRouter:
+    """按近期表现为每个章节排列内容来源（线程安全）
+
+    每个来源记录成功率、延迟和解码失败率的指数滑动平均，章节优先请求当前表现最好的来源。
+    成功率过低的来源被标记为降级：只在其他来源都失败时才使用，
+    并每隔probe_interval秒放到首位试探一次是否已经恢复。
+    """
+
+    ALPHA = 0.1                 # 滑动平均系数
+    DEGRADED_SUCCESS = 0.5      # 成功率低于此值视为降级
+    MIN_SAMPLES = 5             # 样本数不足时不判定降级
+
+    def __init__(self, sources: List[ContentSource], probe_interval: float = 30.0):
+        self.sources = list(sources)
+        self.probe_interval = probe_interval
+        self._lock = threading.Lock()
+        self._stats = {source.name: {'success': 1.0, 'latency': None, 'decode_failure': 0.0,
+                                     'requests': 0, 'failures': 0}
+                       for source in self.sources}
+        self._last_probe = {source.name: 0.0 for source in self.sources}
+
+    def record(self, source: ContentSource, ok: bool, latency: float, decode_failed: bool = False):
+        alpha = self.ALPHA
+        with self._lock:
+            stats = self._stats[source.name]
+            stats['requests'] += 1
+            stats['success'] = (1 - alpha) * stats['success'] + alpha * (1.0 if ok else 0.0)
+            stats['decode_failure'] = (1 - alpha) * stats['decode_failure'] + alpha * (1.0 if decode_failed else 0.0)
+            if ok:
+                stats['latency'] = latency if stats['latency'] is None else (1 - alpha) * stats['latency'] + alpha * latency
+            else:
+                stats['failures'] += 1
+
+    def _is_degraded(self, stats: Dict) -> bool:
+        return stats['requests'] >= self.MIN_SAMPLES and stats['success'] < self.DEGRADED_SUCCESS
+
+    @staticmethod
+    def _score(stats: Dict) -> float:
+        return stats['success'] * (1 - stats['decode_failure']) / (1 + (stats['latency'] or 0.0))
+
+    def plan(self) -> List[ContentSource]:
+        """本章节依次尝试的来源：健康来源按评分排序，降级来源排在最后（到试探时间的排在最前）"""
+        with self._lock:
+            healthy = [source for source in self.sources if not self._is_degraded(self._stats[source.name])]
+            degraded = [source for source in self.sources if self._is_degraded(self._stats[source.name])]
+            healthy.sort(key=lambda source: self._score(self._stats[source.name]), reverse=True)
+            degraded.sort(key=lambda source: self._score(self._stats[source.name]), reverse=True)
+
+            now = time.monotonic()
+            for source in degraded:
+                if now - self._last_probe[source.name] >= self.probe_interval:
+                    self._last_probe[source.name] = now
+                    return [source] + healthy + [other for other in degraded if other is not source]
+            return healthy + degraded
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {name: {'success_rate': round(stats['success'], 3),
+                           'latency_ms': round(stats['latency'] * 1000, 1) if stats['latency'] is not None else None,
+                           'decode_failure_rate': round(stats['decode_failure'], 3),
+                           'requests': stats['requests'],
+                           'failures': stats['failures'],
+                           'degraded': self._is_degraded(stats)}
+                    for name, stats in self._stats.items()}
+
+
+class HttpClient:
+    """连接池化的HTTP客户端 - 沿用ref_main.py中NetworkManager的Session思路
+    
+    每个下载器持有一个Session，连接池大小与线程数一致，所有请求复用keep-alive连接，
+    避免每个章节都重新进行TCP+TLS握手。
+    """
+
+    def __init__(self, config: Config):
+        self.config = config
+        # 最大并发 + 对冲请求都需要连接
+        max_workers = max(config.thread_count, config.max_thread_count)
+        self.pool_size = max(1, max_workers * (2 if config.hedge_ratio > 0 else 1))
+        self.timeout = (config.connect_timeout, config.timeout)
+
+        self.session = req.Session()
+        adapter = req.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        # 统计信息（多线程共享，需要加锁）
+        self._lock = threading.Lock()
+        self.request_count = 0
+        self.error_count = 0
+        self.bytes_received = 0
+
+    def get(self, url: str, **kwargs) -> req.Response:
+        """发送GET请求，未指定timeout时使用配置的(连接超时, 读取超时)"""
+        kwargs.setdefault('timeout', self.timeout)
+        try:
+            response = self.session.get(url, **kwargs)
+        except req.RequestException:
+            with self._lock:
+                self.request_count += 1
+                self.error_count += 1
+            raise
+
+        with self._lock:
+            self.request_count += 1
+            self.bytes_received += len(response.content)
+        return response
+
+    def pool_stats(self) -> Dict[str, int]:
+        """获取连接池统计：请求数、新建连接数、复用次数、空闲连接数"""
+        connections_opened = 0
+        idle_connections = 0
+        for adapter in {id(a): a for a in self.session.adapters.values()}.values():
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                connections_opened += pool.num_connections
+                if pool.pool is not None:
+                    idle_connections += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+
+        with self._lock:
+            request_count = self.request_count
+            error_count = self.error_count
+            bytes_received = self.bytes_received
+
+        return {
+            'pool_size': self.pool_size,
+            'requests': request_count,
+            'errors': error_count,
+            'connections_opened': connections_opened,
+            'connections_reused': max(0, request_count - error_count - connections_opened),
+            'idle_connections': idle_connections,
+            'bytes_received': bytes_received,
+        }
+
+    def close(self):
+        try:
+            self.session.close()
+        except Exception:
+            pass
+
+
+class AsyncChapterEngine:
+    """基于asyncio的章节抓取引擎（可选，需要aiohttp）
+    
+    与线程池路径共用主/备用接口的解析和解码函数，但并发由AIMD窗口控制而不是线程数，
+    单个事件循环即可维持数百个在途请求。每个章节的结果以concurrent.futures.Future交回，
+    因此download_novel的结果处理、进度回调和各格式导出都无需改动。
+    """
+
+    def __init__(self, downloader: 'NovelDownloader', job: DownloadJob):
+        self.downloader = downloader
+        self.job = job
+        self.config = downloader.config
+        self._inflight = 0
+        self._delivered = set()
+
+    def run(self, chapter_list: List[tuple]):
+        """在后台线程中运行事件循环，按完成顺序产出 (future, (title, chapter_id))"""
+        results = queue.Queue()
+        thread = threading.Thread(target=self._run_loop, args=(chapter_list, results), daemon=True)
+        thread.start()
+        for _ in range(len(chapter_list)):
+            yield results.get()
+        thread.join()
+
+    def _run_loop(self, chapter_list: List[tuple], results: queue.Queue):
+        try:
+            asyncio.run(self._download_all(chapter_list, results))
+        except Exception as e:
+            # 事件循环本身出错：未完成的章节全部以该异常结束，避免调用方永久等待
+            self.downloader.log_callback(f'⚠️ 异步下载引擎异常: {str(e)}')
+            for index, chapter in enumerate(chapter_list):
+                if index not in self._delivered:
+                    future = concurrent.futures.Future()
+                    future.set_exception(e)
+                    results.put((future, chapter))
+
+    async def _download_all(self, chapter_list: List[tuple], results: queue.Queue):
+        slots = asyncio.Condition()
+        timeout = aiohttp.ClientTimeout(sock_connect=self.config.connect_timeout, sock_read=self.config.timeout)
+        connector = aiohttp.TCPConnector(limit=max(1, self.config.async_concurrency))
+
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            async def worker(index: int, title: str, chapter_id: str):
+                future = concurrent.futures.Future()
+                try:
+                    content = await self._download_chapter(session, slots, title, chapter_id)
+                    future.set_result(content)
+                except Exception as e:
+                    future.set_exception(e)
+                self._delivered.add(index)
+                results.put((future, (title, chapter_id)))
+
+            await asyncio.gather(*(worker(i, title, chapter_id)
+                                   for i, (title, chapter_id) in enumerate(chapter_list)))
+
+    async def _download_chapter(self, session, slots: asyncio.Condition, title: str, chapter_id: str) -> str:
+        """单个章节：与_download_chapter相同的重试次数、重试间隔和反爬统计（共用_accept_chapter_content和
+        _on_chapter_attempt_failed），重试前的等待不占用并发名额"""
+        downloader = self.downloader
+        attempt = 0
+        while True:
+            # 请求节奏：从全局限速器预约令牌，在占用并发名额之前等待
+            await asyncio.sleep(max(0.0, downloader.rate_limiter.reserve() - time.monotonic()))
+            downloader._write_debug_log("📡 [async] 尝试下载章节「%s」- 剩余重试次数: %s", title, self.config.retry_count - attempt)
+            CHAPTER_ATTEMPTS.inc(engine='async')
+            async with slots:
+                # 在途请求数受AIMD窗口控制
+                await slots.wait_for(lambda: self._inflight < downloader.concurrency.limit())
+                self._inflight += 1
+            started = time.monotonic()
+            try:
+                try:
+                    content = await self._fetch_content(session, chapter_id)
+                finally:
+                    async with slots:
+                        self._inflight -= 1
+                        slots.notify_all()
+                content = downloader._accept_chapter_content(title, chapter_id, content, self.job, 'async')
+            except Exception as e:
+                downloader._record_concurrency_outcome(e, time.monotonic() - started)
+                retry_delay = downloader._on_chapter_attempt_failed(title, chapter_id, e, attempt, self.job, engine='async')
+                if retry_delay is None:
+                    raise
+                await asyncio.sleep(retry_delay)
+                attempt += 1
+                continue
+            downloader._record_concurrency_outcome(None, time.monotonic() - started)
+            return content
+
+    async def _fetch_content(self, session, chapter_id: str) -> str:
+        """与_download_chapter_content相同的来源选择和对冲逻辑，每次只请求一轮，失败时由调用方重试"""
+        downloader = self.downloader
+        cookie = downloader.cookie_pool.get()
+        headers = downloader._get_randomized_headers()
+        headers['cookie'] = cookie
+        # aiohttp未安装brotli/zstd时无法解压，只声明一定支持的编码
+        headers['Accept-Encoding'] = 'gzip, deflate'
+
+        try:
+            result = await self._fetch_chapter(session, chapter_id, headers)
+        except Exception as e:
+            downloader._write_debug_log("❌ [async] 章节内容请求失败: %s", e)
+            downloader.cookie_pool.record(cookie, False)
+            raise
+        downloader.cookie_pool.record(cookie, True)
+        return result.content
+
+    async def _fetch_chapter(self, session, chapter_id: str, headers: Dict[str, str]) -> FetchResult:
+        downloader = self.downloader
+        sources = downloader.source_router.plan()
+        if downloader.hedge.enabled and len(sources) > 1:
+            return await self._fetch_chapter_hedged(session, sources, chapter_id, headers)
+
+        errors = []
+        for source in sources:
+            try:
+                return await self._fetch_from_source(session, source, chapter_id, headers)
+            except Exception as e:
+                downloader._write_debug_log("❌ [async] %s失败: %s", source.label, e)
+                errors.append(f"{source.name}: {str(e)}")
+        raise Exception(f"All download methods failed. {'; '.join(errors)}")
+
+    async def _fetch_from_source(self, session, source: ContentSource, chapter_id: str,
+                                 headers: Dict[str, str]) -> FetchResult:
+        router = self.downloader.source_router
+        capture = self.downloader.response_capture
+        tracer = self.downloader.tracer
+        started_at = time.time()
+        start = time.monotonic()
+        try:
+            body = await self._get_body(session, source.url(chapter_id), headers)
+        except Exception as e:
+            router.record(source, False, time.monotonic() - start)
+            capture.record(chapter_id, source.name, getattr(e, 'status', None), None, e)
+            observe_source_request(source.name, 'http_error', time.monotonic() - start)
+            raise
+        fetched = time.monotonic()
+        tracer.add('chapter.fetch', started_at, fetched - start, async_id=f'{chapter_id}-{source.name}',
+                   chapter_id=chapter_id, source=source.name, bytes=len(body))
+        try:
+            extracted = source.extract(body)
+            parsed = time.monotonic()
+            content = source.decode(extracted)
+            tracer.add('chapter.parse', started_at + fetched - start, parsed - fetched,
+                       chapter_id=chapter_id, source=source.name)
+            tracer.add('chapter.decode', started_at + parsed - start, time.monotonic() - parsed,
+                       chapter_id=chapter_id, source=source.name)
+        except Exception as e:
+            router.record(source, False, time.monotonic() - start, decode_failed=True)
+            capture.record(chapter_id, source.name, 200, body, e)
+            observe_source_request(source.name, 'decode_error', fetched - start, time.monotonic() - fetched, len(body))
+            raise
+        latency = time.monotonic() - start
+        router.record(source, True, latency)
+        observe_source_request(source.name, 'ok', fetched - start, start + latency - fetched, len(body))
+        return FetchResult(content, source.name, latency, fallback=isinstance(content, StrippedText))
+
+    async def _fetch_primary(self, session, source: ContentSource, chapter_id: str,
+                             headers: Dict[str, str]) -> FetchResult:
+        hedge = self.downloader.hedge
+        hedge.on_request()
+        result = await self._fetch_from_source(session, source, chapter_id, headers)
+        hedge.record_latency(result.latency)
+        return result
+
+    async def _fetch_chapter_hedged(self, session, sources: List[ContentSource], chapter_id: str,
+                                    headers: Dict[str, str]) -> FetchResult:
+        """与NovelDownloader._fetch_chapter_hedged相同的对冲逻辑，未胜出的请求直接取消"""
+        hedge = self.downloader.hedge
+        fallbacks = iter(sources[1:])
+        primary = asyncio.ensure_future(self._fetch_primary(session, sources[0], chapter_id, headers))
+        tasks = {primary: sources[0]}
+        errors = []
+        hedge_task = None
+
+        try:
+            await asyncio.wait([primary], timeout=hedge.hedge_delay())
+            if not primary.done() and hedge.try_hedge():
+                source = next(fallbacks)
+                hedge_task = asyncio.ensure_future(self._fetch_from_source(session, source, chapter_id, headers))
+                tasks[hedge_task] = source
+
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    error = task.exception()
+                    if error is None:
+                        result = task.result()
+                        if task is hedge_task:
+                            result.hedged = True
+                            hedge.record_hedge_win()
+                        return result
+                    self.downloader._write_debug_log("❌ [async] %s失败: %s", tasks[task].label, error)
+                    errors.append(f"{tasks[task].name}: {str(error)}")
+
+                if not pending:
+                    source = next(fallbacks, None)
+                    if source is not None:
+                        task = asyncio.ensure_future(self._fetch_from_source(session, source, chapter_id, headers))
+                        tasks[task] = source
+                        pending = {task}
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        raise Exception(f"All download methods failed. {'; '.join(errors)}")
+
+    @staticmethod
+    async def _get_body(session, url: str, headers: Dict[str, str]) -> bytes:
+        """返回响应的原始字节，由解析器按UTF-8处理（不做编码探测）"""
+        async with session.get(url, headers=headers) as response:
+            response.raise_for_status()
+            return await response.read()
+
+
+@dataclass
+class CapturedResponse:
+    """一次失败的章节请求留下的原始响应（响应体截断到ResponseCapture.max_body字节）"""
+    chapter_id: str
+    source: str
+    status: Optional[int]
+    body: bytes
+    size: int                   # 截断前的响应字节数
+    error: str = ''
+    captured_at: float = field(default_factory=time.time)
+
+    def text(self, limit: Optional[int] = None) -> str:
+        return self.body[:limit].decode('utf-8', errors='replace')
+
+
+class ResponseCapture:
+    """最近失败的章节原始响应
+
+    抓取层在请求或解析失败时把响应放进这里，每个章节只保留最后一次，
+    按章节数量限定容量（最久未更新的先淘汰），诊断时直接读取，不再重新请求已经失败的接口。
+    章节最终失败时按采样率把响应写入失败日志，日志超过大小上限后轮转为.gz压缩文件。
+    """
+
+    def __init__(self, capacity: int = 64, max_body: int = 64 * 1024, log_path: Optional[str] = None,
+                 max_bytes: int = 5 * 1024 * 1024, backups: int = 3, sample_rate: float = 0.2):
+        self.capacity = max(1, capacity)
+        self.max_body = max_body
+        self.log_path = log_path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.sample_rate = sample_rate
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._handler = None
+        self.persisted = 0
+
+    @classmethod
+    def from_config(cls, config: 'Config', base_dir: str) -> 'ResponseCapture':
+        log_path = os.path.join(base_dir, config.failure_log_file) if config.failure_log_file else None
+        return cls(capacity=config.response_capture_size, log_path=log_path,
+                   max_bytes=int(config.failure_log_max_mb * 1024 * 1024),
+                   backups=config.failure_log_backups, sample_rate=config.failure_log_sample_rate)
+
+    def record(self, chapter_id, source: str, status: Optional[int], body: Optional[bytes], error=''):
+        body = body or b''
+        entry = CapturedResponse(str(chapter_id), source, status, body[:self.max_body], len(body), str(error))
+        with self._lock:
+            self._entries.pop(entry.chapter_id, None)
+            self._entries[entry.chapter_id] = entry
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def get(self, chapter_id) -> Optional[CapturedResponse]:
+        with self._lock:
+            return self._entries.get(str(chapter_id))
+
+    def persist(self, chapter_id, title: str, reason: str) -> bool:
+        """按采样率把该章节最近的失败响应写入失败日志，返回是否写入"""
+        entry = self.get(chapter_id)
+        if entry is None or not self.log_path or random.random() >= self.sample_rate:
+            return False
+        record = logging.makeLogRecord({'msg': (
+            f"==== [{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry.captured_at))}] "
+            f"章节「{title}」(ID: {entry.chapter_id}) {reason}\n"
+            f"来源: {entry.source}  状态: {entry.status}  大小: {entry.size} 字节"
+            f"{'（已截断）' if entry.size > len(entry.body) else ''}  错误: {entry.error}\n"
+            f"{entry.text()}\n"
+        )})
+        try:
+            self._get_handler().handle(record)
+        except OSError:
+            return False
+        self.persisted += 1
+        return True
+
+    def _get_handler(self) -> logging.handlers.RotatingFileHandler:
+        with self._lock:
+            if self._handler is None:
+                os.makedirs(os.path.dirname(self.log_path) or '.', exist_ok=True)
+                handler = logging.handlers.RotatingFileHandler(
+                    self.log_path, maxBytes=self.max_bytes, backupCount=self.backups,
+                    encoding='utf-8', delay=True)
+                handler.namer = lambda name: name + '.gz'
+                handler.rotator = self._gzip_rotator
+                self._handler = handler
+            return self._handler
+
+    @staticmethod
+    def _gzip_rotator(source: str, dest: str):
+        with open(source, 'rb') as src, gzip.open(dest, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(source)
+
+    def close(self):
+        with self._lock:
+            if self._handler is not None:
+                self._handler.close()
+                self._handler = None
+
+
+class Tracer:
+    """下载各阶段的追踪span，每个完成的span写成JSONL文件中的一行
+
+    字段沿用Chrome trace事件格式（ts/dur为微秒，pid/tid区分进程和线程），
+    convert_trace_to_chrome()可把文件转换成trace viewer（chrome://tracing、Perfetto）能直接加载的JSON。
+    未配置trace_file时所有方法直接返回。
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.enabled = bool(path)
+        self._file = None
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attrs):
+        """记录with块的耗时，块内可往yield出的dict中补充属性；异常会记录在error属性中"""
+        if not self.enabled:
+            yield attrs
+            return
+        started_at = time.time()
+        start = time.perf_counter()
+        try:
+            yield attrs
+        except BaseException as e:
+            attrs['error'] = f'{type(e).__name__}: {e}'
+            raise
+        finally:
+            self.add(name, started_at, time.perf_counter() - start, **attrs)
+
+    def add(self, name: str, started_at: float, duration: float, async_id: Optional[str] = None, **attrs):
+        """记录一个已经结束的span：started_at为time.time()，duration为秒
+
+        asyncio协程中的span在同一线程内交错，传入async_id后按异步事件导出，不要求嵌套。
+        """
+        if not self.enabled:
+            return
+        record = {
+            'name': name,
+            'ts': int(started_at * 1e6),
+            'dur': int(duration * 1e6),
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'thread': threading.current_thread().name,
+            'args': attrs,
+        }
+        if async_id is not None:
+            record['async_id'] = str(async_id)
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            try:
+                if self._file is None:
+                    os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                    self._file = open(self.path, 'a', encoding='utf-8')
+                self._file.write(line + '\n')
+                self._file.flush()
+            except OSError:
+                self.enabled = False  # 追踪文件不可写时停止追踪，不影响下载
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def traced(name: str):
+    """把方法调用记录为一个span（实例需要有tracer属性）"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with self.tracer.span(name):
+                return func(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def convert_trace_to_chrome(trace_path: str, output_path: Optional[str] = None) -> str:
+    """把Tracer写出的JSONL转换为Chrome trace事件格式的JSON文件，返回输出路径"""
+    output_path = output_path or os.path.splitext(trace_path)[0] + '.json'
+    events = []
+    thread_names = {}
+    with open(trace_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # 进程中途退出时写了一半的行
+            base = {'name': record['name'], 'cat': record['name'].split('.')[0],
+                    'pid': record['pid'], 'tid': record['tid'], 'args': record.get('args', {})}
+            thread_names[(record['pid'], record['tid'])] = record.get('thread', '')
+            if 'async_id' in record:
+                events.append({**base, 'ph': 'b', 'id': record['async_id'], 'ts': record['ts']})
+                events.append({**base, 'ph': 'e', 'id': record['async_id'], 'ts': record['ts'] + record['dur']})
+            else:
+                events.append({**base, 'ph': 'X', 'ts': record['ts'], 'dur': record['dur']})
+    for (pid, tid), thread_name in thread_names.items():
+        events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': thread_name}})
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
+    return output_path
+
+
+_open_debug_loggers = weakref.WeakSet()  # 退出时需要写出剩余日志的DebugLogger
+
+
+@atexit.register
+def _close_debug_loggers():
+    """进程退出时关闭所有仍打开的调试日志（只注册一次，不为每个实例各注册一个handler）"""
+    for debug_logger in list(_open_debug_loggers):
+        debug_logger.close()
+
+
+class DebugLogger:
+    """异步调试日志
+
+    调用线程只把 (时间戳, 格式串, 参数) 放进队列，不格式化、不做文件IO；
+    由单个后台写线程按批取出、格式化（%风格，和logging模块一致）后一次写入并flush。
+    既不输出到控制台也不写文件时enabled为False，调用方直接返回，连参数都不会被格式化。
+    """
+
+    def __init__(self, path: Optional[str] = None, console: Optional[Callable[[str], None]] = None,
+                 batch_size: int = 256, flush_interval: float = 0.5):
+        self.path = path
+        self.console = console
+        self.enabled = bool(path or console)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._file = None
+        self._writer = None
+        self._start_lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        if self.enabled:
+            _open_debug_loggers.add(self)
+
+    def log(self, message: str, *args):
+        if not self.enabled:
+            return
+        self._queue.put((time.time(), message, args))
+        if self._writer is None:
+            self._start_writer()
+
+    def _start_writer(self):
+        with self._start_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run, name='debug-log-writer', daemon=True)
+                self._writer.start()
+
+    def flush(self, timeout: float = 5.0):
+        """等待此前放入队列的日志全部写出"""
+        if self._writer is None:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self):
+        """写出剩余日志并停止写线程（可重复调用）"""
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join(timeout=5)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        _open_debug_loggers.discard(self)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            records = [item for item in batch if isinstance(item, tuple)]
+            if records:
+                self._write(records)
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+            if None in batch:
+                return
+            if len(batch) < self.batch_size:
+                # 队列已空：稍等一会儿再取，让下一批攒够更多日志
+                time.sleep(self.flush_interval)
+
+    def _write(self, records: List[tuple]):
+        lines = []
+        for timestamp, message, args in records:
+            try:
+                text = message % args if args else message
+            except (TypeError, ValueError) as e:
+                text = f"{message} {args!r} (日志格式化失败: {e})"
+            lines.append(f"[{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))}] {text}")
+
+        if self.console:
+            for line in lines:
+                try:
+                    self.console(line)
+                except Exception:
+                    pass
+        if self.path:
+            try:
+                if self._file is None:
+                    os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                    self._file = open(self.path, 'a', encoding='utf-8')
+                self._file.write('\n'.join(lines) + '\n')
+                self._file.flush()
+                self.written += len(lines)
+            except OSError:
+                # 避免日志写入失败影响主程序
+                self.dropped += len(lines)
+
+
 class NovelDownloader:
     def __init__(self,
                  config: Config,
@@ -222,6 +2661,12 @@ class NovelDownloader:
         # Use absolute paths based on script location
         self.script_dir = os.path.dirname(os.path.abspath(__file__))
         self.data_dir = os.path.join(self.script_dir, 'data')
+
+        # 调试日志：level为debug时输出到控制台，save_to_file为true时写入log_file
+        self.debug_log = DebugLogger(
+            os.path.join(self.script_dir, self.config.log_file) if self.config.save_log_to_file else None,
+            console=self.log_callback if self.config.log_level == 'debug' else None,
+        )
         
         # 使用配置文件中的目录设置 (简化版)
         self.bookstore_dir = os.path.join(self.script_dir, self.config.bookstore_dir)  # JSON文件目录
@@ -229,6 +2674,20 @@ class NovelDownloader:
         
         self.record_path = os.path.join(self.data_dir, 'record.json')
         self.config_path = os.path.join(self.data_dir, 'config.json')
+
+        # 书库目录，下载完成时更新，列出已下载小说时不再读取每本书的JSON
+        self.catalog = LibraryCatalog(os.path.join(self.bookstore_dir, LibraryCatalog.FILE_NAME),
+                                      scan=self._scan_catalog_entries)
+        # 章节存储的压缩编码，各本小说共用训练出的字典
+        self.chapter_codec = ChapterCodec.from_config(self.config, self.bookstore_dir, self.log_callback)
+        # 进行中下载的恢复日志
+        self.journal_dir = os.path.join(self.bookstore_dir, 'journals')
+        # 跨任务共用的章节缓存；不使用书库的压缩字典，其他书库目录的进程也能读取
+        self.chapter_cache = ChapterCache(
+            os.path.join(self.script_dir, self.config.chapter_cache_file) if self.config.chapter_cache_file else None,
+            self.config.chapter_cache_mb * 1024 * 1024,
+            ChapterCodec(self.chapter_codec.encoding, self.config.compression_level, auto_train=False),
+            self.log_callback)
         
         # Cookie路径根据配置决定
         if self.config.cookie_mode == "file":
@@ -236,34 +2695,57 @@ class NovelDownloader:
         else:
             self.cookie_path = os.path.join(self.data_dir, 'cookie.json')
 
-        self.CODE = [[58344, 58715], [58345, 58716]]
+        self.CODE = CHARSET_CODE_RANGES
+
+        # 解码表由所有实例共享，首次解码时才加载charset.json
+        self.charset_path = os.path.join(self.script_dir, 'charset.json')
+
+        # 连接池化的HTTP客户端（所有请求共享）
+        self.http = HttpClient(self.config)
+
+        # 最近失败的原始响应，失败诊断不再重新请求
+        self.response_capture = ResponseCapture.from_config(self.config, self.script_dir)
+
+        # 阶段追踪（logging.trace_file）
+        self.tracer = Tracer(os.path.join(self.script_dir, self.config.trace_file) if self.config.trace_file else None)
+
+        # 全局限速器：所有章节请求按同一个速率发出
+        self.rate_limiter = RateLimiter.from_config(self.config)
 
-        # Load charset for text decoding
-        charset_path = os.path.join(self.script_dir, 'charset.json')
-        with open(charset_path, 'r', encoding='UTF-8') as f:
-            self.charset = json.load(f)
+        # AIMD自适应并发：根据成功率和延迟调整同时在途的章节请求数
+        self.concurrency = ConcurrencyController.from_config(self.config)
+
+        # 章节正文来源，按近期成功率/延迟/解码失败率排序
+        self.source_router = SourceRouter([ReaderHtmlSource(self), ReaderFullApiSource(self)])
+
+        # 对冲请求：首选来源响应慢于p90时同时请求次选来源，取先返回的有效结果
+        self.hedge = HedgePolicy.from_config(self.config)
+        self._hedge_executor = None
+        self._hedge_executor_lock = threading.Lock()
+
+        # 小说详情页缓存: novel_id -> BookPage（LRU，写入时清理过期项）
+        self._book_pages = collections.OrderedDict()
+        self._book_pages_lock = threading.Lock()
 
         self._setup_directories()
         self._init_cookie()
 
-        # Add these variables
-        self.zj = {}  # For storing chapter data
-        self.cs = 0  # Chapter counter
-        self.tcs = 0  # Test counter
         self.tzj = None  # Test chapter ID
-        self.book_json_path = None  # Current book's JSON path
-        
-        # 反爬检测和自适应延时
-        self.empty_content_count = 0  # 连续空内容计数
-        self.total_empty_count = 0    # 总计空内容计数
-        self.adaptive_delay_multiplier = 1.0  # 自适应延时倍数
-        self.last_successful_time = time.time()  # 上次成功时间
-        
-        # 🔄 策略2：成功下载计数器（用于主动Cookie刷新）
-        self.successful_downloads = 0
-        
-        # 📝 失败章节记录（用于生成error.log）
-        self.failed_chapters = []  # 格式: [{'title': str, 'chapter_id': str, 'reason': str}]
+
+        # 每次下载的状态（章节、计数器、失败记录）保存在DownloadJob中；
+        # 未指定job的单章节调用（Web服务修复章节、按格式单独下载）共用这个默认job
+        self.default_job = DownloadJob()
+
+    def close(self):
+        """释放连接池等网络资源"""
+        self.cookie_pool.save()
+        if self._hedge_executor is not None:
+            self._hedge_executor.shutdown(wait=False)
+        self.http.close()
+        self.response_capture.close()
+        self.chapter_cache.close()
+        self.tracer.close()
+        self.debug_log.close()
 
     def _setup_directories(self):
         """Create necessary directories if they don't exist"""
@@ -280,21 +2762,46 @@ class NovelDownloader:
                 os.makedirs(log_dir, exist_ok=True)
 
     def _init_cookie(self):
-        """Initialize cookie for downloads - 简化版本，直接使用默认cookie"""
+        """Initialize cookie pool - 优先复用cookie_path中保存的Cookie，无需等待验证"""
         self.log_callback('正在初始化cookie')
-        
-        # 直接使用时间戳生成默认cookie，无需验证
-        base_timestamp = int(time.time() * 1000)
-        self.cookie = f'novel_web_id={base_timestamp}'
-        
+
+        self.cookie_pool = CookiePool(self.config.cookie_pool_size, self._validate_cookie,
+                                      self.cookie_path, log_callback=self._write_debug_log)
+        if self.config.cookie_mode == "manual" and self.config.manual_cookie:
+            self.cookie_pool.add(self.config.manual_cookie, validated=True)
+        restored = self.cookie_pool.load()
+
+        if len(self.cookie_pool) == 0:
+            # 直接使用时间戳生成默认cookie，新Cookie在第一次下载时于后台验证补充
+            self.cookie_pool.add(f'novel_web_id={int(time.time() * 1000)}')
+
         # 保存cookie到文件
-        try:
-            with open(self.cookie_path, 'w', encoding='UTF-8') as f:
-                json.dump(self.cookie, f)
-        except Exception:
-            pass  # 忽略保存失败，继续使用内存中的cookie
-            
-        self.log_callback('Cookie初始化完成')
+        self.cookie_pool.save()
+
+        self.log_callback(f'Cookie初始化完成 (复用 {restored} 个)' if restored else 'Cookie初始化完成')
+
+    @property
+    def cookie(self) -> str:
+        """当前评分最高的Cookie"""
+        return self.cookie_pool.get()
+
+    @cookie.setter
+    def cookie(self, value: str):
+        self.cookie_pool.add(value, validated=True)
+
+    @property
+    def decoder(self) -> GlyphDecoder:
+        """进程内共享的字体解码器（charset.json修改后自动重新加载）"""
+        return load_glyph_decoder(self.charset_path)
+
+    @property
+    def charset(self):
+        return self.decoder.charset
+
+    def _validate_cookie(self, cookie: str, chapter_id: int) -> bool:
+        """用一次章节请求验证Cookie（后台线程调用，同样遵守全局限速）"""
+        self.rate_limiter.acquire()
+        return len(self._download_chapter_content(chapter_id, test_mode=True, cookie=cookie)) > 200
 
     def _default_progress(self, current: int, total: int, desc: str = '',
                           chapter_title: str = None):
@@ -309,27 +2816,10 @@ class NovelDownloader:
             'chapter_title': chapter_title
         }
     
-    def _write_debug_log(self, message: str):
-        """写入调试日志到文件和控制台"""
-        import datetime
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_message = f"[{timestamp}] {message}"
-        
-        # 输出到控制台（如果启用了详细日志）
-        if hasattr(self.config, 'log_level') and self.config.log_level == 'debug':
-            self.log_callback(log_message)
-        
-        # 写入日志文件
-        log_dir = "logs"
-        os.makedirs(log_dir, exist_ok=True)
-        log_file = os.path.join(log_dir, "download_debug.log")
-        
-        try:
-            with open(log_file, 'a', encoding='utf-8') as f:
-                f.write(log_message + '\n')
-        except Exception as e:
-            # 避免日志写入失败影响主程序
-            pass
+    def _write_debug_log(self, message: str, *args):
+        """写入调试日志（%风格的延迟格式化，调试日志关闭时不做任何格式化）"""
+        if self.debug_log.enabled:
+            self.debug_log.log(message, *args)
 
     def _get_randomized_headers(self) -> Dict[str, str]:
         """🎭 策略3：生成高度真实化的随机请求头，模拟真实用户行为（20+种变化）"""
@@ -406,8 +2896,8 @@ class NovelDownloader:
             'gzip, br, deflate'
         ]
         
-        # 🔗 真实的Connection选项
-        connections = ['keep-alive', 'close']
+        # 🔗 Connection固定为keep-alive，'close'会让连接池中的连接失效
+        connections = ['keep-alive']
         
         # 💾 真实的Cache-Control选项
         cache_controls = [
@@ -497,7 +2987,7 @@ class NovelDownloader:
             randomized_headers['Pragma'] = 'no-cache'
             
         # 🌍 Host头部（总是设置为目标站点）
-        randomized_headers['Host'] = 'fanqienovel.com'
+        randomized_headers['Host'] = urlparse(self.config.base_url).netloc
         
         # 🔧 浏览器特有的其他头部
         
@@ -517,27 +3007,19 @@ class NovelDownloader:
         
         # 📊 记录使用的请求头类型（用于调试）
         browser_type = 'Chrome' if is_chrome else 'Firefox' if is_firefox else 'Safari' if is_safari else 'Edge' if is_edge else 'Unknown'
-        self._write_debug_log(f"🎭 使用{browser_type}请求头模拟，共{len(randomized_headers)}个头部")
+        self._write_debug_log("🎭 使用%s请求头模拟，共%s个头部", browser_type, len(randomized_headers))
         
         return randomized_headers
 
-    def _smart_reading_pause(self, chapter_title: str = ""):
-        """🎭 策略3：模拟真实阅读行为的随机暂停 (0-5秒)"""
-        pause_duration = random.uniform(0, 5.0)  # 0到5秒的随机暂停
-        
-        if pause_duration > 0.1:  # 只记录超过0.1秒的暂停
-            self._write_debug_log(f"🎭 模拟阅读暂停 {pause_duration:.2f}秒 {'- ' + chapter_title if chapter_title else ''}")
-        
-        time.sleep(pause_duration)
-
-    def _should_refresh_cookie_proactively(self) -> bool:
+    def _should_refresh_cookie_proactively(self, successful_downloads: int) -> bool:
         """🔄 策略2：检查是否应该主动刷新Cookie"""
         # 🚨 更激进：每20个章节主动刷新一次
-        return hasattr(self, 'successful_downloads') and self.successful_downloads > 0 and self.successful_downloads % 20 == 0
+        return successful_downloads > 0 and successful_downloads % 20 == 0
 
-    def _generate_error_log(self, output_dir: str):
+    def _generate_error_log(self, output_dir: str, job: DownloadJob):
         """📝 生成error.log文件记录最终失败的章节"""
-        if not self.failed_chapters:
+        failed_chapters = job.failed_snapshot()
+        if not failed_chapters:
             return  # 没有失败章节就不生成
         
         error_log_path = os.path.join(output_dir, "error.log")
@@ -546,32 +3028,37 @@ class NovelDownloader:
             with open(error_log_path, 'w', encoding='utf-8') as f:
                 f.write("# 章节下载失败记录\n")
                 f.write(f"# 生成时间: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
-                f.write(f"# 失败章节总数: {len(self.failed_chapters)}\n")
+                f.write(f"# 失败章节总数: {len(failed_chapters)}\n")
                 f.write("# 格式: 章节标题 | 章节ID | 失败原因\n")
                 f.write("=" * 80 + "\n\n")
                 
-                for failed in self.failed_chapters:
+                for failed in failed_chapters:
                     title = failed.get('title', '未知标题')
                     chapter_id = failed.get('chapter_id', '未知ID')
                     reason = failed.get('reason', '未知原因')
                     f.write(f"{title} | {chapter_id} | {reason}\n")
             
-            self.log_callback(f"📝 已生成失败章节记录: {error_log_path} ({len(self.failed_chapters)}个失败章节)")
-            self._write_debug_log(f"📝 error.log已生成: {error_log_path}")
+            self.log_callback(f"📝 已生成失败章节记录: {error_log_path} ({len(failed_chapters)}个失败章节)")
+            self._write_debug_log("📝 error.log已生成: %s", error_log_path)
             
         except Exception as e:
             self.log_callback(f"⚠️ 生成error.log失败: {str(e)}")
-            self._write_debug_log(f"⚠️ 生成error.log失败: {str(e)}")
+            self._write_debug_log("⚠️ 生成error.log失败: %s", e)
 
     def download_novel(self, novel_id: int) -> str:
         """Download a novel"""
+        with self.tracer.span('download_novel', novel_id=str(novel_id)) as span:
+            result = self._download_novel(novel_id)
+            span['result'] = result
+            return result
+
+    def _download_novel(self, novel_id: int) -> str:
         try:
-            # 📝 重置失败章节记录（每个小说单独记录）
-            self.failed_chapters = []
-            
-            name, chapters, status = self._get_chapter_list(novel_id)
-            if name == 'err':
+            # 详情页只获取一次，章节列表和EPUB元数据共用；下载/更新总是重新请求，以拿到最新目录
+            book_page = self._get_book_page(novel_id, refresh=True)
+            if not book_page.is_valid():
                 return 'err'
+            name, chapters, status = book_page.title, book_page.chapters, book_page.status
 
             safe_name = self._sanitize_filename(name)
             self.log_callback(f'\n开始下载《{name}》，状态：{status[0]}')
@@ -589,187 +3076,210 @@ class NovelDownloader:
             
             self.log_callback(f'创建文件夹: {book_folder_name}')
 
+            # JSON只在下载结束时按export_json导出一次
+            json_path = os.path.join(book_json_dir, f'{safe_name}.json')
+            # 章节逐个追加到章节存储，下载进度由恢复日志记录，下载过程中不重写JSON
+            store = ChapterStore(book_json_dir, self.chapter_codec)
+            # 本次下载的状态（失败章节单独记录）
+            job = DownloadJob(novel_id=str(novel_id))
+            job.metadata = {
+                'novel_id': str(novel_id),
+                'name': name,
+                'status': status[0] if status else None,
+                'last_updated': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'chapters': {str(chapter_id): title for title, chapter_id in chapters.items()},
+            }
+
             # 使用原始章节列表的顺序
-            chapter_list = list(chapters.items())  # 转换为列表保持顺序
-            total_chapters = len(chapter_list)
-            completed_chapters = 0
+            toc = list(chapters.items())  # 转换为列表保持顺序
+            positions = {str(chapter_id): i for i, (_, chapter_id) in enumerate(toc)}
+            chapter_list = toc
 
             # 创建一个有序字典来保存章节内容
             novel_content = {}
 
-            # 下载章节
-            with tqdm(total=total_chapters, desc='下载进度') as pbar:
-                with concurrent.futures.ThreadPoolExecutor(max_workers=self.config.xc) as executor:
-                    future_to_chapter = {
-                        executor.submit(
-                            self._download_chapter,
-                            title,
-                            chapter_id,
-                            {}
-                        ): (title, chapter_id) for title, chapter_id in chapter_list
-                    }
+            # 恢复日志：上次下载中途退出时日志仍在，已完成的章节在章节存储中
+            journal = DownloadJournal(self.journal_dir, novel_id)
+            resuming = journal.exists()
+            if resuming:
+                self.log_callback(f'♻️ 发现未完成的下载：已完成 {len(journal.completed)}/{len(journal.toc) or len(toc)} 章，'
+                                  f'从中断处继续，中断时正在下载的章节重新排队')
+            journal.start(name, toc)
+
+            # 恢复下载：只跳过恢复日志中记录为已完成的章节，按记录的偏移从章节存储读回
+            resumed = journal.completed_content(store) if resuming else {}
+            reused = {title: resumed[str(chapter_id)][1] for title, chapter_id in toc if str(chapter_id) in resumed}
+            chapter_list = [(title, chapter_id) for title, chapter_id in toc if str(chapter_id) not in resumed]
+            if resumed:
+                CHAPTERS_REUSED.inc(len(reused))
+                self.log_callback(f'♻️ 从恢复日志读回 {len(reused)} 章')
+            # 增量更新：和已保存的章节按章节ID对比，已下载的章节直接复用
+            if self.config.incremental_update:
+                saved, chapter_list = self._plan_incremental_update(store, json_path, toc, resumed_ids=frozenset(resumed))
+                reused.update(saved)
+            for title, content in reused.items():
+                novel_content[title] = content
+                job.add_chapter(title, content)
+            total_chapters = len(chapter_list)
+            completed_chapters = 0
 
-                    for future in concurrent.futures.as_completed(future_to_chapter):
-                        title, chapter_id = future_to_chapter[future]
-                        try:
-                            content = future.result()
-                            if content:
-                                # 记录详细的章节下载信息
-                                self._write_debug_log(f"✅ 成功下载章节: 「{title}」(ID: {chapter_id}) - 内容长度: {len(content)} 字符")
-                                
-                                # 🚨 关键调试点：检查标题处理过程
-                                self._write_debug_log(f"🔍 【文件保存调试】开始处理章节文件保存")
-                                self._write_debug_log(f"🔍 原始title: {repr(title)} (类型: {type(title).__name__})")
-                                
-                                clean_title = title.strip()
-                                self._write_debug_log(f"🔍 clean_title: {repr(clean_title)} (类型: {type(clean_title).__name__})")
-                                
-                                novel_content[clean_title] = content
-                                
-                                # 🚨 关键调试点：文件名生成过程
-                                self._write_debug_log(f"🔍 调用_sanitize_filename前: {repr(clean_title)}")
-                                sanitized_title = self._sanitize_filename(clean_title)
-                                self._write_debug_log(f"🔍 _sanitize_filename返回: {repr(sanitized_title)} (类型: {type(sanitized_title).__name__})")
-                                
-                                chapter_filename = f"{sanitized_title}.txt"
-                                self._write_debug_log(f"🔍 chapter_filename: {repr(chapter_filename)} (类型: {type(chapter_filename).__name__})")
-                                
-                                # 🚨 关键调试点：路径拼接过程
-                                self._write_debug_log(f"🔍 chapters_dir: {repr(chapters_dir)} (类型: {type(chapters_dir).__name__})")
-                                self._write_debug_log(f"🔍 准备调用os.path.join({repr(chapters_dir)}, {repr(chapter_filename)})")
-                                
-                                chapter_path = os.path.join(chapters_dir, chapter_filename)
-                                self._write_debug_log(f"🔍 chapter_path: {repr(chapter_path)} (类型: {type(chapter_path).__name__})")
-                                
-                                # 🚨 关键调试点：文件写入过程
-                                self._write_debug_log(f"🔍 准备打开文件: {repr(chapter_path)}")
-                                with open(chapter_path, 'w', encoding='UTF-8') as f:
-                                    f.write(f"{clean_title}\n\n{content}")
-                                self._write_debug_log(f"✅ 章节文件保存成功: {chapter_path}")
-                            else:
-                                # 内容为空的情况
-                                self._write_debug_log(f"⚠️ 章节内容为空: 「{title}」(ID: {chapter_id})")
-                                self.log_callback(f"⚠️ 章节「{title}」下载失败: 内容为空")
-                                    
-                        except Exception as e:
-                            # 🚨🚨🚨 完整的错误信息输出 - 用户强调的关键需求！🚨🚨🚨
-                            self._write_debug_log(f"❌❌❌ 【完整错误报告】章节下载异常: 「{title}」(ID: {chapter_id}) ❌❌❌")
-                            self._write_debug_log(f"=" * 100)
+            # 下载章节（线程池或异步引擎，按完成顺序返回）
+            with tqdm(total=total_chapters, desc='下载进度') as pbar:
+                for future, (title, chapter_id) in self._iter_chapter_futures(chapter_list, job):
+                    try:
+                        content = future.result()
+                        if content:
+                            # 记录详细的章节下载信息
+                            self._write_debug_log("✅ 成功下载章节: 「%s」(ID: %s) - 内容长度: %s 字符", title, chapter_id, len(content))
                             
-                            # 基本信息
-                            self._write_debug_log(f"🔍 标题信息:")
-                            self._write_debug_log(f"   - 标题类型: {type(title).__name__}")
-                            self._write_debug_log(f"   - 标题内容: {repr(title)}")
-                            self._write_debug_log(f"   - 标题长度: {len(title) if title else 'None'}")
-                            self._write_debug_log(f"🔍 章节ID信息:")
-                            self._write_debug_log(f"   - 章节ID类型: {type(chapter_id).__name__}")
-                            self._write_debug_log(f"   - 章节ID内容: {repr(chapter_id)}")
+                            # 🚨 关键调试点：检查标题处理过程
+                            self._write_debug_log("🔍 【文件保存调试】开始处理章节文件保存")
+                            self._write_debug_log("🔍 原始title: %r (类型: %s)", title, type(title).__name__)
                             
-                            # 错误详情
-                            self._write_debug_log(f"❌ 错误详情:")
-                            self._write_debug_log(f"   - 错误类型: {type(e).__name__}")
-                            self._write_debug_log(f"   - 错误详情: {str(e)}")
-                            self._write_debug_log(f"   - 错误参数: {getattr(e, 'args', 'No args')}")
-                            self._write_debug_log(f"   - 完整异常信息: {repr(e)}")
+                            clean_title = title.strip()
+                            self._write_debug_log("🔍 clean_title: %r (类型: %s)", clean_title, type(clean_title).__name__)
                             
-                            # 🚨 关键：尝试获取该章节的完整响应内容
-                            self._write_debug_log(f"🌐 尝试获取该章节的完整网络响应:")
-                            try:
-                                # 强制获取该章节的原始响应
-                                test_content = self._download_chapter_content(int(chapter_id), test_mode=True)
-                                self._write_debug_log(f"📥 原始响应内容类型: {type(test_content).__name__}")
-                                self._write_debug_log(f"📥 原始响应长度: {len(test_content) if test_content else 'None'}")
-                                self._write_debug_log(f"📥 原始响应前500字符: {repr(test_content[:500]) if test_content else 'None'}")
-                                if test_content and len(test_content) > 500:
-                                    self._write_debug_log(f"📥 原始响应后200字符: {repr(test_content[-200:])}")
-                                self._write_debug_log(f"📥 完整原始响应: {repr(test_content)}")
-                            except Exception as response_error:
-                                self._write_debug_log(f"💥 获取原始响应失败: {str(response_error)}")
-                                self._write_debug_log(f"💥 响应错误类型: {type(response_error).__name__}")
-                                self._write_debug_log(f"💥 响应错误详情: {repr(response_error)}")
+                            novel_content[clean_title] = content
+                            offset, length = store.put(chapter_id, clean_title, content, positions[str(chapter_id)])
+                            journal.record_chapter(chapter_id, clean_title, offset=offset, length=length)
                             
-                            # 环境状态信息
-                            self._write_debug_log(f"🌍 环境状态:")
-                            self._write_debug_log(f"   - chapters_dir: {repr(chapters_dir)}")
-                            self._write_debug_log(f"   - chapters_dir类型: {type(chapters_dir).__name__}")
-                            self._write_debug_log(f"   - chapters_dir存在: {os.path.exists(chapters_dir) if chapters_dir else 'chapters_dir is None'}")
-                            self._write_debug_log(f"   - 当前工作目录: {repr(os.getcwd())}")
+                            # 🚨 关键调试点：文件名生成过程
+                            self._write_debug_log("🔍 调用_sanitize_filename前: %r", clean_title)
+                            sanitized_title = self._sanitize_filename(clean_title)
+                            self._write_debug_log("🔍 _sanitize_filename返回: %r (类型: %s)", sanitized_title, type(sanitized_title).__name__)
                             
-                            # 局部变量状态
-                            self._write_debug_log(f"📊 局部变量状态:")
-                            local_vars = ['content', 'clean_title', 'sanitized_title', 'chapter_filename', 'chapter_path']
-                            for var_name in local_vars:
-                                if var_name in locals():
-                                    var_value = locals()[var_name]
-                                    self._write_debug_log(f"   - {var_name}: {repr(var_value)} (类型: {type(var_value).__name__})")
-                                else:
-                                    self._write_debug_log(f"   - {var_name}: 未定义")
+                            chapter_filename = f"{sanitized_title}.txt"
+                            self._write_debug_log("🔍 chapter_filename: %r (类型: %s)", chapter_filename, type(chapter_filename).__name__)
                             
-                            # 特殊处理路径相关错误
-                            if "PathLike" in str(e) or "NoneType" in str(e):
-                                self._write_debug_log(f"🚨 检测到路径或NoneType错误 - 深度分析:")
-                                
-                                # 测试_sanitize_filename函数
-                                try:
-                                    test_title = title.strip() if title else "ERROR_None_Title"
-                                    sanitized = self._sanitize_filename(test_title)
-                                    self._write_debug_log(f"   🔧 _sanitize_filename测试: {repr(test_title)} -> {repr(sanitized)}")
-                                except Exception as sanitize_error:
-                                    self._write_debug_log(f"   💥 _sanitize_filename测试失败: {str(sanitize_error)}")
-                                    self._write_debug_log(f"   💥 _sanitize_filename错误详情: {repr(sanitize_error)}")
+                            # 🚨 关键调试点：路径拼接过程
+                            self._write_debug_log("🔍 chapters_dir: %r (类型: %s)", chapters_dir, type(chapters_dir).__name__)
+                            self._write_debug_log("🔍 准备调用os.path.join(%r, %r)", chapters_dir, chapter_filename)
                             
-                            self._write_debug_log(f"=" * 100)
-                            self._write_debug_log(f"❌❌❌ 【完整错误报告结束】 ❌❌❌")
+                            chapter_path = os.path.join(chapters_dir, chapter_filename)
+                            self._write_debug_log("🔍 chapter_path: %r (类型: %s)", chapter_path, type(chapter_path).__name__)
                             
-                            # 📝 记录最终失败的章节（用于生成error.log）
-                            failure_reason = self._get_failure_reason(e)
-                            self.failed_chapters.append({
-                                'title': title,
-                                'chapter_id': chapter_id,
-                                'reason': failure_reason
-                            })
+                            # 🚨 关键调试点：文件写入过程
+                            self._write_debug_log("🔍 准备打开文件: %r", chapter_path)
+                            with self.tracer.span('chapter.write', chapter_id=str(chapter_id)), \
+                                    open(chapter_path, 'w', encoding='UTF-8') as f:
+                                f.write(f"{clean_title}\n\n{content}")
+                            self._write_debug_log("✅ 章节文件保存成功: %s", chapter_path)
+                        else:
+                            # 内容为空的情况
+                            self._write_debug_log("⚠️ 章节内容为空: 「%s」(ID: %s)", title, chapter_id)
+                            self.log_callback(f"⚠️ 章节「{title}」下载失败: 内容为空")
+                                
+                    except Exception as e:
+                        # 🚨🚨🚨 完整的错误信息输出 - 用户强调的关键需求！🚨🚨🚨
+                        self._write_debug_log("❌❌❌ 【完整错误报告】章节下载异常: 「%s」(ID: %s) ❌❌❌", title, chapter_id)
+                        self._write_debug_log("=" * 100)
+                        
+                        # 基本信息
+                        self._write_debug_log("🔍 标题信息:")
+                        self._write_debug_log("   - 标题类型: %s", type(title).__name__)
+                        self._write_debug_log("   - 标题内容: %r", title)
+                        self._write_debug_log("   - 标题长度: %s", len(title) if title else 'None')
+                        self._write_debug_log("🔍 章节ID信息:")
+                        self._write_debug_log("   - 章节ID类型: %s", type(chapter_id).__name__)
+                        self._write_debug_log("   - 章节ID内容: %r", chapter_id)
+                        
+                        # 错误详情
+                        self._write_debug_log("❌ 错误详情:")
+                        self._write_debug_log("   - 错误类型: %s", type(e).__name__)
+                        self._write_debug_log("   - 错误详情: %s", e)
+                        self._write_debug_log("   - 错误参数: %s", getattr(e, 'args', 'No args'))
+                        self._write_debug_log("   - 完整异常信息: %r", e)
+                        
+                        # 🚨 关键：该章节最近一次失败的原始响应（抓取时已保留，不再重新请求）
+                        self._report_chapter_failure(title, chapter_id, e)
+                        
+                        # 环境状态信息
+                        self._write_debug_log("🌍 环境状态:")
+                        self._write_debug_log("   - chapters_dir: %r", chapters_dir)
+                        self._write_debug_log("   - chapters_dir类型: %s", type(chapters_dir).__name__)
+                        self._write_debug_log("   - chapters_dir存在: %s", os.path.exists(chapters_dir) if chapters_dir else 'chapters_dir is None')
+                        self._write_debug_log("   - 当前工作目录: %r", os.getcwd())
+                        
+                        # 局部变量状态
+                        self._write_debug_log("📊 局部变量状态:")
+                        local_vars = ['content', 'clean_title', 'sanitized_title', 'chapter_filename', 'chapter_path']
+                        for var_name in local_vars:
+                            if var_name in locals():
+                                var_value = locals()[var_name]
+                                self._write_debug_log("   - %s: %r (类型: %s)", var_name, var_value, type(var_value).__name__)
+                            else:
+                                self._write_debug_log("   - %s: 未定义", var_name)
+                        
+                        # 特殊处理路径相关错误
+                        if "PathLike" in str(e) or "NoneType" in str(e):
+                            self._write_debug_log("🚨 检测到路径或NoneType错误 - 深度分析:")
                             
-                            # 📝 1. 创建占位TXT文件
+                            # 测试_sanitize_filename函数
                             try:
-                                clean_title = title.strip() if title else f"第{chapter_id}章"
-                                sanitized_title = self._sanitize_filename(clean_title)
-                                chapter_filename = f"{sanitized_title}.txt"
-                                chapter_path = os.path.join(chapters_dir, chapter_filename)
-                                
-                                with open(chapter_path, 'w', encoding='UTF-8') as f:
-                                    f.write(f"{clean_title}\n\n抓取内容为空")
-                                
-                                self._write_debug_log(f"📝 已创建失败章节占位文件: {chapter_path}")
-                                
-                                # 📝 2. 添加占位内容到novel_content（用于JSON和合并TXT）
-                                novel_content[clean_title] = "抓取内容为空"
-                                
-                            except Exception as placeholder_error:
-                                self._write_debug_log(f"⚠️ 创建占位文件失败: {str(placeholder_error)}")
+                                test_title = title.strip() if title else "ERROR_None_Title"
+                                sanitized = self._sanitize_filename(test_title)
+                                self._write_debug_log("   🔧 _sanitize_filename测试: %r -> %r", test_title, sanitized)
+                            except Exception as sanitize_error:
+                                self._write_debug_log("   💥 _sanitize_filename测试失败: %s", sanitize_error)
+                                self._write_debug_log("   💥 _sanitize_filename错误详情: %r", sanitize_error)
+                        
+                        self._write_debug_log("=" * 100)
+                        self._write_debug_log("❌❌❌ 【完整错误报告结束】 ❌❌❌")
+                        
+                        # 📝 记录最终失败的章节（用于生成error.log）
+                        failure_reason = self._get_failure_reason(e)
+                        job.add_failed_chapter(title, chapter_id, failure_reason)
+                        
+                        # 📝 1. 创建占位TXT文件
+                        try:
+                            clean_title = title.strip() if title else f"第{chapter_id}章"
+                            sanitized_title = self._sanitize_filename(clean_title)
+                            chapter_filename = f"{sanitized_title}.txt"
+                            chapter_path = os.path.join(chapters_dir, chapter_filename)
+                            
+                            with open(chapter_path, 'w', encoding='UTF-8') as f:
+                                f.write(f"{clean_title}\n\n{EMPTY_CHAPTER_PLACEHOLDER}")
                             
-                            # 输出到控制台让用户看到真正的问题
-                            self.log_callback(f'❌ 下载章节失败「{title}」: {failure_reason}（已创建占位文件）')
+                            self._write_debug_log("📝 已创建失败章节占位文件: %s", chapter_path)
                             
-                            # 继续处理其他章节，但保留完整的错误记录
+                            # 📝 2. 添加占位内容到novel_content（用于JSON和合并TXT）
+                            novel_content[clean_title] = EMPTY_CHAPTER_PLACEHOLDER
+                            store.put(chapter_id, clean_title, EMPTY_CHAPTER_PLACEHOLDER, positions[str(chapter_id)])
+                            
+                        except Exception as placeholder_error:
+                            self._write_debug_log("⚠️ 创建占位文件失败: %s", placeholder_error)
+                        
+                        # 输出到控制台让用户看到真正的问题
+                        self.log_callback(f'❌ 下载章节失败「{title}」: {failure_reason}（已创建占位文件）')
+                        
+                        # 继续处理其他章节，但保留完整的错误记录
+
+                    completed_chapters += 1
+                    pbar.update(1)
+                    self.progress_callback(
+                        completed_chapters,
+                        total_chapters,
+                        '下载进度',
+                        title
+                    )
 
-                        completed_chapters += 1
-                        pbar.update(1)
-                        self.progress_callback(
-                            completed_chapters,
-                            total_chapters,
-                            '下载进度',
-                            title
-                        )
+            # 按目录顺序排列（复用的章节和本次下载的章节合并）
+            novel_content = {title: novel_content[title] for title, _ in toc if title in novel_content}
 
             # 根据配置决定保存哪些格式
             results = []
             
-            # 保存JSON文件（必须要的）
-            json_path = os.path.join(book_json_dir, f'{safe_name}.json')
-            with open(json_path, 'w', encoding='UTF-8') as f:
-                json.dump(novel_content, f, ensure_ascii=False, indent=4)
-            self.log_callback(f'✅ JSON文件已保存: {json_path}')
-            results.append('json')
+            # 章节存储是书库中的正本；明文JSON（格式不变，_metadata记录章节ID）只在export_json开启时导出
+            if self._json_export_enabled():
+                with self.tracer.span('json.dump', chapters=len(novel_content)):
+                    store.export_json(json_path, job.metadata, order=list(positions))
+                self.log_callback(f'✅ JSON文件已保存: {json_path}')
+                results.append('json')
+            journal.finish()
+            if store.needs_compaction():
+                with self.tracer.span('store.compact'):
+                    reclaimed = store.compact()
+                self.log_callback(f'🗜️ 章节存储已整理，回收 {reclaimed / 1024 / 1024:.1f} MB')
             
             # 保存TXT文件（如果启用）
             if self.config.enable_txt:
@@ -790,7 +3300,8 @@ class NovelDownloader:
             # 保存EPUB文件（如果启用）
             if self.config.enable_epub:
                 try:
-                    epub_result = self._save_epub_from_content(safe_name, novel_content, book_download_dir, novel_id)
+                    epub_result = self._save_epub_from_content(safe_name, novel_content, book_download_dir, novel_id,
+                                                               book_page)
                     if epub_result == 's':
                         self.log_callback(f'✅ EPUB文件已保存')
                         results.append('epub')
@@ -846,13 +3357,34 @@ class NovelDownloader:
                     self.log_callback(f'⚠️ PDF生成失败: {e}')
             
             # 📝 生成error.log文件（如果有失败章节）
-            self._generate_error_log(book_download_dir)
+            self._generate_error_log(book_download_dir, job)
+
+            # 📚 更新书库目录
+            output_paths = {
+                'json': json_path,
+                'txt': os.path.join(book_download_dir, f'{safe_name}.txt'),
+                'epub': os.path.join(book_download_dir, f'{safe_name}.epub'),
+                'html': os.path.join(book_download_dir, f'{safe_name}(html)'),
+                'latex': os.path.join(book_download_dir, f'{safe_name}.tex'),
+                'pdf': os.path.join(book_download_dir, f'{safe_name}.pdf'),
+            }
+            try:
+                self.catalog.record(novel_id, name, status[0] if status else None, len(novel_content),
+                                    {fmt: path for fmt, path in output_paths.items() if fmt in results},
+                                    failed_count=len(job.failed_chapters))
+            except sqlite3.Error as e:
+                self.log_callback(f'⚠️ 更新书库目录失败: {e}')
+            
+            # 🔌 连接池统计
+            stats = self.http.pool_stats()
+            self.log_callback(f"🔌 连接池统计: 请求 {stats['requests']} 次，新建连接 {stats['connections_opened']} 个，"
+                              f"复用 {stats['connections_reused']} 次，失败 {stats['errors']} 次")
             
             # 返回结果
             if results:
                 self.log_callback(f'🎉 下载完成！已保存格式: {", ".join(results)}')
-                if self.failed_chapters:
-                    self.log_callback(f'⚠️ 注意：有 {len(self.failed_chapters)} 个章节下载失败，已创建占位文件，详情请查看 error.log')
+                if job.failed_chapters:
+                    self.log_callback(f'⚠️ 注意：有 {len(job.failed_chapters)} 个章节下载失败，已创建占位文件，详情请查看 error.log')
                 return 's'
             else:
                 self.log_callback(f'⚠️ 未启用任何输出格式')
@@ -862,6 +3394,215 @@ class NovelDownloader:
             self.log_callback(f'下载失败: {str(e)}')
             return 'err'
 
+    def _json_export_enabled(self) -> bool:
+        """是否在书库中导出明文JSON：auto时只在章节存储不压缩时导出，压缩后不再保留第二份明文"""
+        if self.config.export_json == 'auto':
+            return self.chapter_codec.encoding == 'raw'
+        return bool(self.config.export_json)
+
+    def _plan_incremental_update(self, store: ChapterStore, json_path: str, toc: List[tuple],
+                                 resumed_ids: frozenset = frozenset()) -> tuple:
+        """按章节ID对比已保存的章节和当前目录，返回 (可复用的章节 {标题: 内容}, 需要请求的章节列表)
+
+        已保存的内容为空或是失败占位时重新请求。章节存储为空时读取原来的JSON
+        （没有章节ID的旧版JSON按标题对比），复用的章节同时导入章节存储。
+        已从恢复日志读回的章节（resumed_ids）已经计过数，这里跳过，不重复计入复用数。
+        """
+        pending = [(title, chapter_id) for title, chapter_id in toc if str(chapter_id) not in resumed_ids]
+        from_store = len(store) > 0
+        saved = {}
+        saved_ids = None
+        if not from_store:
+            if not os.path.exists(json_path):
+                return {}, pending
+            try:
+                with open(json_path, 'r', encoding='UTF-8') as f:
+                    saved = json.load(f)
+                if not isinstance(saved, dict):
+                    raise ValueError('不是章节字典')
+            except (OSError, ValueError) as e:
+                self.log_callback(f'⚠️ 读取已保存的JSON失败，重新下载全部章节: {e}')
+                return {}, pending
+            saved_ids = (saved.get('_metadata') or {}).get('chapters')
+
+        reused = {}
+        missing = []
+        new_chapters = 0
+        for position, (title, chapter_id) in enumerate(toc):
+            if str(chapter_id) in resumed_ids:
+                continue
+            if from_store:
+                content = store.get(chapter_id)
+            else:
+                saved_title = saved_ids.get(str(chapter_id)) if saved_ids is not None else title
+                content = saved.get(saved_title) if saved_title and not saved_title.startswith('_') else None
+            if isinstance(content, str) and content.strip() and content != EMPTY_CHAPTER_PLACEHOLDER:
+                reused[title] = content
+                if not from_store:
+                    store.put(chapter_id, title, content, position)
+            else:
+                missing.append((title, chapter_id))
+                if content is None:
+                    new_chapters += 1
+
+        CHAPTERS_REUSED.inc(len(reused))
+        self.log_callback(f'📈 增量更新: 目录共 {len(toc)} 章，'
+                          f"{f'从恢复日志读回 {len(resumed_ids)} 章，' if resumed_ids else ''}"
+                          f'已下载 {len(reused)} 章直接复用，'
+                          f'需要请求 {len(missing)} 章（新增 {new_chapters}，占位/空内容 {len(missing) - new_chapters}），'
+                          f'节省 {len(reused)} 次章节请求'
+                          f"{'（旧版JSON没有章节ID，按标题对比）' if not from_store and saved_ids is None else ''}")
+        return reused, missing
+
+    def _iter_chapter_futures(self, chapter_list: List[tuple], job: Optional[DownloadJob] = None):
+        """按完成顺序产出 (future, (title, chapter_id))，根据配置选择线程池或asyncio引擎
+        
+        job保存本次下载的进度和统计，未指定时使用默认job。
+        """
+        job = job or self.default_job
+        cached = self.chapter_cache.get_many([chapter_id for _, chapter_id in chapter_list])
+        if cached:
+            # 章节缓存中已有的章节直接产出，不占用请求令牌
+            self.log_callback(f'💾 章节缓存命中 {len(cached)}/{len(chapter_list)} 章，不再请求')
+            missing = []
+            for title, chapter_id in chapter_list:
+                content = cached.get(str(chapter_id))
+                if content is None:
+                    missing.append((title, chapter_id))
+                    continue
+                job.add_chapter(title, content)
+                future = concurrent.futures.Future()
+                future.set_result(content)
+                yield future, (title, chapter_id)
+            chapter_list = missing
+        if chapter_list:
+            # 用本书的章节在后台预热Cookie池
+            self.cookie_pool.refill_async(chapter_list[0][1])
+        limiter_start = self.rate_limiter.stats()['granted']
+        hedge_start = self.hedge.stats()
+        start_time = time.monotonic()
+
+        engine = 'async' if self.config.download_engine == 'async' and aiohttp is not None else 'thread'
+        if self.config.download_engine == 'async' and engine == 'thread':
+            self.log_callback('⚠️ 未安装aiohttp，异步下载引擎不可用，改用线程池下载')
+        if self.concurrency.engine != engine:
+            self.concurrency = ConcurrencyController.from_config(self.config, engine)
+
+        job_label = job.novel_id or 'default'
+        JOB_ELAPSED.start_timer(novel_id=job_label)
+        try:
+            if engine == 'async':
+                self.log_callback(f'⚡ 使用异步下载引擎 (并发上限: {self.config.async_concurrency})')
+                yield from AsyncChapterEngine(self, job).run(chapter_list)
+            else:
+                yield from self._dispatch_chapters(chapter_list, job)
+        finally:
+            JOB_ELAPSED.remove(novel_id=job_label)
+            JOB_DURATION.observe(time.monotonic() - start_time)
+
+        # ⏱️ 报告本次下载实际达到的请求速率
+        elapsed = time.monotonic() - start_time
+        requests_made = self.rate_limiter.stats()['granted'] - limiter_start
+        if elapsed > 0 and requests_made:
+            self.log_callback(f'⏱️ 请求速率: 实际 {requests_made / elapsed:.2f} 次/秒，'
+                              f'目标 {self.rate_limiter.target_rate():.2f} 次/秒 (共 {requests_made} 次尝试)')
+        hedge_stats = self.hedge.stats()
+        hedges = hedge_stats['hedges'] - hedge_start['hedges']
+        if hedges:
+            hedge_wins = hedge_stats['hedge_wins'] - hedge_start['hedge_wins']
+            self.log_callback(f"🔀 对冲请求: 发出 {hedges} 次，对冲请求胜出 {hedge_wins} 次")
+        for name, stats in self.source_router.snapshot().items():
+            if stats['requests']:
+                latency = f"{stats['latency_ms']:.0f}ms" if stats['latency_ms'] is not None else '-'
+                self.log_callback(f"📡 内容来源 {name}: 成功率 {stats['success_rate']:.0%}，延迟 {latency}，"
+                                  f"解码失败率 {stats['decode_failure_rate']:.0%}"
+                                  f"{'（已降级）' if stats['degraded'] else ''}")
+        if job.fallback_chapters.value:
+            self.log_callback(f"🧹 {job.fallback_chapters.value} 个章节的正文来自后备HTML处理，建议检查内容")
+        window = self.concurrency.snapshot()
+        self.log_callback(f"📶 并发窗口: 当前 {window['window']} (范围 {window['min_window']}-{window['max_window']}，"
+                          f"增加 {window['increases']} 次，减半 {window['decreases']} 次)")
+
+    def _dispatch_chapters(self, chapter_list: List[tuple], job: DownloadJob):
+        """线程池调度：主线程按令牌节奏提交章节，失败的尝试按重试间隔重新排队
+        
+        等待令牌和等待重试都发生在调度线程中，线程池里的线程只负责网络请求和解码。
+        """
+        controller = self.concurrency
+        workers = controller.max_window
+        waiting = collections.deque((title, chapter_id, 0) for title, chapter_id in chapter_list)
+        retry_heap = []           # (可重试时间, 序号, title, chapter_id, attempt)
+        retry_seq = itertools.count()
+        pending = {}
+        ready_at = None           # 已预约但尚未使用的令牌时间
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            while waiting or retry_heap or pending:
+                now = time.monotonic()
+                while retry_heap and retry_heap[0][0] <= now:
+                    _, _, title, chapter_id, attempt = heapq.heappop(retry_heap)
+                    waiting.appendleft((title, chapter_id, attempt))
+
+                # 提交章节：在途数小于AIMD窗口且令牌已到期
+                limit = controller.limit()
+                while waiting and len(pending) < limit:
+                    if ready_at is None:
+                        ready_at = self.rate_limiter.reserve()
+                    if ready_at > time.monotonic():
+                        break
+                    ready_at = None
+                    title, chapter_id, attempt = waiting.popleft()
+                    future = executor.submit(self._download_chapter_attempt, title, chapter_id, attempt, job)
+                    pending[future] = (title, chapter_id, attempt, time.monotonic())
+
+                # 等待：最早完成的章节、下一个令牌或下一个重试时间
+                wake_times = []
+                if waiting and len(pending) < limit and ready_at is not None:
+                    wake_times.append(ready_at)
+                if retry_heap:
+                    wake_times.append(retry_heap[0][0])
+                timeout = max(0.0, min(wake_times) - time.monotonic()) if wake_times else None
+                if not pending:
+                    if timeout:
+                        time.sleep(timeout)
+                    continue
+
+                done, _ = concurrent.futures.wait(
+                    pending, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    title, chapter_id, attempt, submitted_at = pending.pop(future)
+                    error = future.exception()
+                    self._record_concurrency_outcome(error, time.monotonic() - submitted_at)
+                    if error is not None:
+                        retry_delay = self._on_chapter_attempt_failed(title, chapter_id, error, attempt, job)
+                        if retry_delay is not None:
+                            heapq.heappush(retry_heap, (time.monotonic() + retry_delay, next(retry_seq),
+                                                        title, chapter_id, attempt + 1))
+                            continue
+                    yield future, (title, chapter_id)
+
+    def _record_concurrency_outcome(self, error: Optional[BaseException], latency: float):
+        """把一次尝试的结果反馈给AIMD控制器：只有空内容和网络/HTTP错误才视为服务端压力"""
+        before = self.concurrency.limit()
+        if error is None:
+            self.concurrency.on_success(latency)
+        elif self._is_backpressure_error(error):
+            self.concurrency.on_failure()
+        after = self.concurrency.limit()
+        if after != before:
+            self._write_debug_log("📶 并发窗口调整: %s -> %s", before, after)
+            if after < before:
+                self.log_callback(f"📶 检测到服务端压力，并发窗口降至 {after}")
+
+    @staticmethod
+    def _is_backpressure_error(error: BaseException) -> bool:
+        if isinstance(error, req.RequestException):
+            return True
+        if aiohttp is not None and isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError)):
+            return True
+        message = str(error)
+        return 'Chapter download failed' in message or 'All download methods failed' in message
+
     def search_novel(self, keyword: str) -> List[Dict]:
         """
         Search for novels by keyword
@@ -885,7 +3626,7 @@ class NovelDownloader:
         }
 
         try:
-            response = req.get(url, params=params, headers=self.headers)
+            response = self.http.get(url, params=params, headers=self.headers)
             response.raise_for_status()
             data = response.json()
 
@@ -916,26 +3657,9 @@ class NovelDownloader:
         raise Exception("Failed to get initial chapter ID")
 
     def _get_new_cookie(self, chapter_id: int):
-        """Generate new cookie - 优化版本，减少验证次数"""
-        base_timestamp = int(time.time() * 1000)
-        
-        # 只尝试5次，减少等待时间
-        for i in range(5):
-            cookie_id = base_timestamp + random.randint(1000, 999999)
-            time.sleep(0.1)  # 减少延迟到100ms
-            self.cookie = f'novel_web_id={cookie_id}'
-            
-            try:
-                if len(self._download_chapter_content(chapter_id, test_mode=True)) > 200:
-                    with open(self.cookie_path, 'w', encoding='UTF-8') as f:
-                        json.dump(self.cookie, f)
-                    return
-            except:
-                continue
-        
-        # 快速失败，使用默认cookie
-        self.cookie = f'novel_web_id={base_timestamp}'
-        print("⚠️ Cookie生成失败，使用默认值")
+        """Generate new cookie - 同步并行验证一批新Cookie加入Cookie池（下载过程中改用后台补充）"""
+        if not self.cookie_pool.refill(chapter_id, extra=1):
+            print("⚠️ Cookie生成失败，继续使用Cookie池中的Cookie")
 
     def _download_txt(self, novel_id: int) -> str:
         """Download novel in TXT format"""
@@ -947,13 +3671,11 @@ class NovelDownloader:
             safe_name = self._sanitize_filename(name)
             self.log_callback(f'\n开始下载《{name}》，状态：{status[0]}')
 
-            # Set book_json_path for the current download
-            self.book_json_path = os.path.join(self.bookstore_dir, f'{safe_name}.json')
-
-            # Initialize global variables for this download
-            self.zj = {}
-            self.cs = 0
-            self.tcs = 0
+            # State for the current download
+            book_json_path = os.path.join(self.bookstore_dir, f'{safe_name}.json')
+            store = ChapterStore(os.path.join(self.bookstore_dir, f'{safe_name}-{novel_id}'), self.chapter_codec)
+            positions = {title: i for i, title in enumerate(chapters)}
+            job = DownloadJob(novel_id=str(novel_id))
 
             # Store metadata at the start
             metadata = {
@@ -967,8 +3689,8 @@ class NovelDownloader:
 
             # Load existing content and merge with metadata
             existing_content = {}
-            if os.path.exists(self.book_json_path):
-                with open(self.book_json_path, 'r', encoding='UTF-8') as f:
+            if os.path.exists(book_json_path):
+                with open(book_json_path, 'r', encoding='UTF-8') as f:
                     existing_content = json.load(f)
                     # Keep existing chapters but update metadata
                     if isinstance(existing_content, dict):
@@ -976,8 +3698,9 @@ class NovelDownloader:
             else:
                 existing_content = metadata
                 # Save initial metadata
-                with open(self.book_json_path, 'w', encoding='UTF-8') as f:
-                    json.dump(existing_content, f, ensure_ascii=False)
+                if self._json_export_enabled():
+                    with open(book_json_path, 'w', encoding='UTF-8') as f:
+                        json.dump(existing_content, f, ensure_ascii=False)
 
             total_chapters = len(chapters)
             completed_chapters = 0
@@ -992,7 +3715,8 @@ class NovelDownloader:
                             self._download_chapter,
                             title,
                             chapter_id,
-                            existing_content
+                            existing_content,
+                            job
                         ): title
                         for title, chapter_id in chapters.items()
                     }
@@ -1003,10 +3727,9 @@ class NovelDownloader:
                             chapter_content = future.result()
                             if chapter_content:
                                 content[chapter_title] = chapter_content
-                                # Save progress periodically
-                                if completed_chapters % 5 == 0:
-                                    with open(self.book_json_path, 'w', encoding='UTF-8') as f:
-                                        json.dump(content, f, ensure_ascii=False)
+                                # 逐章追加保存进度，不再每5章重写整本JSON
+                                store.put(chapters[chapter_title], chapter_title, chapter_content,
+                                          positions[chapter_title])
                         except Exception as e:
                             self.log_callback(f'下载章节失败 {chapter_title}: {str(e)}')
 
@@ -1020,8 +3743,9 @@ class NovelDownloader:
                         )
 
                 # Save final content
-                with open(self.book_json_path, 'w', encoding='UTF-8') as f:
-                    json.dump(content, f, ensure_ascii=False)
+                if self._json_export_enabled():
+                    with job.save_lock, open(book_json_path, 'w', encoding='UTF-8') as f:
+                        json.dump(content, f, ensure_ascii=False)
 
                 # Generate output file
                 if self.config.save_mode == SaveMode.SINGLE_TXT:
@@ -1050,7 +3774,7 @@ class NovelDownloader:
             book.set_title(name)
             book.set_language('zh')
 
-            # Get author info and cover
+            # Get author info and cover (详情页已缓存，不会重复请求)
             author = self._get_author_info(novel_id)
             if author:
                 book.add_author(author)
@@ -1113,151 +3837,194 @@ class NovelDownloader:
                 if completed_chapters < total_chapters:
                     self.progress_callback(total_chapters, total_chapters, '下载完成')
 
-    def _download_chapter(self, title: str, chapter_id: str, existing_content: Dict) -> Optional[str]:
-        """Download a single chapter with retries and intelligent error handling"""
+    def _download_chapter(self, title: str, chapter_id: str, existing_content: Dict,
+                          job: Optional[DownloadJob] = None) -> Optional[str]:
+        """Download a single chapter with retries and intelligent error handling
+        
+        阻塞式接口（Web服务、EPUB/HTML/LaTeX单独下载等使用），每次尝试前从全局限速器取令牌；
+        download_novel的批量下载由_iter_chapter_futures调度，重试不会占用线程。
+        """
+        job = job or self.default_job
         if title in existing_content:
-            self.zj[title] = existing_content[title]
+            job.add_chapter(title, existing_content[title])
             return existing_content[title]
+        cached = self.chapter_cache.get(chapter_id)
+        if cached is not None:
+            job.add_chapter(title, cached)
+            return cached
 
         self.log_callback(f'下载章节: {title}')
-        retries = self.config.retry_count
-        last_error = None
         
         # 详细记录重试过程
-        self._write_debug_log(f"🔄 开始下载章节「{title}」(ID: {chapter_id}) - 最大重试次数: {retries}")
-        self._write_debug_log(f"📋 重试间隔配置: {self.config.retry_delays}")
+        self._write_debug_log("🔄 开始下载章节「%s」(ID: %s) - 最大重试次数: %s", title, chapter_id, self.config.retry_count)
+        self._write_debug_log("📋 重试间隔配置: %s", self.config.retry_delays)
 
-        while retries > 0:
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire()
             try:
-                self._write_debug_log(f"📡 尝试下载章节「{title}」- 剩余重试次数: {retries}")
-                
-                content = self._download_chapter_content(chapter_id)
-                
-                # 统一处理各种失败情况
-                if content == 'err' or not content or not content.strip():
-                    self.tcs += 1
-                    
-                    if content == 'err':
-                        error_msg = "API返回错误"
-                    elif not content:
-                        error_msg = "返回内容为None"
-                    else:
-                        error_msg = "返回内容为空字符串"
-                    
-                    # 更新反爬检测统计
-                    self.empty_content_count += 1
-                    self.total_empty_count += 1
-                    
-                    # 检测反爬情况并调整策略
-                    if self.empty_content_count >= 3:
-                        self.adaptive_delay_multiplier = min(5.0, self.adaptive_delay_multiplier + 0.5)
-                        self._write_debug_log(f"🚨 连续失败 {self.empty_content_count} 次，疑似反爬检测！")
-                        self._write_debug_log(f"📊 调整延时倍数至: {self.adaptive_delay_multiplier:.1f}")
-                        self.log_callback(f"🚨 检测到连续失败，已调整下载策略")
-                    
-                    # 记录详细的失败信息
-                    time_since_success = time.time() - self.last_successful_time
-                    self._write_debug_log(f"⚠️ 章节「{title}」下载异常: {error_msg}")
-                    self._write_debug_log(f"📊 失败统计 - 连续: {self.empty_content_count}, 总计: {self.total_empty_count}")
-                    self._write_debug_log(f"⏰ 距离上次成功: {time_since_success:.1f}秒")
-                    
-                    # Cookie 刷新机制
-                    if self.tcs > 7:
-                        self.tcs = 0
-                        self._write_debug_log(f"🔄 触发Cookie刷新 (chapter_id: {chapter_id})")
-                        self._get_new_cookie(self.tzj)
-                        self.log_callback(f"🔄 检测到多次失败，已刷新Cookie")
-                    
-                    raise Exception(f"Chapter download failed: {error_msg}")
+                return self._download_chapter_attempt(title, chapter_id, attempt, job)
+            except Exception as e:
+                retry_delay = self._on_chapter_attempt_failed(title, chapter_id, e, attempt, job)
+                if retry_delay is None:
+                    raise
+                time.sleep(retry_delay)
+                attempt += 1
+
+    def _download_chapter_attempt(self, title: str, chapter_id: str, attempt: int = 0,
+                                  job: Optional[DownloadJob] = None) -> str:
+        """单次下载尝试：成功返回内容并更新统计，失败抛出异常（不等待、不重试）"""
+        job = job or self.default_job
+        self._write_debug_log("📡 尝试下载章节「%s」- 剩余重试次数: %s", title, self.config.retry_count - attempt)
+        
+        CHAPTER_ATTEMPTS.inc(engine='thread')
+        content = self._download_chapter_content(chapter_id)
+        return self._accept_chapter_content(title, chapter_id, content, job, 'thread')
 
-                # 成功时更新统计信息
-                self.empty_content_count = 0  # 重置连续空内容计数
-                self.last_successful_time = time.time()
-                
-                # 🔄 策略2：增加成功下载计数器
-                self.successful_downloads += 1
-                
-                # 🔄 策略2：检查是否需要主动刷新Cookie（每20个章节）
-                if self._should_refresh_cookie_proactively():
-                    effective_chapter_id = int(chapter_id) if chapter_id else (self.tzj if self.tzj else 1)
-                    self._write_debug_log(f"🔄 策略2：第{self.successful_downloads}个章节，主动刷新Cookie (chapter_id: {effective_chapter_id})")
-                    self._get_new_cookie(effective_chapter_id)
-                    self.log_callback(f"🔄 策略2：已下载{self.successful_downloads}个章节，主动刷新Cookie（每20章节策略）")
-                
-                # 根据成功情况调整延时倍数
-                if self.adaptive_delay_multiplier > 1.0:
-                    self.adaptive_delay_multiplier = max(1.0, self.adaptive_delay_multiplier - 0.1)
-                    self._write_debug_log(f"📈 下载成功，降低延时倍数至: {self.adaptive_delay_multiplier:.1f}")
-                
-                # 🎭 策略3：模拟真实阅读行为
-                self._smart_reading_pause(title)
-                
-                # 自适应延时
-                base_delay_ms = random.randint(self.config.delay[0], self.config.delay[1])
-                actual_delay_ms = int(base_delay_ms * self.adaptive_delay_multiplier)
-                self._write_debug_log(f"⏱️ 章节「{title}」下载成功，延时 {actual_delay_ms}ms (基础:{base_delay_ms}ms × 倍数:{self.adaptive_delay_multiplier:.1f})")
-                time.sleep(actual_delay_ms / 1000)
-
-                # Save progress periodically
-                self.cs += 1
-                if self.cs >= 5:
-                    self.cs = 0
-                    self._save_progress(title, content)
-
-                self.zj[title] = content
-                self._write_debug_log(f"✅ 章节「{title}」下载完成，内容长度: {len(content)} 字符")
-                return content
+    def _accept_chapter_content(self, title: str, chapter_id: str, content: Optional[str],
+                                job: DownloadJob, engine: str) -> str:
+        """检查一次尝试得到的正文并更新反爬统计（线程池和异步引擎共用）
 
-            except Exception as e:
-                last_error = e
-                retries -= 1
-                
-                self._write_debug_log(f"❌ 章节「{title}」重试失败: {str(e)} (剩余重试: {retries})")
-                
-                if retries > 0:
-                    # 使用配置文件中的重试间隔
-                    attempt_index = self.config.retry_count - retries
-                    if attempt_index < len(self.config.retry_delays):
-                        retry_delay = self.config.retry_delays[attempt_index]
-                    else:
-                        # 如果重试次数超过配置的间隔数组，使用最后一个值
-                        retry_delay = self.config.retry_delays[-1]
-                    
-                    # 🚨 用户要求：明确失败原因
-                    failure_reason = self._get_failure_reason(e)
-                    
-                    # 🚨 策略2：更激进的Cookie刷新检查（失败1次就刷新）
-                    cookie_action = ""
-                    if self.tcs > 0:  # 策略2：失败1次就尝试刷新Cookie
-                        self.tcs = 0
-                        # 修复Cookie刷新：使用有效的chapter_id
-                        effective_chapter_id = int(chapter_id) if chapter_id else (self.tzj if self.tzj else 1)
-                        self._write_debug_log(f"🔄 策略2：失败1次即刷新Cookie (effective_chapter_id: {effective_chapter_id})")
-                        self._get_new_cookie(effective_chapter_id)
-                        cookie_action = " (策略2: 已刷新Cookie)"
-                    
-                    self._write_debug_log(f"⏳ 等待 {retry_delay}s 后重试... (重试间隔配置索引: {attempt_index})")
-                    
-                    # 🚨 用户要求：包含具体失败原因的重试日志
-                    self.log_callback(f"⚠️ 章节「{title}」下载失败 ({failure_reason})，{retry_delay}s后重试 (剩余{retries}次){cookie_action}")
-                    
-                    # 必要时输出完整响应
-                    if "内容为空" not in failure_reason and "网络" not in failure_reason:
-                        self._write_debug_log(f"📥 重试前获取完整响应内容:")
-                        try:
-                            debug_content = self._download_chapter_content(int(chapter_id), test_mode=True)
-                            self._write_debug_log(f"📥 完整响应: {repr(debug_content[:1000])}{'...' if len(debug_content) > 1000 else ''}")
-                        except:
-                            self._write_debug_log(f"📥 无法获取响应内容")
-                    
-                    time.sleep(retry_delay)
-                else:
-                    self._write_debug_log(f"💥 章节「{title}」最终下载失败: {str(e)}")
-                    self.log_callback(f'下载失败 {title}: {str(e)}')
+        空内容：计入连续空内容，连续3次时放慢全局限速，失败过多时轮换Cookie，然后抛出异常交给重试；
+        成功：更新计数，每20章主动刷新Cookie，逐步恢复限速倍数，缓存正文并加入job。
+        """
+        # 统一处理各种失败情况
+        if content == 'err' or not content or not content.strip():
+            failures = job.failure_counter.increment()
+            
+            if content == 'err':
+                error_msg = "API返回错误"
+            elif not content:
+                error_msg = "返回内容为None"
+            else:
+                error_msg = "返回内容为空字符串"
+            
+            # 更新反爬检测统计
+            empty_streak = job.record_empty()
+            CHAPTER_EMPTY.inc(engine=engine)
+            
+            # 检测反爬情况并调整策略
+            if empty_streak >= 3:
+                multiplier = self.rate_limiter.adjust_multiplier(0.5)
+                self._write_debug_log("🚨 连续失败 %s 次，疑似反爬检测！", empty_streak)
+                self._write_debug_log("📊 调整延时倍数至: %.1f", multiplier)
+                self.log_callback(f"🚨 检测到连续失败，已调整下载策略")
+            
+            # 记录详细的失败信息
+            time_since_success = time.time() - job.last_successful_time
+            self._write_debug_log("⚠️ 章节「%s」下载异常: %s", title, error_msg)
+            self._write_debug_log("📊 失败统计 - 连续: %s, 总计: %s", empty_streak, job.total_empty.value)
+            self._write_debug_log("⏰ 距离上次成功: %.1f秒", time_since_success)
+            
+            # Cookie 刷新机制
+            if failures > 7:
+                job.failure_counter.reset()
+                self._write_debug_log("🔄 触发Cookie刷新 (chapter_id: %s)", chapter_id)
+                self.cookie_pool.rotate()
+                self.log_callback(f"🔄 检测到多次失败，已切换Cookie")
+            
+            raise Exception(f"Chapter download failed: {error_msg}")
 
-        if last_error:
-            raise last_error
-        return None
+        # 成功时更新统计信息（重置连续空内容计数，增加成功下载计数）
+        successful_downloads = job.record_success()
+        CHAPTERS_DOWNLOADED.inc(engine=engine)
+        
+        # 🔄 策略2：检查是否需要主动刷新Cookie（每20个章节）
+        if self._should_refresh_cookie_proactively(successful_downloads):
+            effective_chapter_id = int(chapter_id) if chapter_id else (self.tzj if self.tzj else 1)
+            self._write_debug_log("🔄 策略2：第%s个章节，主动刷新Cookie (chapter_id: %s)", successful_downloads, effective_chapter_id)
+            # 后台验证并换入新Cookie，不阻塞当前章节
+            self.cookie_pool.refill_async(effective_chapter_id, extra=1)
+            COOKIE_ROTATIONS.inc(reason='proactive')
+            self.log_callback(f"🔄 策略2：已下载{successful_downloads}个章节，后台刷新Cookie（每20章节策略）")
+        
+        # 根据成功情况调整延时倍数（作用于全局限速器，不在下载线程中睡眠）
+        if self.rate_limiter.multiplier > 1.0:
+            multiplier = self.rate_limiter.adjust_multiplier(-0.1)
+            self._write_debug_log("📈 下载成功，降低延时倍数至: %.1f", multiplier)
+
+        if isinstance(content, StrippedText):
+            job.fallback_chapters.increment()
+            CHAPTERS_FALLBACK.inc(engine=engine)
+        else:
+            # 后备HTML处理得到的正文不缓存，下次下载时重新请求
+            self.chapter_cache.put(chapter_id, content)
+
+        job.add_chapter(title, content)
+
+        self._write_debug_log("✅ 章节「%s」下载完成，内容长度: %s 字符", title, len(content))
+        return content
+
+    def _on_chapter_attempt_failed(self, title: str, chapter_id: str, error: Exception, attempt: int,
+                                   job: Optional[DownloadJob] = None, engine: str = 'thread') -> Optional[float]:
+        """处理一次失败的尝试（线程池和异步引擎共用）：返回下次重试前的等待秒数，已无重试机会时返回None"""
+        job = job or self.default_job
+        retries = self.config.retry_count - attempt - 1
+        self._write_debug_log("❌ 章节「%s」重试失败: %s (剩余重试: %s)", title, error, retries)
+
+        if retries <= 0:
+            CHAPTERS_FAILED.inc(engine=engine)
+            self._write_debug_log("💥 章节「%s」最终下载失败: %s", title, error)
+            self.log_callback(f'下载失败 {title}: {str(error)}')
+            return None
+        CHAPTER_RETRIES.inc(engine=engine)
+
+        # 使用配置文件中的重试间隔
+        attempt_index = attempt + 1
+        if attempt_index < len(self.config.retry_delays):
+            retry_delay = self.config.retry_delays[attempt_index]
+        else:
+            # 如果重试次数超过配置的间隔数组，使用最后一个值
+            retry_delay = self.config.retry_delays[-1]
+        
+        # 🚨 用户要求：明确失败原因
+        failure_reason = self._get_failure_reason(error)
+        
+        # 🚨 策略2：更激进的Cookie刷新检查（失败1次就刷新）
+        cookie_action = ""
+        if job.failure_counter.reset() > 0:  # 策略2：失败1次就尝试刷新Cookie
+            # 修复Cookie刷新：使用有效的chapter_id
+            effective_chapter_id = int(chapter_id) if chapter_id else (self.tzj if self.tzj else 1)
+            self._write_debug_log("🔄 策略2：失败1次即切换Cookie (effective_chapter_id: %s)", effective_chapter_id)
+            # 失败的Cookie已扣分，重试时自动换用评分更高的Cookie；新Cookie在后台验证补充
+            self.cookie_pool.refill_async(effective_chapter_id)
+            cookie_action = " (策略2: 已切换Cookie)"
+        
+        self._write_debug_log("⏳ 等待 %ss 后重试... (重试间隔配置索引: %s)", retry_delay, attempt_index)
+        
+        # 🚨 用户要求：包含具体失败原因的重试日志
+        self.log_callback(f"⚠️ 章节「{title}」下载失败 ({failure_reason})，{retry_delay}s后重试 (剩余{retries}次){cookie_action}")
+        
+        # 必要时输出本次失败的响应
+        if "内容为空" not in failure_reason and "网络" not in failure_reason:
+            self._log_captured_response(chapter_id)
+
+        return retry_delay
+
+    def _capture_response(self, chapter_id, source: ContentSource, response: Optional[req.Response], error: Exception):
+        """保留失败请求的原始响应（response为None表示没有收到响应）"""
+        if response is None:
+            self.response_capture.record(chapter_id, source.name, None, None, error)
+        else:
+            self.response_capture.record(chapter_id, source.name, response.status_code, response.content, error)
+
+    def _log_captured_response(self, chapter_id):
+        """把该章节最近一次失败的原始响应摘要写入调试日志"""
+        if not self.debug_log.enabled:
+            return
+        captured = self.response_capture.get(chapter_id)
+        if captured is None:
+            self._write_debug_log("📥 没有保留该章节的原始响应 (章节ID: %s)", chapter_id)
+            return
+        self._write_debug_log("📥 最近一次响应: 来源 %s，状态 %s，%s 字节，错误: %s",
+                              captured.source, captured.status, captured.size, captured.error)
+        self._write_debug_log("📥 响应前500字符: %r", captured.text(500))
+
+    def _report_chapter_failure(self, title: str, chapter_id, error: Exception):
+        """章节最终失败：输出保留的原始响应，并按采样率写入失败日志"""
+        self._log_captured_response(chapter_id)
+        if self.response_capture.persist(chapter_id, title, self._get_failure_reason(error)):
+            self._write_debug_log("📝 原始响应已写入失败日志: %s", self.response_capture.log_path)
 
     def _download_chapter_for_epub(self, title: str, chapter_id: str) -> Optional[epub.EpubHtml]:
         """Download and format chapter for EPUB"""
@@ -1298,6 +4065,7 @@ class NovelDownloader:
         
         return 's'  # 返回成功标识
 
+    @traced('export.txt')
     def _save_single_txt_to_folder(self, name: str, content: dict, output_dir: str) -> str:
         """Save all chapters to a single TXT file in specified folder with smart chapter ordering"""
         output_path = os.path.join(output_dir, f'{name}.txt')
@@ -1400,12 +4168,17 @@ class NovelDownloader:
         with open(self.record_path, 'r', encoding='UTF-8') as f:
             novels = json.load(f)
 
+        reused_before = CHAPTERS_REUSED.value()
         for novel_id in novels:
             self.log_callback(f"Updating novel {novel_id}")
             status = self.download_novel(novel_id)
             if not status:
                 novels.remove(novel_id)
 
+        reused = int(CHAPTERS_REUSED.value() - reused_before)
+        if reused:
+            self.log_callback(f"📈 增量更新共复用 {reused} 个已下载章节，节省 {reused} 次章节请求")
+
         with open(self.record_path, 'w', encoding='UTF-8') as f:
             json.dump(novels, f)
 
@@ -1720,32 +4493,65 @@ class NovelDownloader:
 
     def _test_cookie(self, chapter_id: int, cookie: str) -> str:
         """Test if cookie is valid"""
-        self.cookie = cookie
-        if len(self._download_chapter_content(chapter_id, test_mode=True)) > 200:
+        if len(self._download_chapter_content(chapter_id, test_mode=True, cookie=cookie)) > 200:
+            self.cookie = cookie
             return 's'
         return 'err'
 
-    def _get_chapter_list(self, novel_id: int) -> tuple:
-        """Get novel info and chapter list with detailed logging"""
-        url = f'https://fanqienovel.com/page/{novel_id}'
+    def _get_chapter_list(self, novel_id: int, refresh: bool = False) -> tuple:
+        """Get novel info and chapter list (从缓存的详情页读取，refresh为True时重新请求)"""
+        book_page = self._get_book_page(novel_id, refresh=refresh)
+        if not book_page.is_valid():
+            return 'err', {}, []
+        return book_page.title, book_page.chapters, book_page.status
+
+    @traced('toc')
+    def _get_book_page(self, novel_id: Union[str, int], refresh: bool = False) -> BookPage:
+        """获取小说详情页，有效期内直接使用缓存，避免重复请求和重复解析"""
+        key = str(novel_id)
+        with self._book_pages_lock:
+            book_page = self._book_pages.get(key)
+            if book_page is not None:
+                self._book_pages.move_to_end(key)
+        if (book_page is not None and not refresh
+                and time.time() - book_page.fetched_at < self.config.book_page_ttl):
+            self._write_debug_log("📦 使用缓存的详情页: %s", key)
+            return book_page
+
+        book_page = self._fetch_book_page(key)
+        if book_page.is_valid():
+            with self._book_pages_lock:
+                expired = [cached_key for cached_key, cached in self._book_pages.items()
+                           if book_page.fetched_at - cached.fetched_at >= self.config.book_page_ttl]
+                for cached_key in expired:
+                    del self._book_pages[cached_key]
+                self._book_pages.pop(key, None)
+                self._book_pages[key] = book_page
+                while len(self._book_pages) > BOOK_PAGE_CACHE_SIZE:
+                    self._book_pages.popitem(last=False)
+        return book_page
+
+    @traced('toc.fetch')
+    def _fetch_book_page(self, novel_id: str) -> BookPage:
+        """请求并解析小说详情页 with detailed logging"""
+        url = f'{self.config.base_url}/page/{novel_id}'
         
         # 详细记录请求信息
-        self._write_debug_log(f"🌐 请求章节列表: {url}")
-        self._write_debug_log(f"🔑 使用Cookie: {self.cookie}")
-        
-        response = req.get(url, headers=self.headers)
-        self._write_debug_log(f"📡 响应状态码: {response.status_code}")
-        self._write_debug_log(f"📏 响应内容长度: {len(response.text)} 字符")
+        self._write_debug_log("🌐 请求章节列表: %s", url)
+        self._write_debug_log("🔑 使用Cookie: %s", self.cookie_pool.peek())
         
-        ele = etree.HTML(response.text)
+        response = self.http.get(url, headers=self.headers)
+        self._write_debug_log("📡 响应状态码: %s", response.status_code)
+        self._write_debug_log("📏 响应内容长度: %s 字节", len(response.content))
+
+        ele = etree.HTML(response.content, parser=utf8_html_parser())
 
         chapters = {}
         a_elements = ele.xpath('//div[@class="chapter"]/div/a')
-        self._write_debug_log(f"📚 找到章节元素数量: {len(a_elements)}")
+        self._write_debug_log("📚 找到章节元素数量: %s", len(a_elements))
         
         if not a_elements:
             self._write_debug_log("❌ 未找到任何章节元素，可能是页面结构变化或访问受限")
-            return 'err', {}, []
 
         null_title_count = 0
         valid_chapters = 0
@@ -1753,7 +4559,7 @@ class NovelDownloader:
         for i, a in enumerate(a_elements):
             href = a.xpath('@href')
             if not href:
-                self._write_debug_log(f"⚠️ 第{i+1}个章节元素缺少href属性")
+                self._write_debug_log("⚠️ 第%s个章节元素缺少href属性", i+1)
                 continue
                 
             chapter_title = a.text
@@ -1762,17 +4568,18 @@ class NovelDownloader:
             # 详细记录每个章节的信息
             if not chapter_title or not chapter_title.strip():
                 null_title_count += 1
-                self._write_debug_log(f"🚨 第{i+1}个章节标题为空! 章节ID: {chapter_id}")
-                self._write_debug_log(f"   - 元素HTML: {etree.tostring(a, encoding='unicode')[:200]}")
+                self._write_debug_log("🚨 第%s个章节标题为空! 章节ID: %s", i+1, chapter_id)
+                if self.debug_log.enabled:
+                    self._write_debug_log("   - 元素HTML: %s", etree.tostring(a, encoding='unicode')[:200])
                 # 不生成假标题，保留问题让用户知道
                 continue
             else:
                 chapters[chapter_title.strip()] = chapter_id
                 valid_chapters += 1
                 if i < 5 or i % 100 == 0:  # 记录前5个和每100个章节
-                    self._write_debug_log(f"✅ 章节{i+1}: 「{chapter_title.strip()}」-> ID: {chapter_id}")
+                    self._write_debug_log("✅ 章节%s: 「%s」-> ID: %s", i+1, chapter_title.strip(), chapter_id)
 
-        self._write_debug_log(f"📊 章节统计: 有效章节 {valid_chapters} 个，空标题章节 {null_title_count} 个")
+        self._write_debug_log("📊 章节统计: 有效章节 %s 个，空标题章节 %s 个", valid_chapters, null_title_count)
         
         if null_title_count > 0:
             self.log_callback(f"⚠️ 发现 {null_title_count} 个空标题章节，这些章节将被跳过")
@@ -1781,156 +4588,272 @@ class NovelDownloader:
         title = ele.xpath('//h1/text()')
         status = ele.xpath('//span[@class="info-label-yellow"]/text()')
         
-        self._write_debug_log(f"📖 小说标题: {title[0] if title else '未找到'}")
-        self._write_debug_log(f"📊 小说状态: {status[0] if status else '未找到'}")
+        self._write_debug_log("📖 小说标题: %s", title[0] if title else '未找到')
+        self._write_debug_log("📊 小说状态: %s", status[0] if status else '未找到')
 
         if not title or not status:
             self._write_debug_log("❌ 无法获取小说基本信息（标题或状态）")
-            return 'err', {}, []
 
-        return title[0], chapters, status
+        # 作者和封面来自页面中的ld+json
+        ld_json = {}
+        author = None
+        cover_url = None
+        for script in ele.xpath('//script[@type="application/ld+json"]/text()'):
+            try:
+                ld_json = json.loads(script)
+                break
+            except ValueError as e:
+                self._write_debug_log("⚠️ ld+json解析失败: %s", e)
+        try:
+            if ld_json.get('author'):
+                author = ld_json['author'][0]['name']
+            if ld_json.get('image'):
+                cover_url = ld_json['image'][0]
+        except (KeyError, IndexError, TypeError) as e:
+            self._write_debug_log("⚠️ ld+json字段异常: %s", e)
+
+        return BookPage(
+            novel_id=novel_id,
+            title=title[0] if title else None,
+            status=status,
+            author=author,
+            cover_url=cover_url,
+            ld_json=ld_json,
+            chapters=chapters
+        )
+
+    def _download_chapter_content(self, chapter_id: int, test_mode: bool = False,
+                                  cookie: Optional[str] = None) -> str:
+        """Download content with fallback and enhanced error handling
+
+        每次调用只按来源顺序（或对冲）请求一轮，对应限速器发放的一个令牌；失败时直接抛出，
+        由调用方按retry_delays重试并重新取令牌，工作线程不会在占用名额时睡眠。
+        未指定cookie时从Cookie池取用，并把结果计入该Cookie的评分；显式传入cookie（验证）时不计分。
+        """
+        pooled = cookie is None
+        if pooled:
+            cookie = self.cookie_pool.get()
 
-    def _download_chapter_content(self, chapter_id: int, test_mode: bool = False) -> str:
-        """Download content with fallback and enhanced error handling"""
         # 🎭 策略3：使用随机化的真实请求头
         headers = self._get_randomized_headers()
-        headers['cookie'] = self.cookie
+        headers['cookie'] = cookie
 
-        for attempt in range(3):
+        self._write_debug_log("📡 请求章节内容 (章节ID: %s)", chapter_id)
+        try:
+            result = self._fetch_chapter(chapter_id, headers, test_mode)
+        except Exception:
+            self._write_debug_log("💥 所有方法均失败，章节ID: %s", chapter_id)
+            if test_mode:
+                return 'err'
+            if pooled:
+                self.cookie_pool.record(cookie, False)
+            raise
+
+        if pooled and not test_mode:
+            self.cookie_pool.record(cookie, True)
+        return result.content
+
+    def _fetch_chapter(self, chapter_id: int, headers: Dict[str, str], test_mode: bool = False) -> FetchResult:
+        """按SourceRouter给出的顺序请求各来源，返回第一个有效结果，全部失败时抛出异常"""
+        sources = self.source_router.plan()
+        if self.hedge.enabled and not test_mode and len(sources) > 1:
+            return self._fetch_chapter_hedged(sources, chapter_id, headers)
+
+        errors = []
+        for source in sources:
+            self._write_debug_log("📡 尝试%s (章节ID: %s)", source.label, chapter_id)
             try:
-                self._write_debug_log(f"📡 尝试方法1: 标准API (章节ID: {chapter_id}, 尝试: {attempt + 1}/3)")
-                
-                # Try primary method
-                response = req.get(
-                    f'https://fanqienovel.com/reader/{chapter_id}',
-                    headers=headers,
-                    timeout=10
-                )
-                response.raise_for_status()
-                
-                self._write_debug_log(f"📥 API响应状态: {response.status_code}, 内容长度: {len(response.text)}")
-
-                content = '\n'.join(
-                    etree.HTML(response.text).xpath(
-                        '//div[@class="muye-reader-content noselect"]//p/text()'
-                    )
-                )
-                
-                self._write_debug_log(f"📝 XPath提取结果长度: {len(content)} 字符")
-
-                if test_mode:
-                    return content
+                return self._fetch_from_source(source, chapter_id, headers, test_mode)
+            except Exception as e:
+                self._write_debug_log("❌ %s失败: %s", source.label, e)
+                errors.append(f"{source.name}: {str(e)}")
+        raise Exception(f"All download methods failed. {'; '.join(errors)}")
+
+    def _fetch_from_source(self, source: ContentSource, chapter_id: int, headers: Dict[str, str],
+                           test_mode: bool = False) -> FetchResult:
+        """向单个来源请求章节正文，并把结果计入该来源的统计（test_mode不解码、不计入统计）"""
+        started_at = time.time()
+        start = time.monotonic()
+        response = None
+        try:
+            response = self.http.get(source.url(chapter_id), headers=headers)
+            response.raise_for_status()
+        except Exception as e:
+            if not test_mode:
+                self.source_router.record(source, False, time.monotonic() - start)
+                self._capture_response(chapter_id, source, response, e)
+                observe_source_request(source.name, 'http_error', time.monotonic() - start,
+                                       size=len(response.content) if response is not None else 0)
+            raise
+        fetched = time.monotonic()
+        self.tracer.add('chapter.fetch', started_at, fetched - start, chapter_id=str(chapter_id),
+                        source=source.name, bytes=len(response.content))
+
+        self._write_debug_log("📥 %s响应状态: %s, 内容长度: %s 字节", source.label, response.status_code, len(response.content))
+        try:
+            content = source.extract(response.content)
+            parsed = time.monotonic()
+            self.tracer.add('chapter.parse', started_at + fetched - start, parsed - fetched,
+                            chapter_id=str(chapter_id), source=source.name)
+            if not test_mode:
+                content = source.decode(content)
+                self.tracer.add('chapter.decode', started_at + parsed - start, time.monotonic() - parsed,
+                                chapter_id=str(chapter_id), source=source.name)
+        except Exception as e:
+            if not test_mode:
+                self.source_router.record(source, False, time.monotonic() - start, decode_failed=True)
+                self._capture_response(chapter_id, source, response, e)
+                observe_source_request(source.name, 'decode_error', fetched - start,
+                                       time.monotonic() - fetched, len(response.content))
+            raise
+
+        latency = time.monotonic() - start
+        if not test_mode:
+            self.source_router.record(source, True, latency)
+            observe_source_request(source.name, 'ok', fetched - start, start + latency - fetched, len(response.content))
+        if isinstance(content, StrippedText):
+            self._write_debug_log("🧹 %s正文来自后备HTML处理 (章节ID: %s)", source.label, chapter_id)
+        return FetchResult(content, source.name, latency, fallback=isinstance(content, StrippedText))
+
+    def _fetch_primary(self, source: ContentSource, chapter_id: int, headers: Dict[str, str]) -> FetchResult:
+        """对冲场景下的首选请求：记录延迟供HedgePolicy学习p90"""
+        self.hedge.on_request()
+        result = self._fetch_from_source(source, chapter_id, headers)
+        self.hedge.record_latency(result.latency)
+        return result
 
-                # 检查内容是否有效
-                if not content or len(content.strip()) < 10:
-                    self._write_debug_log(f"⚠️ 方法1内容过短或为空: {repr(content[:100])}")
-                    raise Exception(f"Content too short or empty (length: {len(content)})")
+    def _get_hedge_executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        with self._hedge_executor_lock:
+            if self._hedge_executor is None:
+                self._hedge_executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.http.pool_size, thread_name_prefix='hedge')
+            return self._hedge_executor
+
+    def _fetch_chapter_hedged(self, sources: List[ContentSource], chapter_id: int,
+                              headers: Dict[str, str]) -> FetchResult:
+        """对冲请求：首选来源超过p90仍未返回时并发请求次选来源，取先返回的有效结果
+
+        首选和对冲请求都在对冲线程池（大小为工作线程数的2倍）中执行，调用线程只用
+        FIRST_COMPLETED同时等待两者，首选请求慢但最终成功时也不必等它结束。
+        首选来源提前失败时立即改用下一个来源（与顺序回退一致）；未胜出的请求被取消，
+        已在进行中的则直接丢弃其结果。所有来源都失败时抛出异常。
+        """
+        executor = self._get_hedge_executor()
+        fallbacks = iter(sources[1:])
+        primary = executor.submit(self._fetch_primary, sources[0], chapter_id, headers)
+        futures = {primary: sources[0]}
+        errors = []
+        hedge_future = None
 
-                try:
-                    decoded = self._decode_content(content)
-                    self._write_debug_log(f"✅ 内容解码成功，最终长度: {len(decoded)} 字符")
-                    return decoded
-                except Exception as decode_err:
-                    self._write_debug_log(f"⚠️ 解码模式0失败: {str(decode_err)}")
-                    # Try alternative decoding mode
-                    try:
-                        decoded = self._decode_content(content, mode=1)
-                        self._write_debug_log(f"✅ 解码模式1成功，最终长度: {len(decoded)} 字符")
-                        return decoded
-                    except Exception as decode_err2:
-                        self._write_debug_log(f"⚠️ 解码模式1失败: {str(decode_err2)}")
-                        # Fallback HTML processing
-                        self._write_debug_log(f"🔄 使用后备HTML处理")
-                        content = content[6:]
-                        tmp = 1
-                        result = ''
-                        for i in content:
-                            if i == '<':
-                                tmp += 1
-                            elif i == '>':
-                                tmp -= 1
-                            elif tmp == 0:
-                                result += i
-                            elif tmp == 1 and i == 'p':
-                                result = (result + '\n').replace('\n\n', '\n')
-                        
-                        if result and len(result.strip()) > 10:
-                            self._write_debug_log(f"✅ 后备处理成功，最终长度: {len(result)} 字符")
-                            return result
-                        else:
-                            raise Exception(f"Fallback processing failed, result too short: {len(result)}")
+        try:
+            concurrent.futures.wait([primary], timeout=self.hedge.hedge_delay())
+            if not primary.done() and self.hedge.try_hedge():
+                source = next(fallbacks)
+                self._write_debug_log("🔀 %s超过 %.2fs 未返回，对冲请求%s (章节ID: %s)", sources[0].label, self.hedge.hedge_delay(), source.label, chapter_id)
+                hedge_future = executor.submit(self._fetch_from_source, source, chapter_id, headers)
+                futures[hedge_future] = source
+
+            pending = set(futures)
+            while pending:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    error = future.exception()
+                    if error is None:
+                        result = future.result()
+                        if future is hedge_future:
+                            result.hedged = True
+                            self.hedge.record_hedge_win()
+                        return result
+                    self._write_debug_log("❌ %s失败: %s", futures[future].label, error)
+                    errors.append(f"{futures[future].name}: {str(error)}")
+
+                # 在途请求都失败：顺序回退到下一个来源
+                if not pending:
+                    source = next(fallbacks, None)
+                    if source is not None:
+                        self._write_debug_log("🔄 尝试%s (章节ID: %s)", source.label, chapter_id)
+                        future = executor.submit(self._fetch_from_source, source, chapter_id, headers)
+                        futures[future] = source
+                        pending = {future}
+        finally:
+            for future in futures:
+                future.cancel()
 
-            except Exception as e:
-                self._write_debug_log(f"❌ 方法1失败: {str(e)}")
-                
-                # Try alternative API endpoint
-                try:
-                    self._write_debug_log(f"🔄 尝试方法2: 备用API (章节ID: {chapter_id})")
-                    
-                    response = req.get(
-                        f'https://fanqienovel.com/api/reader/full?itemId={chapter_id}',
-                        headers=headers,
-                        timeout=10
-                    )
-                    response.raise_for_status()
-                    
-                    self._write_debug_log(f"📥 备用API响应状态: {response.status_code}")
-                    
-                    data = json.loads(response.text)
-                    content = data['data']['chapterData']['content']
-                    
-                    self._write_debug_log(f"📝 备用API内容长度: {len(content)} 字符")
+        raise Exception(f"All download methods failed. {'; '.join(errors)}")
 
-                    if test_mode:
-                        return content
-                    
-                    # 检查内容是否有效
-                    if not content or len(content.strip()) < 10:
-                        self._write_debug_log(f"⚠️ 方法2内容过短或为空: {repr(content[:100])}")
-                        raise Exception(f"Backup API content too short (length: {len(content)})")
-
-                    decoded = self._decode_content(content)
-                    self._write_debug_log(f"✅ 备用API解码成功，最终长度: {len(decoded)} 字符")
-                    return decoded
-                    
-                except Exception as backup_err:
-                    self._write_debug_log(f"❌ 方法2也失败: {str(backup_err)}")
-                    
-                    if attempt == 2:  # Last attempt
-                        self._write_debug_log(f"💥 所有方法均失败，章节ID: {chapter_id}")
-                        if test_mode:
-                            return 'err'
-                        raise Exception(f"All download methods failed. Primary: {str(e)}, Backup: {str(backup_err)}")
-                    
-                    self._write_debug_log(f"⏳ 等待1秒后重试...")
-                    time.sleep(1)
+    def _extract_reader_content(self, html: Union[bytes, str]) -> str:
+        """方法1：从阅读页HTML中提取正文段落（未解码），优先传入响应的原始字节
 
-    def _get_author_info(self, novel_id: int) -> Optional[str]:
+        原始字节先走只解析正文容器的定向提取，找不到容器时回退到整页XPath。
+        """
+        if isinstance(html, bytes):
+            try:
+                content = '\n'.join(extract_reader_paragraphs(html))
+                self._write_debug_log("📝 定向提取结果长度: %s 字符", len(content))
+                return content
+            except (ValueError, etree.LxmlError) as e:
+                self._write_debug_log("⚠️ 定向提取失败，回退到整页XPath: %s", e)
+            root = etree.HTML(html, parser=utf8_html_parser())
+        else:
+            root = etree.HTML(html)
+        content = '\n'.join(root.xpath(READER_CONTENT_XPATH))
+        self._write_debug_log("📝 XPath提取结果长度: %s 字符", len(content))
+        return content
+
+    def _decode_reader_content(self, content: str) -> str:
+        """解码阅读页正文：按配置或自动检测的模式解码 -> 后备HTML处理，全部失败时抛出异常"""
+        # 检查内容是否有效
+        if not content or len(content.strip()) < 10:
+            self._write_debug_log("⚠️ 方法1内容过短或为空: %r", content[:100])
+            raise Exception(f"Content too short or empty (length: {len(content)})")
+
+        decoded = self._decode_content(content)
+        problem = reader_content_problem(decoded)
+        if problem is None:
+            self._write_debug_log("✅ 内容解码成功，最终长度: %s 字符", len(decoded))
+            return decoded
+
+        # Fallback HTML processing：去掉残留标签后重新解码，仍未映射的私有区字符删除
+        self._write_debug_log("⚠️ 解码结果异常（%s），使用后备HTML处理", problem)
+        stripped = self._decode_content(strip_reader_markup(content, start=0))
+        result = StrippedText(_PRIVATE_USE_PATTERN.sub('', stripped).strip('\n'))
+        if len(result.strip()) > 10:
+            self._write_debug_log("✅ 后备处理成功，最终长度: %s 字符", len(result))
+            return result
+        raise Exception(f"Fallback processing failed, result too short: {len(result)}")
+
+    def _extract_full_api_content(self, body: Union[bytes, str]) -> str:
+        """方法2：从reader/full接口的JSON中提取正文（未解码），json.loads可直接解析UTF-8字节"""
+        data = json.loads(body)
+        content = data['data']['chapterData']['content']
+        self._write_debug_log("📝 备用API内容长度: %s 字符", len(content))
+        return content
+
+    def _decode_full_api_content(self, content: str) -> str:
+        """解码备用接口正文，内容过短时抛出异常"""
+        # 检查内容是否有效
+        if not content or len(content.strip()) < 10:
+            self._write_debug_log("⚠️ 方法2内容过短或为空: %r", content[:100])
+            raise Exception(f"Backup API content too short (length: {len(content)})")
+
+        decoded = self._decode_content(content)
+        self._write_debug_log("✅ 备用API解码成功，最终长度: %s 字符", len(decoded))
+        return decoded
+
+    def _get_author_info(self, novel_id: int, book_page: Optional[BookPage] = None) -> Optional[str]:
         """Get author information from novel page"""
-        url = f'https://fanqienovel.com/page/{novel_id}'
         try:
-            response = req.get(url, headers=self.headers)
-            soup = BeautifulSoup(response.text, 'html.parser')
-            script_tag = soup.find('script', type="application/ld+json")
-            if script_tag:
-                data = json.loads(script_tag.string)
-                if 'author' in data:
-                    return data['author'][0]['name']
+            book_page = book_page or self._get_book_page(novel_id)
+            return book_page.author
         except Exception as e:
             self.log_callback(f"获取作者信息失败: {str(e)}")
         return None
 
-    def _get_cover_url(self, novel_id: int) -> Optional[str]:
+    def _get_cover_url(self, novel_id: int, book_page: Optional[BookPage] = None) -> Optional[str]:
         """Get cover image URL from novel page"""
-        url = f'https://fanqienovel.com/page/{novel_id}'
         try:
-            response = req.get(url, headers=self.headers)
-            soup = BeautifulSoup(response.text, 'html.parser')
-            script_tag = soup.find('script', type="application/ld+json")
-            if script_tag:
-                data = json.loads(script_tag.string)
-                if 'image' in data:
-                    return data['image'][0]
+            book_page = book_page or self._get_book_page(novel_id)
+            return book_page.cover_url
         except Exception as e:
             self.log_callback(f"获取封面图片失败: {str(e)}")
         return None
@@ -1938,7 +4861,7 @@ class NovelDownloader:
     def _add_cover_to_epub(self, book: epub.EpubBook, cover_url: str):
         """Add cover image to EPUB book"""
         try:
-            response = req.get(cover_url)
+            response = self.http.get(cover_url)
             if response.status_code == 200:
                 book.set_cover('cover.jpg', response.content)
 
@@ -2027,26 +4950,26 @@ class NovelDownloader:
 
     def _sanitize_filename(self, filename: str) -> str:
         """Sanitize filename for different platforms with enhanced debugging"""
-        self._write_debug_log(f"🔧 _sanitize_filename调用 - 输入: {repr(filename)} (类型: {type(filename).__name__})")
+        self._write_debug_log("🔧 _sanitize_filename调用 - 输入: %r (类型: %s)", filename, type(filename).__name__)
         
         # 处理None或空值的情况
         if filename is None:
-            self._write_debug_log(f"❌ _sanitize_filename: 输入为None!")
+            self._write_debug_log("❌ _sanitize_filename: 输入为None!")
             result = "ERROR_None_filename"
-            self._write_debug_log(f"🔧 _sanitize_filename返回: {repr(result)}")
+            self._write_debug_log("🔧 _sanitize_filename返回: %r", result)
             return result
         
         if not filename:
-            self._write_debug_log(f"❌ _sanitize_filename: 输入为空字符串!")
+            self._write_debug_log("❌ _sanitize_filename: 输入为空字符串!")
             result = "ERROR_Empty_filename"
-            self._write_debug_log(f"🔧 _sanitize_filename返回: {repr(result)}")
+            self._write_debug_log("🔧 _sanitize_filename返回: %r", result)
             return result
         
         # 确保输入是字符串类型
         if not isinstance(filename, str):
-            self._write_debug_log(f"❌ _sanitize_filename: 输入不是字符串类型: {type(filename)}")
+            self._write_debug_log("❌ _sanitize_filename: 输入不是字符串类型: %s", type(filename))
             filename_str = str(filename)
-            self._write_debug_log(f"🔄 转换为字符串: {repr(filename_str)}")
+            self._write_debug_log("🔄 转换为字符串: %r", filename_str)
             filename = filename_str
         
         original_filename = filename
@@ -2055,10 +4978,10 @@ class NovelDownloader:
         
         for old, new in zip(illegal_chars, illegal_chars_rep):
             if old in filename:
-                self._write_debug_log(f"🔄 替换字符: '{old}' -> '{new}'")
+                self._write_debug_log("🔄 替换字符: '%s' -> '%s'", old, new)
                 filename = filename.replace(old, new)
         
-        self._write_debug_log(f"🔧 _sanitize_filename完成 - 原始: {repr(original_filename)} -> 结果: {repr(filename)}")
+        self._write_debug_log("🔧 _sanitize_filename完成 - 原始: %r -> 结果: %r", original_filename, filename)
         return filename
 
     def _parse_novel_id(self, novel_id: Union[str, int]) -> Optional[int]:
@@ -2072,44 +4995,87 @@ class NovelDownloader:
             return None
 
     def get_downloaded_novels(self) -> List[Dict[str, str]]:
-        """Get list of downloaded novels with their paths"""
-        novels = []
-        for filename in os.listdir(self.bookstore_dir):
-            if filename.endswith('.json'):
-                novel_name = filename[:-5]  # Remove .json extension
-                json_path = os.path.join(self.bookstore_dir, filename)
+        """Get list of downloaded novels with their paths (来自书库目录，首次使用时扫描书库生成)"""
+        return self.catalog.list()
 
+    def rebuild_catalog(self) -> int:
+        """扫描书库重新生成书库目录，返回小说数"""
+        entries = self._scan_catalog_entries()
+        self.catalog.rebuild(entries)
+        return len(entries)
+
+    def _scan_catalog_entries(self) -> List[tuple]:
+        """扫描书库生成目录记录
+
+        支持三种保存格式：书名-ID/书名.json（download_novel）、书名.json（_metadata）
+        和 ID_书名.json（Web服务，_meta + chapters）。没有导出JSON的书（书名-ID/和ID_书名/下只有章节存储）
+        从章节存储的索引生成记录。
+        """
+        entries = []
+        if os.path.isdir(self.bookstore_dir):
+            for entry in sorted(os.listdir(self.bookstore_dir)):
+                path = os.path.join(self.bookstore_dir, entry)
                 try:
-                    with open(json_path, 'r', encoding='UTF-8') as f:
-                        novel_data = json.load(f)
-                        metadata = novel_data.get('_metadata', {})
-
-                        novels.append({
-                            'name': novel_name,
-                            'novel_id': metadata.get('novel_id'),
-                            'status': metadata.get('status'),
-                            'last_updated': metadata.get('last_updated'),
-                            'json_path': json_path,
-                            'txt_path': os.path.join(self.config.save_path, f'{novel_name}.txt'),
-                            'epub_path': os.path.join(self.config.save_path, f'{novel_name}.epub'),
-                            'html_path': os.path.join(self.config.save_path, f'{novel_name}(html)'),
-                            'latex_path': os.path.join(self.config.save_path, f'{novel_name}.tex')
-                        })
-                except Exception as e:
-                    self.log_callback(f"Error reading novel data for {novel_name}: {str(e)}")
-                    # Add novel with minimal info if metadata can't be read
-                    novels.append({
-                        'name': novel_name,
-                        'novel_id': None,
-                        'status': None,
-                        'last_updated': None,
-                        'json_path': json_path,
-                        'txt_path': os.path.join(self.config.save_path, f'{novel_name}.txt'),
-                        'epub_path': os.path.join(self.config.save_path, f'{novel_name}.epub'),
-                        'html_path': os.path.join(self.config.save_path, f'{novel_name}(html)'),
-                        'latex_path': os.path.join(self.config.save_path, f'{novel_name}.tex')
-                    })
-        return novels
+                    if os.path.isdir(path):
+                        match = re.fullmatch(r'(.+)-(\d+)', entry)
+                        json_path = os.path.join(path, f'{match.group(1)}.json') if match else None
+                        web_match = re.fullmatch(r'(\d+)_(.+)', entry)
+                        has_store = os.path.exists(os.path.join(path, ChapterStore.LOG_NAME))
+                        if json_path and os.path.exists(json_path):
+                            entries.append(self._catalog_entry(json_path, match.group(2), match.group(1),
+                                                               os.path.join(self.download_dir, entry)))
+                        elif match and has_store:
+                            entries.append(self._store_catalog_entry(path, match.group(2), match.group(1),
+                                                                     os.path.join(self.download_dir, entry)))
+                        elif web_match and has_store and not os.path.exists(f'{path}.json'):
+                            entries.append(self._store_catalog_entry(path, web_match.group(1), web_match.group(2),
+                                                                     self.config.save_path))
+                    elif entry.endswith('.json'):
+                        entries.append(self._catalog_entry(path, None, entry[:-5], self.config.save_path))
+                except (OSError, ValueError) as e:
+                    self.log_callback(f"Error reading novel data for {entry}: {str(e)}")
+        return entries
+
+    def _catalog_entry(self, json_path: str, novel_id: Optional[str], safe_name: str, output_dir: str) -> tuple:
+        """从书库中的一本书生成目录记录"""
+        with open(json_path, 'r', encoding='UTF-8') as f:
+            data = json.load(f)
+        if isinstance(data.get('chapters'), dict) and '_meta' in data:
+            meta = data['_meta']
+            chapters = {title: content for title, content in data['chapters'].items() if not title.startswith('_')}
+            status = None
+            last_updated = meta.get('download_time')
+        else:
+            meta = data.get('_metadata') or {}
+            chapters = {title: content for title, content in data.items() if not title.startswith('_')}
+            status = meta.get('status')
+            last_updated = meta.get('last_updated')
+        if novel_id is None:
+            prefix, _, rest = safe_name.partition('_')
+            novel_id = meta.get('novel_id') or (prefix if prefix.isdigit() and rest else safe_name)
+            safe_name = rest if prefix.isdigit() and rest else safe_name
+        last_updated = last_updated or time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(os.path.getmtime(json_path)))
+        paths = {'json': json_path, **self._catalog_output_paths(safe_name, output_dir)}
+        failed = sum(1 for content in chapters.values() if content == EMPTY_CHAPTER_PLACEHOLDER)
+        return LibraryCatalog.make_entry(novel_id, meta.get('name') or safe_name, status, len(chapters),
+                                         paths, failed_count=failed, last_updated=last_updated)
+
+    def _store_catalog_entry(self, store_dir: str, novel_id: str, safe_name: str, output_dir: str) -> tuple:
+        """没有导出JSON的书：章节数来自章节存储的索引（不读取正文）"""
+        store = ChapterStore(store_dir, self.chapter_codec)
+        last_updated = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(os.path.getmtime(store.log_path)))
+        return LibraryCatalog.make_entry(novel_id, safe_name, None, len(store),
+                                         self._catalog_output_paths(safe_name, output_dir), last_updated=last_updated)
+
+    @staticmethod
+    def _catalog_output_paths(safe_name: str, output_dir: str) -> Dict[str, str]:
+        return {
+            'txt': os.path.join(output_dir, f'{safe_name}.txt'),
+            'epub': os.path.join(output_dir, f'{safe_name}.epub'),
+            'html': os.path.join(output_dir, f'{safe_name}(html)'),
+            'latex': os.path.join(output_dir, f'{safe_name}.tex'),
+            'pdf': os.path.join(output_dir, f'{safe_name}.pdf'),
+        }
 
     def backup_data(self, backup_dir: str):
         """Backup all data to specified directory"""
@@ -2129,20 +5095,23 @@ class NovelDownloader:
         for novel in self.get_downloaded_novels():
             shutil.copy2(novel['json_path'], novels_backup_dir)
 
-    def _decode_content(self, content: str, mode: int = 0) -> str:
-        """Decode novel content using both charset modes"""
-        result = ''
-        for char in content:
-            uni = ord(char)
-            if self.CODE[mode][0] <= uni <= self.CODE[mode][1]:
-                bias = uni - self.CODE[mode][0]
-                if 0 <= bias < len(self.charset[mode]) and self.charset[mode][bias] != '?':
-                    result += self.charset[mode][bias]
-                else:
-                    result += char
-            else:
-                result += char
-        return result
+    def _decode_content(self, content: str, mode: Optional[int] = None) -> str:
+        """Decode novel content with the precompiled charset tables
+
+        未指定mode时按配置的decode_mode解码，"auto"则从正文中自动检测。
+        """
+        if mode is None:
+            mode = self._resolve_decode_mode(content)
+        return self.decoder.decode(content, mode)
+
+    def _resolve_decode_mode(self, content: str) -> int:
+        configured = str(self.config.decode_mode).strip()
+        if configured in ('0', '1'):
+            return int(configured)
+        mode = self.decoder.detect_mode(content)
+        if mode:
+            self._write_debug_log("🔍 自动检测到解码模式1")
+        return mode
 
     def _update_records(self, novel_id: int):
         """Update download records"""
@@ -2157,13 +5126,9 @@ class NovelDownloader:
             with open(self.record_path, 'w', encoding='UTF-8') as f:
                 json.dump(records, f)
 
-    def _save_progress(self, title: str, content: str):
-        """Save download progress"""
-        self.zj[title] = content
-        with open(self.book_json_path, 'w', encoding='UTF-8') as f:
-            json.dump(self.zj, f, ensure_ascii=False)
-
-    def _save_epub_from_content(self, safe_name: str, novel_content: dict, output_dir: str, novel_id: int) -> str:
+    @traced('export.epub')
+    def _save_epub_from_content(self, safe_name: str, novel_content: dict, output_dir: str, novel_id: int,
+                                book_page: Optional[BookPage] = None) -> str:
         """基于已下载内容生成EPUB文件，保存到指定目录"""
         try:
             # 获取小说信息
@@ -2174,7 +5139,7 @@ class NovelDownloader:
             
             # 尝试获取作者信息
             try:
-                author = self._get_author_info(novel_id)
+                author = self._get_author_info(novel_id, book_page)
                 if author:
                     book.add_author(author)
                 else:
@@ -2184,7 +5149,7 @@ class NovelDownloader:
             
             # 添加封面（如果可以获取）
             try:
-                cover_url = self._get_cover_url(novel_id)
+                cover_url = self._get_cover_url(novel_id, book_page)
                 if cover_url:
                     self._add_cover_to_epub(book, cover_url)
             except:
@@ -2224,6 +5189,7 @@ class NovelDownloader:
             self.log_callback(f'EPUB生成失败: {str(e)}')
             return 'err'
     
+    @traced('export.html')
     def _save_html_from_content(self, safe_name: str, novel_content: dict, output_dir: str) -> str:
         """基于已下载内容生成HTML文件，保存到指定目录"""
         try:
@@ -2289,6 +5255,7 @@ class NovelDownloader:
             self.log_callback(f'HTML生成失败: {str(e)}')
             return 'err'
     
+    @traced('export.latex')
     def _save_latex_from_content(self, safe_name: str, novel_content: dict, output_dir: str) -> str:
         """基于已下载内容生成LaTeX文件，保存到指定目录"""
         try:
@@ -2315,6 +5282,7 @@ class NovelDownloader:
             self.log_callback(f'LaTeX生成失败: {str(e)}')
             return 'err'
     
+    @traced('export.pdf')
     def _generate_pdf_from_latex(self, safe_name: str, output_dir: str) -> str:
         """使用xelatex将LaTeX文件编译为PDF"""
         try:
@@ -2424,6 +5392,110 @@ class NovelDownloader:
             return 'err'
 
 
+class RunProfiler:
+    """CLI的--profile模式：cProfile确定性统计 + 按墙钟时间采样的调用栈
+
+    结束时写出 <prefix>.pstats（python -m pstats、snakeviz可读）和
+    <prefix>.collapsed（每行"栈底;...;栈顶 采样数"，可直接交给flamegraph.pl或speedscope）。
+    threads为False时只分析主线程；为True时同时分析期间启动的线程（下载线程池、异步引擎的事件循环线程），
+    采样也覆盖所有线程并以线程名作为栈底。
+    """
+
+    def __init__(self, prefix: str, threads: bool = False, interval: float = 0.005):
+        self.prefix = prefix
+        self.threads = threads
+        self.interval = interval
+        self._profiles = []
+        self._lock = threading.Lock()
+        self._stacks = collections.Counter()
+        self._samples = 0
+        self._stop = threading.Event()
+        self._sampler = None
+        self._original_run = None
+
+    def __enter__(self):
+        self._sampler = threading.Thread(target=self._sample, name='profile-sampler', daemon=True)
+        self._sampler.start()
+        if self.threads:
+            self._original_run = threading.Thread.run
+            threading.Thread.run = self._profiled_run()
+        profile = cProfile.Profile()
+        self._profiles.append(profile)
+        profile.enable()
+        return self
+
+    def __exit__(self, *exc):
+        self._profiles[0].disable()
+        if self._original_run is not None:
+            threading.Thread.run = self._original_run
+        self._stop.set()
+        self._sampler.join()
+        self._write()
+        return False
+
+    def _profiled_run(self):
+        profiler = self
+        original_run = self._original_run
+
+        def run(thread):
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # Python 3.12+ 的cProfile基于sys.monitoring，主线程的Profile已经覆盖所有线程
+                return original_run(thread)
+            with profiler._lock:
+                profiler._profiles.append(profile)
+            try:
+                return original_run(thread)
+            finally:
+                profile.disable()
+        return run
+
+    def _sample(self):
+        main_id = threading.main_thread().ident
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()} if self.threads else {}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or (not self.threads and thread_id != main_id):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                if self.threads:
+                    stack.append(names.get(thread_id, str(thread_id)))
+                self._stacks[';'.join(reversed(stack))] += 1
+            self._samples += 1
+
+    def _write(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.prefix)), exist_ok=True)
+        stats = None
+        with self._lock:
+            profiles = list(self._profiles)
+        for profile in profiles:
+            try:
+                # 仍在运行的常驻线程（如对冲线程池）按当前快照计入
+                stats = pstats.Stats(profile) if stats is None else stats.add(profile)
+            except TypeError:
+                continue  # 没有记录到任何调用的线程
+        pstats_path = f'{self.prefix}.pstats'
+        collapsed_path = f'{self.prefix}.collapsed'
+        if stats is not None:
+            stats.dump_stats(pstats_path)
+        with open(collapsed_path, 'w', encoding='utf-8') as f:
+            for stack, count in self._stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+        print(f'\n📊 性能分析结果 ({len(profiles)} 个线程, {self._samples} 次采样):')
+        if stats is not None:
+            stats.sort_stats('cumulative').print_stats(25)
+            print(f'  pstats: {pstats_path}')
+        print(f'  折叠调用栈: {collapsed_path}')
+
+
 def create_cli():
     """Create CLI interface using the NovelDownloader class"""
     print('本程序完全免费(此版本为WEB版，目前处于测试阶段)\nGithub: https://github.com/ying-ck/fanqienovel-downloader\n作者：Yck & qxqycb & lingo34')
@@ -2433,6 +5505,13 @@ def create_cli():
     parser = argparse.ArgumentParser(description='番茄小说下载器', add_help=False)
     parser.add_argument('--id', type=str, help='直接下载指定ID的小说')
     parser.add_argument('--config', type=str, default='config.yaml', help='配置文件路径')
+    parser.add_argument('--profile', type=str, nargs='?', const='profile', metavar='PREFIX',
+                        help='分析下载过程，写出PREFIX.pstats和PREFIX.collapsed(火焰图)，需配合--id')
+    parser.add_argument('--profile-threads', action='store_true',
+                        help='与--profile相同，并且分析下载线程池和异步引擎线程')
+    parser.add_argument('--rebuild-catalog', action='store_true', help='扫描书库重新生成书库目录后退出')
+    parser.add_argument('--trace-to-chrome', type=str, metavar='TRACE_FILE',
+                        help='把追踪文件(JSONL)转换为trace viewer可加载的JSON后退出')
     parser.add_argument('-h', '--help', action='store_true', help='显示帮助信息')
     parser.add_argument('config_file', nargs='?', help='配置文件路径（兼容旧格式）')
     
@@ -2443,12 +5522,27 @@ def create_cli():
         print('  python src/main.py                    # 使用默认配置文件并进入交互模式')
         print('  python src/main.py --config [配置文件] # 使用指定配置文件')
         print('  python src/main.py --id [小说ID]      # 直接下载指定ID的小说')
+        print('  python src/main.py --id [小说ID] --profile [前缀] # 分析下载过程(cProfile + 采样火焰图)')
+        print('  python src/main.py --id [小说ID] --profile-threads # 同上，并分析下载线程')
+        print('  python src/main.py --rebuild-catalog  # 扫描书库重新生成书库目录')
+        print('  python src/main.py --trace-to-chrome [追踪文件] # 转换追踪文件供chrome://tracing或Perfetto查看')
         print('  python src/main.py --help            # 显示此帮助信息')
         print('\n示例:')
         print('  python src/main.py --id 7520128677003136024')
         print('  python src/main.py --config my_config.yaml --id 7520128677003136024')
+        print('  python mock_server.py &  # 配置network.base_url为http://127.0.0.1:8000后离线分析')
+        print('  python src/main.py --config mock.yaml --id 1 --profile-threads')
         print('\n配置文件示例请参考 config.yaml')
         return
+
+    if args.trace_to_chrome:
+        print(f'✅ 已生成: {convert_trace_to_chrome(args.trace_to_chrome)}')
+        return
+
+    profile_prefix = args.profile or ('profile' if args.profile_threads else None)
+    if profile_prefix and not args.id:
+        print('⚠️ --profile/--profile-threads 需要配合 --id 使用')
+        return
     
     # 确定配置文件路径 (兼容旧格式)
     config_path = args.config
@@ -2475,6 +5569,11 @@ def create_cli():
     
     downloader = NovelDownloader(config)
 
+    if args.rebuild_catalog:
+        count = downloader.rebuild_catalog()
+        print(f'✅ 书库目录已重新生成: {count} 本小说 ({downloader.catalog.path})')
+        return
+
     # Check for backup
     backup_folder_path = 'C:\\Users\\Administrator\\fanqie_down_backup'
     if os.path.exists(backup_folder_path):
@@ -2503,7 +5602,9 @@ def create_cli():
     # 如果提供了--id参数，直接下载并退出
     if args.id:
         print(f'\n🚀 开始直接下载小说ID: {args.id}')
-        result = downloader.download_novel(args.id)
+        profiler = RunProfiler(profile_prefix, threads=args.profile_threads) if profile_prefix else contextlib.nullcontext()
+        with profiler:
+            result = downloader.download_novel(args.id)
         if result:
             print('✅ 下载完成')
         else:
@@ -1,9 +1,9 @@
 from gevent import monkey
 monkey.patch_all()
 
-from flask import Flask, render_template, jsonify, send_file, request
+from flask import Flask, Response, render_template, jsonify, send_file, request
 from flask_socketio import SocketIO, emit
-from main import NovelDownloader, Config, SaveMode
+from main import NovelDownloader, Config, SaveMode, DownloadJob, DownloadJournal, ChapterStore, StrippedText, METRICS
 import os
 import threading
 import queue
@@ -17,7 +17,6 @@ import sys
 import re
 from functools import wraps
 import shutil
-import concurrent.futures
 from tqdm import tqdm
 import traceback
 from functools import lru_cache
@@ -82,19 +81,13 @@ os.makedirs(downloads_dir, exist_ok=True)
 # Create a global downloader instance with proper save path
 config = Config()
 config.save_path = DOWNLOADS_DIR  # 修改为 DOWNLOADS_DIR
+config.bookstore_dir = BOOKSTORE_DIR  # 书库目录(catalog.db)和Web下载的JSON放在同一目录
 
 # 修改下载器初始化部分
 class NovelDownloaderWrapper(NovelDownloader):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.book_json_path = None  # 添加这个属性
-        self.zj = {}  # 确保这个属性被初始化
-        self.cs = 0   # 确保这个属性被初始化
-        self.tcs = 0  # 确保这个属性被初始化
-        
     def download_novel(self, novel_id: int) -> str:
         try:
-            name, chapters, status = self._get_chapter_list(novel_id)
+            name, chapters, status = self._get_chapter_list(novel_id, refresh=True)
             if name == 'err':
                 return 'err'
 
@@ -102,49 +95,50 @@ class NovelDownloaderWrapper(NovelDownloader):
             json_path = os.path.join(BOOKSTORE_DIR, f'{novel_id}_{safe_name}.json')
             txt_path = os.path.join(DOWNLOADS_DIR, f'{safe_name}.txt')
             
-            logger.info(f"Will save JSON to: {json_path}")
+            if self._json_export_enabled():
+                logger.info(f"Will save JSON to: {json_path}")
             logger.info(f"Will save TXT to: {txt_path}")
 
             # 确保目录存在
             os.makedirs(os.path.dirname(json_path), exist_ok=True)
             os.makedirs(os.path.dirname(txt_path), exist_ok=True)
 
+            # 每次下载使用独立的状态，队列线程和HTTP请求可以同时下载不同的书
+            job = DownloadJob(novel_id=str(novel_id))
+            # 章节逐个追加到章节存储，JSON（export_json开启时）只在下载结束时写一次
+            store = open_chapter_store(self, novel_id, safe_name)
+
             # 下载章节内容
             chapter_list = sorted(chapters.items(), key=lambda x: int(re.search(r'\d+', x[0]).group() if re.search(r'\d+', x[0]) else '0'))
             total_chapters = len(chapter_list)
             completed_chapters = 0
             novel_content = {}
+            chapter_index = {chapter_id: i for i, (_, chapter_id) in enumerate(chapter_list)}
+            results = [None] * total_chapters
+            # 上次中断前已完成的章节直接复用
+            journal, pending = resume_from_journal(self, novel_id, name, chapter_list, novel_content, results, store)
 
-            with tqdm(total=total_chapters, desc='下载进度') as pbar:
-                with concurrent.futures.ThreadPoolExecutor(max_workers=self.config.xc) as executor:
-                    future_to_chapter = {
-                        executor.submit(
-                            self._download_chapter,
-                            title,
-                            chapter_id,
-                            {}
-                        ): (title, chapter_id, i) for i, (title, chapter_id) in enumerate(chapter_list)
-                    }
+            with tqdm(total=len(pending), desc='下载进度') as pbar:
+                for future, (title, chapter_id) in self._iter_chapter_futures(pending, job):
+                    index = chapter_index[chapter_id]
+                    try:
+                        content = future.result()
+                        if content:
+                            results[index] = (title, content)
+                            novel_content[title.strip()] = content
+                            save_chapter(store, journal, chapter_id, title.strip(), content, index)
+                    except Exception as e:
+                        self.log_callback(f'下载章节失败 {title}: {str(e)}')
+                        self._report_chapter_failure(title, chapter_id, e)
 
-                    results = [None] * total_chapters
-                    for future in concurrent.futures.as_completed(future_to_chapter):
-                        title, _, index = future_to_chapter[future]
-                        try:
-                            content = future.result()
-                            if content:
-                                results[index] = (title, content)
-                                novel_content[title.strip()] = content
-                        except Exception as e:
-                            self.log_callback(f'下载章节失败 {title}: {str(e)}')
-
-                        completed_chapters += 1
-                        pbar.update(1)
-                        self.progress_callback(
-                            completed_chapters,
-                            total_chapters,
-                            '下载进度',
-                            title
-                        )
+                    completed_chapters += 1
+                    pbar.update(1)
+                    self.progress_callback(
+                        completed_chapters,
+                        len(pending),
+                        '下载进度',
+                        title
+                    )
 
             # 在保存文件之前添加验证步骤
             logger.info("开始验证下载内容完整性")
@@ -167,23 +161,31 @@ class NovelDownloaderWrapper(NovelDownloader):
                             f.write(f"\n{title}\n\n{content}\n")
                 logger.info(f"Successfully saved TXT file to: {txt_path}")
 
-            # 保存JSON文件
+            # 保存JSON文件（章节存储是正本，明文JSON只在export_json开启时导出）
             try:
-                novel_data = {
-                    '_meta': {
-                        'novel_id': novel_id,
-                        'name': name,
-                        'download_time': time.strftime('%Y-%m-%d %H:%M:%S'),
-                        'total_chapters': len(chapters),
-                        'completed_chapters': len([c for c in verified_content.values() if c]),
-                        'failed_chapters': verified_content.get('_failed_chapters', [])
-                    },
-                    'chapters': verified_content
-                }
-                
-                with open(json_path, 'w', encoding='UTF-8') as f:
-                    json.dump(novel_data, f, ensure_ascii=False, indent=4)
-                logger.info(f"Successfully saved JSON file to: {json_path}")
+                output_paths = {'txt': txt_path}
+                if self._json_export_enabled():
+                    novel_data = {
+                        '_meta': {
+                            'novel_id': novel_id,
+                            'name': name,
+                            'download_time': time.strftime('%Y-%m-%d %H:%M:%S'),
+                            'total_chapters': len(chapters),
+                            'completed_chapters': len([c for c in verified_content.values() if c]),
+                            'failed_chapters': verified_content.get('_failed_chapters', [])
+                        },
+                        'chapters': verified_content
+                    }
+
+                    with open(json_path, 'w', encoding='UTF-8') as f:
+                        json.dump(novel_data, f, ensure_ascii=False, indent=4)
+                    logger.info(f"Successfully saved JSON file to: {json_path}")
+                    output_paths['json'] = json_path
+                journal.finish()
+                if store.needs_compaction():
+                    store.compact()
+                record_in_catalog(self, novel_id, name, status[0] if status else None, verified_content,
+                                  output_paths)
                 
                 return 's'
             except Exception as e:
@@ -195,15 +197,17 @@ class NovelDownloaderWrapper(NovelDownloader):
             return 'err'
 
     def get_novel_content(self, novel_id: str) -> dict:
-        """Get novel content from memory or file"""
+        """Get novel content from the chapter store (旧版本下载的书从JSON读取)"""
         try:
             name, chapters, _ = self._get_chapter_list(novel_id)
             if name == 'err':
                 return None
                 
             safe_name = _sanitize_filename(name)
+            store = open_chapter_store(self, novel_id, safe_name)
+            if len(store):
+                return store.chapters()
             json_path = os.path.join(BOOKSTORE_DIR, f'{novel_id}_{safe_name}.json')
-            
             if os.path.exists(json_path):
                 with open(json_path, 'r', encoding='UTF-8') as f:
                     data = json.load(f)
@@ -279,6 +283,19 @@ class DownloadQueue:
 # 创建全局下载队列实例
 download_queue = DownloadQueue()
 
+# 服务上次退出时未完成的下载重新排队，下载时从恢复日志继续
+for pending_id in DownloadJournal.pending(downloader.journal_dir):
+    logger.info(f"♻️ 恢复未完成的下载: {pending_id}")
+    download_queue.add(pending_id)
+
+# 队列和调度状态，随/metrics导出
+METRICS.gauge('fanqie_download_queue_depth', 'Novels waiting in the download queue').set_function(
+    lambda: len(download_queue.queue))
+METRICS.gauge('fanqie_concurrency_window', 'Current chapter concurrency window').set_function(
+    lambda: downloader.concurrency.limit())
+METRICS.gauge('fanqie_rate_limit_multiplier', 'Current request delay multiplier').set_function(
+    lambda: downloader.rate_limiter.multiplier)
+
 # 创建一个定时器来清理完成的下载记录
 def clear_completed_downloads():
     while True:
@@ -334,38 +351,16 @@ def index():
 
 @app.route('/api/novels')
 def list_novels():
-    """List downloaded novels with their status"""
+    """List downloaded novels with their status (来自书库目录，不再读取每本书的JSON)"""
     try:
-        novels = []
-        if os.path.exists(BOOKSTORE_DIR):
-            for file in os.listdir(BOOKSTORE_DIR):
-                if file.endswith('.json'):
-                    try:
-                        file_path = os.path.join(BOOKSTORE_DIR, file)
-                        last_modified = os.path.getmtime(file_path)
-                        last_modified_str = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(last_modified))
-                        
-                        # 从文件名中提取小说ID和名称
-                        parts = file.split('_', 1)  # 分割一次，获取ID和名称
-                        novel_id = parts[0]
-                        novel_name = os.path.splitext(parts[1])[0] if len(parts) > 1 else os.path.splitext(file)[0]
-                        
-                        # 读取JSON文件获取章节数量
-                        with open(file_path, 'r', encoding='UTF-8') as f:
-                            data = json.load(f)
-                            chapter_count = len(data.get('chapters', {}))
-                            meta = data.get('_meta', {})
-                            
-                        novels.append({
-                            'name': novel_name,
-                            'status': f'已下载 {chapter_count} 章',
-                            'last_updated': last_modified_str,
-                            'novel_id': novel_id
-                        })
-                    except Exception as e:
-                        logger.error(f"Error processing file {file}: {str(e)}")
-                        continue
-        
+        novels = [{
+            'name': novel['name'],
+            'status': f"已下载 {novel['chapter_count']} 章",
+            'last_updated': novel['last_updated'],
+            'novel_id': novel['novel_id'],
+            'chapter_count': novel['chapter_count'],
+            'bytes': novel['bytes'],
+        } for novel in downloader.get_downloaded_novels()]
         return jsonify(novels)
     except Exception as e:
         logger.error(f"Error listing novels: {str(e)}")
@@ -411,8 +406,8 @@ def download_novel(novel_id):
     max_retries = 3  # 添加最大重试次数
     
     try:
-        # 获取小说信息
-        name, chapters, _ = downloader._get_chapter_list(novel_id)
+        # 获取小说信息（重新请求详情页，拿到最新目录）
+        name, chapters, _ = downloader._get_chapter_list(novel_id, refresh=True)
         if name == 'err':
             return jsonify({'error': 'Novel not found'}), 404
             
@@ -420,8 +415,9 @@ def download_novel(novel_id):
         safe_name = _sanitize_filename(name)
         json_path = os.path.join(BOOKSTORE_DIR, f'{novel_id}_{safe_name}.json')
         
-        # 设置下载器的 book_json_path
-        downloader.book_json_path = json_path  # 添加这一行
+        # 本次下载的独立状态；章节逐个追加到章节存储，JSON（export_json开启时）只在下载结束时写一次
+        job = DownloadJob(novel_id=str(novel_id))
+        store = open_chapter_store(downloader, novel_id, safe_name)
         
         # 根据保存模式设置不同的输出路径
         if config.save_mode == SaveMode.SINGLE_TXT:
@@ -432,7 +428,8 @@ def download_novel(novel_id):
         elif config.save_mode == SaveMode.EPUB:
             output_path = os.path.join(DOWNLOADS_DIR, f'{safe_name}.epub')
         
-        logger.info(f"Will save JSON to: {json_path}")
+        if downloader._json_export_enabled():
+            logger.info(f"Will save JSON to: {json_path}")
         if config.save_mode == SaveMode.EPUB:
             logger.info(f"Will save EPUB to: {output_path}")
         
@@ -446,44 +443,44 @@ def download_novel(novel_id):
         completed_chapters = 0
         novel_content = {}
         failed_chapters = []  # 记录下载失败的章节
+        # 结果按完整目录排列，重试轮次只补充失败的章节
+        chapter_index = {chapter_id: i for i, (_, chapter_id) in enumerate(chapter_list)}
+        results = [None] * total_chapters
+        # 上次中断前已完成的章节直接复用
+        journal, chapter_list = resume_from_journal(downloader, novel_id, name, chapter_list, novel_content, results,
+                                                    store)
+        total_chapters = len(chapter_list)
         
         # 下载所有章节，失败的章节会重试
         retry_count = 0
         while True:
             with tqdm(total=total_chapters, desc='下载进度') as pbar:
-                with concurrent.futures.ThreadPoolExecutor(max_workers=config.xc) as executor:
-                    future_to_chapter = {
-                        executor.submit(
-                            downloader._download_chapter,
-                            title,
-                            chapter_id,
-                            {}
-                        ): (title, chapter_id, i) for i, (title, chapter_id) in enumerate(chapter_list)
-                        if title not in novel_content  # 只下载未成功的章节
-                    }
+                pending = [(title, chapter_id) for title, chapter_id in chapter_list
+                           if title not in novel_content]  # 只下载未成功的章节
 
-                    results = [None] * total_chapters
-                    for future in concurrent.futures.as_completed(future_to_chapter):
-                        title, chapter_id, index = future_to_chapter[future]
-                        try:
-                            content = future.result()
-                            if content:
-                                results[index] = (title, content)
-                                novel_content[title.strip()] = content
-                            else:
-                                failed_chapters.append((title, chapter_id))
-                        except Exception as e:
-                            logger.error(f'下载章节失败 {title}: {str(e)}')
+                for future, (title, chapter_id) in downloader._iter_chapter_futures(pending, job):
+                    index = chapter_index[chapter_id]
+                    try:
+                        content = future.result()
+                        if content:
+                            results[index] = (title, content)
+                            novel_content[title.strip()] = content
+                            save_chapter(store, journal, chapter_id, title.strip(), content, index)
+                        else:
                             failed_chapters.append((title, chapter_id))
+                    except Exception as e:
+                        logger.error(f'下载章节失败 {title}: {str(e)}')
+                        downloader._report_chapter_failure(title, chapter_id, e)
+                        failed_chapters.append((title, chapter_id))
 
-                        completed_chapters += 1
-                        pbar.update(1)
-                        socketio.emit('progress', {
-                            'current': completed_chapters,
-                            'total': total_chapters,
-                            'percentage': round((completed_chapters / total_chapters * 100), 2),
-                            'chapter': title
-                        })
+                    completed_chapters += 1
+                    pbar.update(1)
+                    socketio.emit('progress', {
+                        'current': completed_chapters,
+                        'total': total_chapters,
+                        'percentage': round((completed_chapters / total_chapters * 100), 2),
+                        'chapter': title
+                    })
 
             # 如果没有失败的章节，退出循环
             if not failed_chapters:
@@ -577,22 +574,36 @@ def download_novel(novel_id):
             epub.write_epub(output_path, book, {})
             logger.info(f"Successfully saved EPUB file to: {output_path}")
 
-        # 保存JSON文件
+        # 保存JSON文件（章节存储是正本，明文JSON只在export_json开启时导出）
         try:
-            novel_data = {
-                '_meta': {
-                    'novel_id': novel_id,
-                    'name': name,
-                    'download_time': time.strftime('%Y-%m-%d %H:%M:%S'),
-                    'total_chapters': total_chapters,
-                    'completed_chapters': len([r for r in results if r is not None])
-                },
-                'chapters': novel_content
-            }
-            
-            with open(json_path, 'w', encoding='UTF-8') as f:
-                json.dump(novel_data, f, ensure_ascii=False, indent=4)
-            logger.info(f"Successfully saved JSON file to: {json_path}")
+            output_paths = {}
+            if downloader._json_export_enabled():
+                novel_data = {
+                    '_meta': {
+                        'novel_id': novel_id,
+                        'name': name,
+                        'download_time': time.strftime('%Y-%m-%d %H:%M:%S'),
+                        'total_chapters': len(chapter_index),
+                        'completed_chapters': len([r for r in results if r is not None])
+                    },
+                    'chapters': novel_content
+                }
+
+                with open(json_path, 'w', encoding='UTF-8') as f:
+                    json.dump(novel_data, f, ensure_ascii=False, indent=4)
+                logger.info(f"Successfully saved JSON file to: {json_path}")
+                output_paths['json'] = json_path
+            journal.finish()
+            if store.needs_compaction():
+                store.compact()
+
+            if config.save_mode == SaveMode.SINGLE_TXT:
+                output_paths['txt'] = output_path
+            elif config.save_mode == SaveMode.SPLIT_TXT:
+                output_paths['txt'] = output_dir
+            elif config.save_mode == SaveMode.EPUB:
+                output_paths['epub'] = output_path
+            record_in_catalog(downloader, novel_id, name, None, novel_content, output_paths)
             
             return jsonify({'status': 'success'})
         except Exception as e:
@@ -715,7 +726,14 @@ def update_all():
 
 @app.route('/api/queue/status')
 def get_queue_status():
-    return jsonify(download_queue.get_status())
+    status = download_queue.get_status()
+    status['concurrency'] = downloader.concurrency.snapshot()
+    return jsonify(status)
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus文本格式的下载指标"""
+    return Response(METRICS.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 @app.route('/api/queue/add/<novel_id>', methods=['POST'])
 def add_to_queue(novel_id):
@@ -780,14 +798,15 @@ def read_chapter(novel_id, chapter_title):
             
         # 处理文件名，确保一致性
         safe_name = _sanitize_filename(name)
-        json_path = os.path.join(BOOKSTORE_DIR, f'{novel_id}_{safe_name}.json')  # 使用带ID的文件名
-        logger.info(f"Looking for JSON file at: {json_path}")
+        store = open_chapter_store(downloader, novel_id, safe_name)
+        json_path = os.path.join(BOOKSTORE_DIR, f'{novel_id}_{safe_name}.json')  # 旧版本下载的书只有JSON
+        logger.info(f"Reading from chapter store: {store.directory}")
         
-        # 如果文件不存在，等待下载完成
-        if not os.path.exists(json_path):
+        # 书还没下载时，等待下载完成
+        if not len(store) and not os.path.exists(json_path):
             # 检查是否已经在下载
             if novel_id not in download_queue.downloading_ids and novel_id not in download_queue.queue:
-                logger.info(f"Novel file not found, adding to download queue: {novel_id}")
+                logger.info(f"Novel not downloaded, adding to download queue: {novel_id}")
                 download_queue.add(novel_id)
                 socketio.emit('queue_update', download_queue.get_status())
             
@@ -795,32 +814,28 @@ def read_chapter(novel_id, chapter_title):
             while novel_id in download_queue.downloading_ids or novel_id in download_queue.queue:
                 time.sleep(0.5)
             
-            # 再次检查文件是否存在
-            if not os.path.exists(json_path):
-                logger.error(f"JSON file still not found after download: {json_path}")
+            # 重新打开章节存储，读取下载写入的索引
+            store = open_chapter_store(downloader, novel_id, safe_name)
+            if not len(store) and not os.path.exists(json_path):
+                logger.error(f"Chapter store still empty after download: {store.directory}")
                 return jsonify({'error': 'Failed to create novel file'}), 500
         
-        # 读取JSON文件
+        # 按章节ID从章节存储读取（压缩的章节在这里解压）
         try:
-            with open(json_path, 'r', encoding='UTF-8') as f:
-                novel_data = json.load(f)
-                # 从 novel_data 中获取章节内容
-                chapters_data = novel_data.get('chapters', {})
-                chapter_content = chapters_data.get(chapter_title)
-                
-                if chapter_content is None:
-                    logger.error(f"Chapter not found: {chapter_title}")
-                    return jsonify({'error': 'Chapter not found'}), 404
-                    
-                return jsonify({
-                    'title': chapter_title,
-                    'content': chapter_content
-                })
-                
+            chapter_content = read_stored_chapter(store, json_path, chapters.get(chapter_title), chapter_title)
         except Exception as e:
-            logger.error(f"Error reading JSON file: {str(e)}")
+            logger.error(f"Error reading chapter store: {str(e)}")
             return jsonify({'error': 'Failed to read novel data'}), 500
 
+        if chapter_content is None:
+            logger.error(f"Chapter not found: {chapter_title}")
+            return jsonify({'error': 'Chapter not found'}), 404
+
+        return jsonify({
+            'title': chapter_title,
+            'content': chapter_content
+        })
+
     except Exception as e:
         logger.error(f"Error reading chapter: {str(e)}")
         logger.exception("Full traceback:")
@@ -905,6 +920,14 @@ def get_chapters(novel_id):
         for chapter in chapter_list:
             del chapter['original_index']
             del chapter['chapter_num']
+
+        # 已下载的书按章节存储中保存的顺序列出，目录中还没下载的章节排在后面
+        stored = open_chapter_store(downloader, novel_id, _sanitize_filename(name)).entries()
+        if stored:
+            stored_ids = {chapter_id for chapter_id, _ in stored}
+            chapter_list = ([{'title': title, 'id': chapter_id, 'downloaded': True} for chapter_id, title in stored]
+                            + [dict(chapter, downloaded=False) for chapter in chapter_list
+                               if str(chapter['id']) not in stored_ids])
         
         return jsonify({
             'name': name,
@@ -934,17 +957,61 @@ def get_chapter_content(novel_id, chapter_title):
             return None
             
         safe_name = _sanitize_filename(name)
-        json_path = os.path.join(BOOKSTORE_DIR, f'{safe_name}.json')
-        
-        if os.path.exists(json_path):
-            with open(json_path, 'r', encoding='UTF-8') as f:
-                novel_data = json.load(f)
-                return novel_data.get(chapter_title)
-        return None
+        store = open_chapter_store(downloader, novel_id, safe_name)
+        json_path = os.path.join(BOOKSTORE_DIR, f'{novel_id}_{safe_name}.json')
+        return read_stored_chapter(store, json_path, chapters.get(chapter_title), chapter_title)
     except Exception as e:
         logger.error(f"Error getting chapter content: {str(e)}")
         return None
 
+def record_in_catalog(novel_downloader, novel_id, name, status, novel_content, paths):
+    """下载完成后更新书库目录（失败不影响下载结果）"""
+    try:
+        chapters = {title: content for title, content in novel_content.items() if not title.startswith('_')}
+        novel_downloader.catalog.record(novel_id, name, status, len(chapters), paths,
+                                        failed_count=sum(1 for content in chapters.values() if not content))
+    except Exception as e:
+        logger.error(f"Error updating catalog: {str(e)}")
+
+def open_chapter_store(novel_downloader, novel_id, safe_name):
+    """Web下载的章节存储：书库中的 ID_书名/ 目录，与 ID_书名.json 并列"""
+    return ChapterStore(os.path.join(BOOKSTORE_DIR, f'{novel_id}_{safe_name}'), novel_downloader.chapter_codec)
+
+def read_stored_chapter(store, json_path, chapter_id, title):
+    """从章节存储读取一章（不在当前目录中的章节按标题查找）；旧版本下载、没有章节存储的书从JSON读取"""
+    if chapter_id is None:
+        chapter_id = next((stored_id for stored_id, stored_title in store.entries() if stored_title == title), None)
+    if chapter_id is not None:
+        content = store.get(chapter_id)
+        if content is not None:
+            return content
+    if os.path.exists(json_path):
+        with open(json_path, 'r', encoding='UTF-8') as f:
+            return json.load(f).get('chapters', {}).get(title)
+    return None
+
+def save_chapter(store, journal, chapter_id, title, content, position):
+    """追加保存一个下载成功的章节，并在恢复日志中记录它在章节存储中的位置"""
+    offset, length = store.put(chapter_id, title, content, position)
+    journal.record_chapter(chapter_id, title, offset=offset, length=length)
+
+def resume_from_journal(novel_downloader, novel_id, name, chapter_list, novel_content, results, store):
+    """打开恢复日志，已完成的章节填入novel_content和results，返回 (日志, 仍需下载的章节)"""
+    journal = DownloadJournal(novel_downloader.journal_dir, novel_id)
+    completed = journal.completed_content(store)
+    if completed:
+        logger.info(f"♻️ 小说 {novel_id} 从恢复日志继续：已完成 {len(completed)}/{len(chapter_list)} 章")
+    pending = []
+    for index, (title, chapter_id) in enumerate(chapter_list):
+        if str(chapter_id) in completed:
+            content = completed[str(chapter_id)][1]
+            results[index] = (title, content)
+            novel_content[title.strip()] = content
+        else:
+            pending.append((title, chapter_id))
+    journal.start(name, chapter_list)
+    return journal, pending
+
 def save_progress(novel_id, name, novel_content):
     """保存下载进度到JSON文件"""
     try:
@@ -1020,11 +1087,16 @@ def verify_and_fix_chapters(novel_id: str, name: str, chapters: dict, novel_cont
     failed_chapters = []
     
     # 检查每个章节
+    fallback_count = 0
     for title, chapter_id in chapters.items():
         content = novel_content.get(title)
         if not content or not check_chapter_content(content):
             logger.warning(f"发现问题章节: {title}")
             failed_chapters.append((title, chapter_id))
+        elif isinstance(content, StrippedText):
+            fallback_count += 1
+    if fallback_count:
+        logger.warning(f"{fallback_count} 个章节的正文来自后备HTML处理，排版可能不完整")
             
     # 如果有问题章节，尝试重新下载
     if failed_chapters:
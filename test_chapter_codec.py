@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+章节压缩测试 - 验证ChapterCodec的zstd字典压缩往返和缺少字典时的报错
+"""
+
+import sys
+import os
+import random
+import tempfile
+sys.path.append('src')
+
+from importlib import import_module
+main_module = import_module('main')
+ChapterStore = main_module.ChapterStore
+ChapterCodec = main_module.ChapterCodec
+
+WORDS = ['他深吸一口气', '只见', '就在这时', '一道身影', '缓缓走来', '林凡', '冷笑一声', '道：“', '你找死！”',
+         '众人', '顿时', '脸色大变', '，', '。', '灵气', '宗门', '长老', '修为', '突破', '境界']
+
+
+def make_chapter(seed: int, length: int = 800) -> str:
+    rng = random.Random(seed)
+    return ''.join(rng.choice(WORDS) for _ in range(length))
+
+
+def test_zlib_round_trip():
+    """zlib压缩的章节按目录位置列出，正文解压后一致"""
+    print("🔍 测试zlib压缩...")
+    with tempfile.TemporaryDirectory() as directory:
+        store = ChapterStore(directory, ChapterCodec('zlib'))
+        for i in range(5):
+            store.put(i, f'第{i + 1}章', make_chapter(i), i)
+        raw_size = sum(len(make_chapter(i).encode('utf-8')) for i in range(5))
+        assert store.log_bytes < raw_size
+
+        reopened = ChapterStore(directory)
+        assert reopened.entries() == [(str(i), f'第{i + 1}章') for i in range(5)]
+        assert all(reopened.get(i) == make_chapter(i) for i in range(5))
+    print(f"✅ zlib压缩往返一致 ({store.log_bytes}/{raw_size} 字节)")
+
+
+def test_zstd_dictionary_round_trip():
+    """zstd字典训练后写入的章节可以用磁盘上的字典重新读取"""
+    print("🔍 测试zstd字典压缩...")
+    if main_module.zstandard is None:
+        print("⚠️ 未安装zstandard，跳过")
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        dictionary_dir = os.path.join(directory, 'dictionaries')
+        codec = ChapterCodec('zstd', dictionary_dir=dictionary_dir, auto_train=False)
+        assert codec.train([make_chapter(i).encode('utf-8') for i in range(200)]) is not None
+        encoding, dict_id = codec.target
+        assert encoding == 'zstd' and dict_id
+
+        store = ChapterStore(os.path.join(directory, 'book'), codec)
+        for i in range(10):
+            store.put(i, f'第{i + 1}章', make_chapter(1000 + i), i)
+        raw_size = sum(len(make_chapter(1000 + i).encode('utf-8')) for i in range(10))
+        assert store.log_bytes < raw_size
+
+        # 新的codec从字典目录加载字典，写入配置改为raw也能读取
+        reopened = ChapterStore(os.path.join(directory, 'book'), ChapterCodec('raw', dictionary_dir=dictionary_dir))
+        assert all(reopened.get(i) == make_chapter(1000 + i) for i in range(10))
+
+        # 字典丢失时报告缺少的字典
+        missing = ChapterStore(os.path.join(directory, 'book'), ChapterCodec('raw'))
+        try:
+            missing.get(0)
+        except RuntimeError as e:
+            assert f'zstd-{dict_id}.dict' in str(e)
+        else:
+            raise AssertionError('缺少字典时应当报错')
+    print(f"✅ 字典压缩往返一致 ({store.log_bytes}/{raw_size} 字节)")
+
+
+if __name__ == "__main__":
+    test_zlib_round_trip()
+    test_zstd_dictionary_round_trip()
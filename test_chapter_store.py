@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+章节存储测试 - 验证ChapterStore的断尾截断、索引重建和日志整理
+"""
+
+import sys
+import os
+import random
+import tempfile
+sys.path.append('src')
+
+from importlib import import_module
+main_module = import_module('main')
+ChapterStore = main_module.ChapterStore
+
+WORDS = ['他深吸一口气', '只见', '就在这时', '一道身影', '缓缓走来', '林凡', '冷笑一声', '道：“', '你找死！”',
+         '众人', '顿时', '脸色大变', '，', '。', '灵气', '宗门', '长老', '修为', '突破', '境界']
+
+
+def make_chapter(seed: int, length: int = 800) -> str:
+    rng = random.Random(seed)
+    return ''.join(rng.choice(WORDS) for _ in range(length))
+
+
+def test_torn_tail_truncation():
+    """日志末尾写了一半的记录在打开时被截掉，之前的章节完好"""
+    print("🔍 测试日志末尾的半条记录...")
+    with tempfile.TemporaryDirectory() as directory:
+        store = ChapterStore(directory)
+        for i in range(3):
+            store.put(i, f'第{i + 1}章', make_chapter(i), i)
+        size = store.log_bytes
+        with open(store.log_path, 'ab') as f:
+            f.write(b'{"id": "9", "pos": 9, "title": "t", "enc": "raw", "size": 50}\nabc')
+
+        reopened = ChapterStore(directory)
+        assert len(reopened) == 3
+        assert os.path.getsize(reopened.log_path) == size == reopened.log_bytes
+        assert all(reopened.get(i) == make_chapter(i) for i in range(3))
+        assert reopened.get(9) is None
+
+        # 截断后追加的章节接在完整记录之后
+        reopened.put(3, '第4章', make_chapter(3), 3)
+        assert ChapterStore(directory).get(3) == make_chapter(3)
+    print("✅ 半条记录被截掉，其余章节完好")
+
+
+def test_missing_index_rebuild():
+    """索引丢失或落后于日志时扫描日志补齐"""
+    print("🔍 测试索引重建...")
+    with tempfile.TemporaryDirectory() as directory:
+        store = ChapterStore(directory)
+        for i in range(5):
+            store.put(i, f'第{i + 1}章', make_chapter(i), i)
+        os.remove(store.index_path)
+
+        rebuilt = ChapterStore(directory)
+        assert len(rebuilt) == 5
+        assert os.path.exists(rebuilt.index_path)
+        assert list(rebuilt.chapters()) == [f'第{i + 1}章' for i in range(5)]
+
+        # 索引只写到一半：缺少的章节从日志补齐
+        with open(rebuilt.index_path, 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+        with open(rebuilt.index_path, 'w', encoding='utf-8') as f:
+            f.writelines(lines[:2])
+            f.write(lines[2][:10])
+        assert all(ChapterStore(directory).get(i) == make_chapter(i) for i in range(5))
+    print("✅ 索引重建正确")
+
+
+def test_compaction():
+    """重复保存的章节在整理后只保留最新记录，按目录位置排列"""
+    print("🔍 测试日志整理...")
+    with tempfile.TemporaryDirectory() as directory:
+        store = ChapterStore(directory)
+        for i in reversed(range(4)):
+            store.put(i, f'第{i + 1}章', make_chapter(i), i)
+        for _ in range(3):
+            store.put(1, '第2章', make_chapter(100), 1)
+        assert store.log_bytes > store.live_bytes
+
+        reclaimed = store.compact()
+        assert reclaimed > 0
+        assert store.log_bytes == store.live_bytes == os.path.getsize(store.log_path)
+        assert not os.path.exists(f'{store.log_path}.tmp')
+
+        reopened = ChapterStore(directory)
+        assert list(reopened.chapters()) == [f'第{i + 1}章' for i in range(4)]
+        assert reopened.get(1) == make_chapter(100)
+        assert reopened.get(3) == make_chapter(3)
+    print(f"✅ 整理回收 {reclaimed} 字节")
+
+
+if __name__ == "__main__":
+    test_torn_tail_truncation()
+    test_missing_index_rebuild()
+    test_compaction()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+恢复日志测试 - 验证DownloadJournal忽略写了一半的行，并按记录的偏移读回已完成的章节
+"""
+
+import sys
+import os
+import json
+import random
+import tempfile
+sys.path.append('src')
+
+from importlib import import_module
+main_module = import_module('main')
+ChapterStore = main_module.ChapterStore
+DownloadJournal = main_module.DownloadJournal
+
+WORDS = ['他深吸一口气', '只见', '就在这时', '一道身影', '缓缓走来', '林凡', '冷笑一声', '道：“', '你找死！”',
+         '众人', '顿时', '脸色大变', '，', '。', '灵气', '宗门', '长老', '修为', '突破', '境界']
+
+
+def make_chapter(seed: int, length: int = 800) -> str:
+    rng = random.Random(seed)
+    return ''.join(rng.choice(WORDS) for _ in range(length))
+
+
+def test_journal_torn_line():
+    """恢复日志末尾写了一半的一行被忽略，已完成的章节按记录的偏移读回"""
+    print("🔍 测试恢复日志...")
+    with tempfile.TemporaryDirectory() as directory:
+        store = ChapterStore(os.path.join(directory, 'book'))
+        journal = DownloadJournal(os.path.join(directory, 'journals'), 1)
+        toc = [(f'第{i + 1}章', str(100 + i)) for i in range(5)]
+        journal.start('测试书', toc)
+        for i in range(3):
+            offset, length = store.put(100 + i, toc[i][0], make_chapter(i), i)
+            journal.record_chapter(100 + i, toc[i][0], offset=offset, length=length)
+        with open(journal.path, 'ab') as f:
+            f.write(json.dumps({'type': 'chapter', 'id': '103', 'title': '第4章'}).encode('utf-8')[:20])
+
+        reopened = DownloadJournal(os.path.join(directory, 'journals'), 1)
+        assert reopened.name == '测试书'
+        assert reopened.toc == toc
+        assert sorted(reopened.completed) == ['100', '101', '102']
+        completed = reopened.completed_content(store)
+        assert completed['101'] == ('第2章', make_chapter(1))
+        assert DownloadJournal.pending(os.path.join(directory, 'journals')) == ['1']
+
+        # 恢复后追加的记录不会接在半行后面
+        reopened.start('测试书', toc)
+        offset, length = store.put(103, toc[3][0], make_chapter(3), 3)
+        reopened.record_chapter(103, toc[3][0], offset=offset, length=length)
+        reopened = DownloadJournal(os.path.join(directory, 'journals'), 1)
+        assert sorted(reopened.completed) == ['100', '101', '102', '103']
+        assert reopened.completed_content(store)['103'] == ('第4章', make_chapter(3))
+
+        reopened.finish()
+        assert not reopened.exists()
+        assert DownloadJournal.pending(os.path.join(directory, 'journals')) == []
+    print("✅ 恢复日志忽略半行并读回已完成章节")
+
+
+if __name__ == "__main__":
+    test_journal_torn_line()
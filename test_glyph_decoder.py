@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+字体解码测试 - 验证GlyphDecoder与逐字符解码结果一致，以及模式检测
+"""
+
+import sys
+import json
+import random
+sys.path.append('src')
+
+from importlib import import_module
+main_module = import_module('main')
+benchmark = import_module('benchmark')
+
+CODE = [list(code_range) for code_range in main_module.CHARSET_CODE_RANGES]
+
+
+def load_charset():
+    with open('src/charset.json', 'r', encoding='UTF-8') as f:
+        return json.load(f)
+
+
+def make_content(seed: int, length: int = 2000) -> str:
+    """混合两种模式区间内外的码位、区间边界、普通汉字和BMP以外的字符"""
+    rng = random.Random(seed)
+    low, high = min(start for start, _ in CODE), max(end for _, end in CODE)
+    pool = ['a', '，', '\n', '字', '😀', '\U00020000', chr(low - 1), chr(high + 1), chr(0xFFFF)]
+    chars = []
+    for _ in range(length):
+        roll = rng.random()
+        if roll < 0.6:
+            chars.append(chr(rng.randint(low, high)))
+        else:
+            chars.append(rng.choice(pool))
+    return ''.join(chars)
+
+
+def test_decode_matches_legacy():
+    """两种模式下的解码结果与逐字符实现一致"""
+    print("🔍 测试解码与逐字符实现一致...")
+    charset = load_charset()
+    decoder = main_module.GlyphDecoder(charset, CODE)
+    contents = [make_content(seed) for seed in range(5)]
+    contents.append(''.join(chr(point) for point in range(CODE[0][0] - 2, CODE[1][1] + 3)))
+    for content in contents:
+        for mode in (0, 1):
+            assert decoder.decode(content, mode) == benchmark.legacy_decode(charset, CODE, content, mode), \
+                f'模式{mode}的解码结果不一致'
+    print("✅ 两种模式的解码结果一致")
+
+
+def test_detect_mode():
+    """检测结果为解码后未映射字符较少的模式，持平时为模式0"""
+    print("🔍 测试模式检测...")
+    charset = load_charset()
+    decoder = main_module.GlyphDecoder(charset, CODE)
+
+    def unmapped(content, mode):
+        decoded = benchmark.legacy_decode(charset, CODE, content, mode)
+        return sum(1 for char in decoded if any(start <= ord(char) <= end for start, end in CODE))
+
+    for seed in range(20):
+        content = make_content(seed, length=200)
+        expected = 1 if unmapped(content, 1) < unmapped(content, 0) else 0
+        assert decoder.detect_mode(content) == expected, f'种子{seed}的模式检测结果不符'
+
+    # 区间末尾码位58716只在模式1的区间内，但模式1的映射表没有这一项
+    assert decoder.detect_mode(chr(58716)) == 0
+    assert decoder.detect_mode('普通文本') == 0
+    mode1_only = [chr(CODE[1][0] + bias) for bias, glyph in enumerate(charset[1])
+                  if glyph != '?' and decoder.decode(chr(CODE[1][0] + bias), 0) == chr(CODE[1][0] + bias)]
+    if mode1_only:
+        assert decoder.detect_mode(''.join(mode1_only)) == 1
+    print("✅ 模式检测正确")
+
+
+if __name__ == "__main__":
+    test_decode_matches_legacy()
+    test_detect_mode()